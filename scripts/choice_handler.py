@@ -8,9 +8,18 @@ import logging
 import subprocess
 import pydoc
 import os
+import re
+import sys
 
+from itertools import islice
 from colorama import init, Fore
-from format_handler import remove_trailing_whitespace_and_newlines, display_file_parts
+from spill_handler import SpillList
+from format_handler import (
+    remove_trailing_whitespace_and_newlines,
+    display_file_parts,
+    TEXT_ENCODING,
+    TEXT_ERRORS,
+)
 
 # Initialize colorama
 init(autoreset=True)
@@ -20,7 +29,8 @@ logging.basicConfig(
     level=logging.INFO,  # Set the log level
     format="%(asctime)s | %(levelname)s | %(message)s",  # Set the log format
     handlers=[
-        logging.FileHandler("merge_tool.log"),  # Log to a file
+        # Log to a file - escape any bytes that aren't valid UTF-8
+        logging.FileHandler("merge_tool.log", errors="backslashreplace"),
         logging.StreamHandler(),  # Also log to the console
     ],
 )
@@ -28,6 +38,14 @@ logging.basicConfig(
 # Create a logger object
 logger = logging.getLogger(__name__)
 
+# Size of the pipe buffer lines are written to less through
+PAGER_BUFFER_SIZE = 64 * 1024
+# Lines pydoc pages at once - pydoc needs each page as one string
+PYDOC_PAGE_LINES = 2000
+
+# Width of the changed line shown in a bulk review summary
+BULK_REVIEW_SUMMARY_WIDTH = 60
+
 
 def get_user_choice(choices) -> str:
     """Display the choices and get the user's choice."""
@@ -67,29 +85,62 @@ def confirm_choice(original_lines, new_lines) -> str:
     return get_user_choice(choices)
 
 
-def view_text_with_pydoc(text) -> None:
-    """View the contents of a text using pydoc."""
+def view_text_with_pydoc(text, page_lines=PYDOC_PAGE_LINES) -> None:
+    """View the contents of a text using pydoc.
+    The text can be a string or any iterable of lines, e.g. an open file, which is
+    paged page_lines lines at a time so only one page is held in memory.
+    The user is asked before each next page only if stdin is a terminal."""
     # NOTE: Adding color for pydoc adds color to more than just the text provided
-    pydoc_txt = "".join(text)
-    pydoc.pager(pydoc_txt)
+    if isinstance(text, str):
+        pydoc.pager(text)
+        return
 
+    # Without a terminal to answer the prompt the pages are written one after another
+    interactive = sys.stdin is not None and sys.stdin.isatty()
+    lines = iter(text)
+    while True:
+        page = list(islice(lines, page_lines))
+        if not page:
+            return
+        pydoc.pager("".join(page))
+        if len(page) < page_lines:
+            return
+        if not interactive:
+            continue
+        if input("Press Enter for the next page or q to stop: ").strip().lower() == "q":
+            return
+
+
+def color_diff_line(line) -> str:
+    """Add the diff color of a line for less -R."""
+    if line.startswith("+"):
+        return Fore.GREEN + line
+    if line.startswith("-"):
+        return Fore.RED + line
+    if line.startswith("@"):
+        return Fore.CYAN + line
+    return line
 
-def view_text_with_less(text) -> None:
-    """View the contents of a text using less."""
-    # Use a copy of the text to avoid modifying the original text
-    color_text = text.copy()
-    # Add color to the text
-    for i, line in enumerate(color_text):
-        if line.startswith("+"):
-            color_text[i] = Fore.GREEN + line
-        elif line.startswith("-"):
-            color_text[i] = Fore.RED + line
-        elif line.startswith("@"):
-            color_text[i] = Fore.CYAN + line
 
-    less_txt = "".join(color_text)
-    with subprocess.Popen(["less", "-R"], stdin=subprocess.PIPE) as process:
-        process.communicate(input=less_txt.encode("utf-8"))
+def view_text_with_less(text) -> None:
+    """View the contents of a text using less.
+    The text can be any iterable of lines, e.g. an open file, and is streamed into
+    less as it is colored, so less opens after the first screen is written."""
+    with subprocess.Popen(
+        ["less", "-R"], stdin=subprocess.PIPE, bufsize=PAGER_BUFFER_SIZE
+    ) as process:
+        # The user can quit less before all of the text is written
+        try:
+            for line in text:
+                process.stdin.write(
+                    color_diff_line(line).encode(TEXT_ENCODING, TEXT_ERRORS)
+                )
+        except BrokenPipeError:
+            pass
+        try:
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
 
 
 def open_files_in_vscode_compare(file1, file2) -> None:
@@ -167,6 +218,16 @@ def disp_chunk_save_merged_diff(input_vars) -> dict:
     }
 
 
+# Decisions the bulk review can set for many hunks at once, as the display chunk
+#   choice function each one applies - ask leaves the hunk to the usual prompt
+BULK_REVIEW_ACTIONS = {
+    "keep": disp_chunk_skip_no_changes,
+    "new": disp_chunk_overwrite_new_changes,
+    "merge": disp_chunk_save_merged_diff,
+    "ask": None,
+}
+
+
 def whole_chunk_skip_no_changes(input_vars) -> dict:
     """Skip - Keep the current chunk"""
     new_lines = input_vars["f_final_merged_mod_chunk"]
@@ -256,10 +317,11 @@ def whole_chunk_view_diff_less(input_vars) -> dict:
 def whole_file_view_temp_merged_mod_less(input_vars) -> dict:
     """View Temp Merged Mod in less"""
     temp_merged_mod_file = input_vars["temp_merged_mod_file"]
-    tmp_merged_mod_lines = []
-    with open(temp_merged_mod_file, "r", encoding="utf-8") as tmp_merged_mod:
-        tmp_merged_mod_lines = tmp_merged_mod.readlines()
-    view_text_with_less(tmp_merged_mod_lines)
+    # Stream the file into less line by line instead of reading it all first
+    with open(
+        temp_merged_mod_file, "r", encoding="utf-8", errors="replace"
+    ) as tmp_merged_mod:
+        view_text_with_less(tmp_merged_mod)
     return {
         "status": "continue",
     }
@@ -277,10 +339,11 @@ def whole_chunk_view_diff_pydoc(input_vars) -> dict:
 def whole_file_view_temp_merged_mod_pydoc(input_vars) -> dict:
     """View Temp Merged Mod in pydoc"""
     temp_merged_mod_file = input_vars["temp_merged_mod_file"]
-    tmp_merged_mod_lines = []
-    with open(temp_merged_mod_file, "r", encoding="utf-8") as tmp_merged_mod:
-        tmp_merged_mod_lines = tmp_merged_mod.readlines()
-    view_text_with_pydoc(tmp_merged_mod_lines)
+    # Page the file a bounded number of lines at a time instead of reading it all first
+    with open(
+        temp_merged_mod_file, "r", encoding="utf-8", errors="replace"
+    ) as tmp_merged_mod:
+        view_text_with_pydoc(tmp_merged_mod)
     return {
         "status": "continue",
     }
@@ -387,6 +450,131 @@ def load_choice_functions(valid_requirements) -> dict:
     return choice_functions
 
 
+def parse_hunk_range(range_info) -> tuple:
+    """Parse the start line and length of one side of a unified diff header, e.g. -944,81.
+    The length is left out of the header when it is 1."""
+    start_line, _, length = range_info[1:].partition(",")
+    return int(start_line), int(length) if length else 1
+
+
+def split_display_hunks(diff_lines) -> list:
+    """Split a unified diff into its display hunks, each starting with its @@ header."""
+    hunks = []
+    for line in diff_lines:
+        if line.startswith("@"):
+            hunks.append([line])
+        elif hunks:
+            hunks[-1].append(line)
+    return hunks
+
+
+def summarize_hunk(hunk_lines, final_line_offset=0) -> dict:
+    """Summarize a display hunk by where it starts in the final merged mod file and
+    which lines it removes and adds."""
+    final_start_line, _ = parse_hunk_range(hunk_lines[0].split(" ")[1])
+    removed_lines = [line for line in hunk_lines[1:] if line.startswith("-")]
+    added_lines = [line for line in hunk_lines[1:] if line.startswith("+")]
+    return {
+        "line": final_line_offset + final_start_line,
+        "removed": len(removed_lines),
+        "added": len(added_lines),
+        "changed_lines": [
+            remove_trailing_whitespace_and_newlines(line[1:]).strip()
+            for line in removed_lines + added_lines
+        ],
+    }
+
+
+def format_hunk_summary(hunk_number, hunk, action) -> str:
+    """Format a hunk as one line: number, decision, line, counts, and first change."""
+    first_change = next((line for line in hunk["changed_lines"] if line), "")
+    if len(first_change) > BULK_REVIEW_SUMMARY_WIDTH:
+        first_change = first_change[: BULK_REVIEW_SUMMARY_WIDTH - 3] + "..."
+    return (
+        f"{hunk_number:>4}. {action or 'ask':<5} | line {hunk['line']:<7} | "
+        f"-{hunk['removed']} +{hunk['added']} | {first_change}"
+    )
+
+
+def parse_hunk_selection(selection, hunks):
+    """Parse a selection of hunks into their indexes, or None if it isn't valid.
+    A selection is all, hunk numbers and ranges like 1-5,8, or a /regex/ matched
+    against the changed lines."""
+    if selection == "all":
+        return list(range(len(hunks)))
+
+    if len(selection) > 1 and selection.startswith("/") and selection.endswith("/"):
+        try:
+            pattern = re.compile(selection[1:-1])
+        except re.error:
+            return None
+        return [
+            index
+            for index, hunk in enumerate(hunks)
+            if any(pattern.search(line) for line in hunk["changed_lines"])
+        ]
+
+    indexes = []
+    for part in selection.split(","):
+        first, _, last = part.strip().partition("-")
+        if not first.isdigit() or (last and not last.isdigit()):
+            return None
+        first = int(first)
+        last = int(last) if last else first
+        if first < 1 or last > len(hunks) or first > last:
+            return None
+        indexes.extend(range(first - 1, last))
+    return indexes
+
+
+def print_bulk_review(hunks, decisions) -> None:
+    """Print the one line summary and current decision of every hunk."""
+    for index, hunk in enumerate(hunks):
+        logger.info(format_hunk_summary(index + 1, hunk, decisions[index]))
+
+
+def bulk_review_choice_handler(hunks, final_merged_mod_file, new_mods_file) -> dict:
+    """List every hunk of a file and let the user set decisions for many of them at once.
+    Returns the decision of each hunk as a BULK_REVIEW_ACTIONS key, None to ask as usual.
+    """
+    decisions = [None] * len(hunks)
+    logger.info(f"\n\nBulk review of {len(hunks)} hunks")
+    display_file_parts(final_merged_mod_file, new_mods_file)
+    print_bulk_review(hunks, decisions)
+
+    input_option_text = (
+        "\nSet decisions as <hunks> <action>\n"
+        "    hunks:   all, numbers and ranges like 1-5,8, or a /regex/ of the changed lines\n"
+        f"    actions: {', '.join(BULK_REVIEW_ACTIONS)}\n"
+        "Or: list | apply | quit\n"
+        "Enter your choice: "
+    )
+    while True:
+        command = input(input_option_text).strip()
+
+        if command == "list":
+            print_bulk_review(hunks, decisions)
+            continue
+        if command == "apply":
+            return {"status": "continue", "decisions": decisions}
+        if command == "quit":
+            return {"status": "quit"}
+
+        selection, _, action = command.rpartition(" ")
+        if action not in BULK_REVIEW_ACTIONS:
+            logger.warning("Invalid action. Please choose again.")
+            continue
+
+        indexes = parse_hunk_selection(selection.strip(), hunks)
+        if not indexes:
+            logger.warning("No hunks selected. Please choose again.")
+            continue
+
+        for index in indexes:
+            decisions[index] = None if action == "ask" else action
+        logger.info(f"Set {len(indexes)} hunks to {action}")
+
+
 def choice_handler(
     new_mods_file,
     final_merged_mod_file,
@@ -398,17 +586,22 @@ def choice_handler(
     last_display_diff,
     last_user_choice,
     confirm_user_choice=False,
+    bulk_decisions=None,
+    spill_bytes=None,
 ) -> dict:
     """Handle the user's choice for the diff.
     Takes in the performanced chunked lines, splits them into display chunks,
     asks the user for a choice per display chunk, allows confirmation of the choice,
-    and finally outputs the new lines to be written to the tmp_merged_mod file."""
+    and finally outputs the new lines to be written to the tmp_merged_mod file.
+    bulk_decisions maps display chunk indexes to the bulk review action to apply
+    without asking. The diff and merged lines spill to disk past spill_bytes."""
+    bulk_decisions = bulk_decisions or {}
 
     # total_diff_lines = len(diff_lines) # Err: can't use len on a generator
     # chunk_offset = 0
-    tmp_merged_mod_lines = []
+    tmp_merged_mod_lines = SpillList(spill_bytes)
     final_merged_mod_current_process_line = 0
-    diff_lines_list = list(diff_lines)
+    diff_lines_list = SpillList(spill_bytes, diff_lines)
     MAX_LINES_TO_DISPLAY = 100
 
     # Definitions:
@@ -434,12 +627,10 @@ def choice_handler(
             final_merged_mod_chunk_info = header_parts[1]
             new_mod_chunk_info = header_parts[2]
 
-            final_merged_mod_start_line, final_merged_mod_length = map(
-                int, final_merged_mod_chunk_info[1:].split(",")
-            )
-            new_mod_start_line, new_mod_length = map(
-                int, new_mod_chunk_info[1:].split(",")
+            final_merged_mod_start_line, final_merged_mod_length = parse_hunk_range(
+                final_merged_mod_chunk_info
             )
+            new_mod_start_line, new_mod_length = parse_hunk_range(new_mod_chunk_info)
 
             display_chunk_array.append(
                 [
@@ -459,7 +650,7 @@ def choice_handler(
     user_choice = ""
 
     # Loop through the chunked lines and display them in chunks
-    for disp_chunk_line_info in display_chunk_array:
+    for disp_chunk_index, disp_chunk_line_info in enumerate(display_chunk_array):
         if not disp_chunk_line_info or disp_chunk_line_info[0] is None:
             break
 
@@ -504,10 +695,10 @@ def choice_handler(
         dup_diff_found = False
         if last_display_diff:
             last_disp_diff_parts = last_display_diff.split(" ")
-            # last_disp_diff_final_mod_start_line = last_disp_diff_parts[1].split(",")[0]
-            last_disp_diff_final_mod_length = last_disp_diff_parts[1].split(",")[1]
-            # last_disp_diff_new_mod_start_line = last_disp_diff_parts[2].split(",")[0]
-            last_disp_diff_new_mod_length = last_disp_diff_parts[2].split(",")[1]
+            _, last_disp_diff_final_mod_length = parse_hunk_range(
+                last_disp_diff_parts[1]
+            )
+            _, last_disp_diff_new_mod_length = parse_hunk_range(last_disp_diff_parts[2])
 
             # TODO: Test this and see if more conditions are needed
             if int(last_disp_diff_final_mod_length) == int(new_mod_length) and int(
@@ -539,6 +730,16 @@ def choice_handler(
             "final_merged_mod_file": final_merged_mod_file,
         }
 
+        # Apply the decision set for the display chunk in the bulk review
+        bulk_action = bulk_decisions.get(disp_chunk_index)
+        if bulk_action:
+            result = BULK_REVIEW_ACTIONS[bulk_action](input_vars)
+            tmp_merged_mod_lines.extend(result["processed_lines"])
+            final_merged_mod_current_process_line = (
+                final_merged_mod_start_line + final_merged_mod_length
+            )
+            continue
+
         if last_display_diff and last_user_choice and dup_diff_found:
             logger.info("Last display diff is the same as the current display diff.")
             logger.info(f"Using the last user choice: {last_user_choice}")
@@ -698,8 +899,8 @@ def non_text_file_choice_handler(final_merged_mod_path, new_mods_path) -> dict:
         return {"status": "skip"}
     if user_choice == "2":
         return {"status": "overwrite"}
-    if user_choice == "3":
-        return {"status": "quit"}
+    # The only other choice get_user_choice returns is the added quit option
+    return {"status": "quit"}
 
 
 def bad_format_choice_handler(skip_file_bool, quit_out_bool) -> dict:
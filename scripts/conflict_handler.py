@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+
+# Version 0.1.0
+
+"""This module contains functions to analyze which mods conflict before merging."""
+
+# Every unpacked mod is listed and the files touched by more than one mod, or that differ
+#   from the base, are hashed in parallel. Pairs with different contents get a hunk count
+#   estimate from the same unified diff grouping the merge prompts use.
+# Nothing here prompts or writes to the merged tree - it only hashes and diffs.
+
+import difflib
+import json
+import logging
+import os
+
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+from hash_handler import hash_files_parallel
+from walk_handler import get_relative_path, scan_files
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,  # Set the log level
+    format="%(asctime)s | %(levelname)s | %(message)s",  # Set the log format
+    handlers=[
+        # Log to a file - escape any bytes that aren't valid UTF-8
+        logging.FileHandler("merge_tool.log", errors="backslashreplace"),
+        logging.StreamHandler(),  # Also log to the console
+    ],
+)
+
+# Create a logger object
+logger = logging.getLogger(__name__)
+
+
+def scan_mod_files(mod_dir) -> dict:
+    """List every file below a mod directory as relative path to absolute path."""
+    mod_files = {}
+    for entry in scan_files(mod_dir):
+        if not entry.name.endswith(".tmp"):
+            mod_files[get_relative_path(entry.path, mod_dir)] = entry.path
+    return mod_files
+
+
+def count_hunks(file_path_a, file_path_b) -> int:
+    """Count the unified diff hunks between two text files."""
+    with open(file_path_a, "rb") as f:
+        lines_a = f.readlines()
+    with open(file_path_b, "rb") as f:
+        lines_b = f.readlines()
+    matcher = difflib.SequenceMatcher(None, lines_a, lines_b)
+    return sum(1 for _ in matcher.get_grouped_opcodes(3))
+
+
+def try_count_hunks(file_path_a, file_path_b) -> tuple:
+    """Count the hunks between two files in a worker process without raising.
+    Returns (hunks, None), or (None, file path) if one of the files can't be read."""
+    try:
+        return count_hunks(file_path_a, file_path_b), None
+    except OSError as e:
+        return None, e.filename or file_path_a
+
+
+def build_conflict_matrix(
+    new_mods_dir,
+    base_dir=None,
+    valid_file_extensions=None,
+    workers=None,
+    hash_files=hash_files_parallel,
+    hunk_cache=None,
+) -> dict:
+    """Build a report of every path touched by more than one mod or changed from the base.
+    Each path lists the mods that touch it, how many distinct contents they have, which
+    mods differ from the base, and the estimated hunk count per pair. Files that can't be
+    read are listed as unreadable, by mod name or "base", and get no hunk count.
+    hash_files and hunk_cache let a long running caller reuse hashes and hunk counts,
+    the cache being keyed by the pair of content hashes."""
+    hunk_cache = {} if hunk_cache is None else hunk_cache
+    workers = workers or os.cpu_count() or 1
+    mod_names = sorted(
+        name
+        for name in os.listdir(new_mods_dir)
+        if os.path.isdir(os.path.join(new_mods_dir, name))
+    )
+    mod_files = {
+        mod_name: scan_mod_files(os.path.join(new_mods_dir, mod_name))
+        for mod_name in mod_names
+    }
+
+    path_mods = {}
+    for mod_name in mod_names:
+        for relative_path in mod_files[mod_name]:
+            path_mods.setdefault(relative_path, []).append(mod_name)
+
+    # Only paths that will need a merge decision are hashed
+    base_paths = {}
+    for relative_path, mods in path_mods.items():
+        base_path = (
+            os.path.join(base_dir, *relative_path.split("/")) if base_dir else None
+        )
+        if base_path and os.path.isfile(base_path):
+            base_paths[relative_path] = base_path
+    analyzed_paths = sorted(
+        relative_path
+        for relative_path, mods in path_mods.items()
+        if len(mods) > 1 or relative_path in base_paths
+    )
+
+    files_to_hash = list(base_paths.values())
+    for relative_path in analyzed_paths:
+        files_to_hash.extend(
+            mod_files[mod_name][relative_path] for mod_name in path_mods[relative_path]
+        )
+    logger.info(
+        f"Hashing {len(files_to_hash)} files across {len(mod_names)} mods with {workers} workers"
+    )
+    file_hashes = hash_files(files_to_hash, workers)
+
+    paths = {}
+    hunk_jobs = []
+    for relative_path in analyzed_paths:
+        mods = path_mods[relative_path]
+        mod_hashes = {
+            mod_name: file_hashes.get(mod_files[mod_name][relative_path])
+            for mod_name in mods
+        }
+        base_hash = file_hashes.get(base_paths.get(relative_path))
+        differs_from_base = {
+            mod_name: mod_hash != base_hash for mod_name, mod_hash in mod_hashes.items()
+        }
+        # Files left out of the hashes couldn't be read
+        unreadable = [
+            mod_name for mod_name, mod_hash in mod_hashes.items() if mod_hash is None
+        ]
+        if relative_path in base_paths and base_hash is None:
+            unreadable.append("base")
+
+        # A mod identical to the base won't produce a prompt
+        if not unreadable and not any(differs_from_base.values()):
+            continue
+
+        paths[relative_path] = {
+            "mods": mods,
+            "base": relative_path in base_paths,
+            "distinct_contents": len(
+                set(mod_hash for mod_hash in mod_hashes.values() if mod_hash)
+            ),
+            "differs_from_base": differs_from_base,
+            "pair_hunks": [],
+            "base_hunks": {},
+            "unreadable": unreadable,
+        }
+
+        is_text_file = (
+            valid_file_extensions is None
+            or os.path.splitext(relative_path)[1] in valid_file_extensions
+        )
+        for mod_a, mod_b in combinations(mods, 2):
+            if mod_a in unreadable or mod_b in unreadable:
+                paths[relative_path]["pair_hunks"].append(
+                    {"mods": [mod_a, mod_b], "hunks": None}
+                )
+            elif mod_hashes[mod_a] == mod_hashes[mod_b]:
+                paths[relative_path]["pair_hunks"].append(
+                    {"mods": [mod_a, mod_b], "hunks": 0}
+                )
+            elif is_text_file:
+                hunk_jobs.append(
+                    (
+                        relative_path,
+                        ("pair", mod_a, mod_b),
+                        (mod_hashes[mod_a], mod_hashes[mod_b]),
+                        mod_files[mod_a][relative_path],
+                        mod_files[mod_b][relative_path],
+                    )
+                )
+            else:
+                paths[relative_path]["pair_hunks"].append(
+                    {"mods": [mod_a, mod_b], "hunks": None}
+                )
+
+        if base_hash is not None and is_text_file:
+            for mod_name in mods:
+                if differs_from_base[mod_name] and mod_name not in unreadable:
+                    hunk_jobs.append(
+                        (
+                            relative_path,
+                            ("base", mod_name),
+                            (base_hash, mod_hashes[mod_name]),
+                            base_paths[relative_path],
+                            mod_files[mod_name][relative_path],
+                        )
+                    )
+
+    # difflib is pure Python, so the hunk counts are spread over processes
+    uncached_jobs = {}
+    for job in hunk_jobs:
+        if job[2] not in hunk_cache:
+            uncached_jobs.setdefault(job[2], job[3:])
+    logger.info(
+        f"Estimating hunks for {len(uncached_jobs)} of {len(hunk_jobs)} file pairs"
+    )
+    unreadable_files = set()
+    if uncached_jobs:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            hunk_results = executor.map(
+                try_count_hunks,
+                [file_paths[0] for file_paths in uncached_jobs.values()],
+                [file_paths[1] for file_paths in uncached_jobs.values()],
+                chunksize=max(1, len(uncached_jobs) // (workers * 4)),
+            )
+            for hash_pair, (hunks, unreadable_file) in zip(uncached_jobs, hunk_results):
+                # Only counts are cached, so an unreadable file is retried next time
+                if unreadable_file is None:
+                    hunk_cache[hash_pair] = hunks
+                else:
+                    logger.error(f"Unable to read {unreadable_file}")
+                    unreadable_files.add(unreadable_file)
+
+    for relative_path, key, hash_pair, file_path_a, file_path_b in hunk_jobs:
+        hunks = hunk_cache.get(hash_pair)
+        path_report = paths[relative_path]
+        job_names = ["base", key[1]] if key[0] == "base" else [key[1], key[2]]
+        for name, file_path in zip(job_names, (file_path_a, file_path_b)):
+            if file_path in unreadable_files and name not in path_report["unreadable"]:
+                path_report["unreadable"].append(name)
+        if key[0] == "pair":
+            paths[relative_path]["pair_hunks"].append(
+                {"mods": [key[1], key[2]], "hunks": hunks}
+            )
+        else:
+            paths[relative_path]["base_hunks"][key[1]] = hunks
+
+    for path_report in paths.values():
+        path_report["pair_hunks"].sort(key=lambda pair: pair["mods"])
+
+    estimated_hunks = sum(
+        sum(hunks or 0 for hunks in path_report["base_hunks"].values())
+        + sum(pair["hunks"] or 0 for pair in path_report["pair_hunks"])
+        for path_report in paths.values()
+    )
+    return {
+        "mods": mod_names,
+        "paths": paths,
+        "summary": {
+            "mods": len(mod_names),
+            "files": len(path_mods),
+            "conflicting_paths": len(paths),
+            "multi_mod_paths": sum(1 for p in paths.values() if len(p["mods"]) > 1),
+            "estimated_hunks": estimated_hunks,
+            "unreadable_files": sum(len(p["unreadable"]) for p in paths.values()),
+        },
+    }
+
+
+def analyze_conflicts(
+    new_mods_dir, base_dir, report_path, valid_file_extensions=None, workers=None
+) -> dict:
+    """Build the conflict matrix, log a summary, and save it as a JSON report."""
+    report = build_conflict_matrix(
+        new_mods_dir, base_dir, valid_file_extensions, workers
+    )
+
+    summary = report["summary"]
+    logger.info(
+        f"Mods: {summary['mods']} | Files: {summary['files']} | "
+        f"Conflicting paths: {summary['conflicting_paths']} "
+        f"({summary['multi_mod_paths']} touched by several mods) | "
+        f"Estimated hunks: {summary['estimated_hunks']}"
+    )
+    if summary["unreadable_files"]:
+        logger.warning(
+            f"Unreadable files: {summary['unreadable_files']} - see the report for details"
+        )
+    for relative_path, path_report in report["paths"].items():
+        if len(path_report["mods"]) > 1:
+            logger.info(f"{relative_path}: {', '.join(path_report['mods'])}")
+
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=4)
+    logger.info(f"Saved conflict report to {report_path}")
+    return report
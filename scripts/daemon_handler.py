@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+
+# Version 0.1.0
+
+"""This module contains the JSON lines protocol spoken with the merge daemon."""
+
+# Each request and response is one JSON object followed by a newline, sent over a
+#   Unix socket. Requests have a "command" key and responses have a "status" key.
+# Paths are made absolute by the client because the daemon runs in its own directory.
+
+import json
+import logging
+import os
+import socket
+import tempfile
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,  # Set the log level
+    format="%(asctime)s | %(levelname)s | %(message)s",  # Set the log format
+    handlers=[
+        # Log to a file - escape any bytes that aren't valid UTF-8
+        logging.FileHandler("merge_tool.log", errors="backslashreplace"),
+        logging.StreamHandler(),  # Also log to the console
+    ],
+)
+
+# Create a logger object
+logger = logging.getLogger(__name__)
+
+DEFAULT_SOCKET_PATH = os.path.join(tempfile.gettempdir(), "pak_merge_tool.sock")
+
+
+def get_socket_path(config) -> str:
+    """Get the daemon socket path from the config, or the default one."""
+    return config.get("daemon_socket") or DEFAULT_SOCKET_PATH
+
+
+def write_message(stream, message) -> None:
+    """Write a message as one line of JSON and flush it."""
+    stream.write(json.dumps(message).encode("utf-8") + b"\n")
+    stream.flush()
+
+
+def read_message(stream):
+    """Read one line of JSON, or None if the other side closed the connection."""
+    line = stream.readline()
+    if not line:
+        return None
+    return json.loads(line)
+
+
+def send_request(socket_path, request) -> dict:
+    """Send a request to the daemon and wait for its response.
+    Raises OSError if the daemon isn't running."""
+    if not hasattr(socket, "AF_UNIX"):
+        raise OSError("Unix sockets are not available on this platform")
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(socket_path)
+        with client.makefile("rwb") as stream:
+            write_message(stream, request)
+            response = read_message(stream)
+
+    if response is None:
+        return {"status": "error", "error": "The daemon closed the connection"}
+    return response
@@ -4,22 +4,29 @@
 
 """This module contains functions to handle formatting of directories."""
 
-# Usage:    python format_dir.py --format_dir=<directory_path>
+# Usage:    python format_dir.py --format_dir=<directory_path> [--workers=<count>] [--report=<report_path>]
+# Usage:    python format_dir.py --format_dir=<directory_path> --daemon_socket=<socket_path>
 # Example:  clear;python pak_merge_tool\scripts\format_dir.py --format_dir=~merged_mods_v2-0_P
 
 import logging
 import argparse
+import json
 import os
 
-from format_handler import format_file
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from daemon_handler import send_request
+from format_handler import format_file, format_file_status
 from requirements_handler import load_config
+from walk_handler import walk_files
 
 # Set up logging
 logging.basicConfig(
     level=logging.INFO,  # Set the log level
     format="%(asctime)s | %(levelname)s | %(message)s",  # Set the log format
     handlers=[
-        logging.FileHandler("merge_tool.log"),  # Log to a file
+        # Log to a file - escape any bytes that aren't valid UTF-8
+        logging.FileHandler("merge_tool.log", errors="backslashreplace"),
         logging.StreamHandler(),  # Also log to the console
     ],
 )
@@ -30,14 +37,100 @@ logger = logging.getLogger(__name__)
 
 def recursive_format_dir(path: str, max_perf_chunk_size: int) -> None:
     """Recursively format all files in a directory and its subdirectories."""
-    dir_list = os.listdir(path)
-    sorted_dir_list = sorted(dir_list, key=lambda x: x.lower())
-    for item in sorted_dir_list:
-        item_path = os.path.join(path, item)
-        if os.path.isdir(item_path):
-            recursive_format_dir(item_path, max_perf_chunk_size)
-        else:
-            format_file(item_path, max_perf_chunk_size)
+    for file_path in walk_files(path, sort_key=str.lower):
+        format_file(file_path, max_perf_chunk_size)
+
+
+def list_format_files(path: str) -> list:
+    """List every file below a directory in the order recursive_format_dir visits them."""
+    return walk_files(path, sort_key=str.lower)
+
+
+def try_format_file_status(file_path: str, max_perf_chunk_size: int) -> dict:
+    """Format a file in a worker, reporting a file that can't be read or replaced
+    as an error instead of raising and stopping the other workers."""
+    try:
+        return format_file_status(file_path, max_perf_chunk_size)
+    except OSError as e:
+        logger.error(f"An error occurred while formatting file: {file_path}")
+        logger.error(e)
+        return {"status": "error", "file_path": file_path}
+
+
+def add_format_result(report: dict, result: dict) -> None:
+    """Add the result of formatting a file to a format report."""
+    if result["status"] == "skipped":
+        report["skipped"] += 1
+    elif result["status"] == "bad_depth":
+        report["bad_depth"].append(
+            {"file_path": result["file_path"], "tab_level": result["tab_level"]}
+        )
+    else:
+        report[result["status"]].append(result["file_path"])
+
+
+def format_files(cfg_file_paths: list, max_perf_chunk_size: int, workers=None) -> dict:
+    """Format a list of cfg files on a process pool, or in order with 1 worker,
+    and return a report of the formatted, skipped, bad_depth, and error files."""
+    workers = workers or os.cpu_count() or 1
+    report = {
+        "formatted": [],
+        "skipped": 0,
+        "bad_depth": [],
+        "error": [],
+    }
+
+    if workers == 1:
+        for file_path in cfg_file_paths:
+            add_format_result(
+                report, try_format_file_status(file_path, max_perf_chunk_size)
+            )
+        return report
+
+    chunksize = max(1, len(cfg_file_paths) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for result in executor.map(
+            try_format_file_status,
+            cfg_file_paths,
+            repeat(max_perf_chunk_size),
+            chunksize=chunksize,
+        ):
+            add_format_result(report, result)
+
+    return report
+
+
+def log_format_report(report: dict) -> None:
+    """Log the totals of a format report and each file that needs attention."""
+    logger.info(
+        f"Formatted: {len(report['formatted'])} | Skipped: {report['skipped']} | "
+        f"Bad depth: {len(report['bad_depth'])} | Errors: {len(report['error'])}"
+    )
+    for bad_depth_file in report["bad_depth"]:
+        logger.warning(
+            f"Did not end at tab level 0 ({bad_depth_file['tab_level']}): {bad_depth_file['file_path']}"
+        )
+    for error_file in report["error"]:
+        logger.error(f"Failed to format: {error_file}")
+
+
+def parallel_format_dir(path: str, max_perf_chunk_size: int, workers=None) -> dict:
+    """Format all files in a directory tree on a process pool, or in order with 1 worker,
+    and return a report of the formatted, skipped, bad_depth, and error files."""
+    workers = workers or os.cpu_count() or 1
+    file_paths = list_format_files(path)
+
+    # Only cfg files are formatted - skip the rest without sending them to a worker
+    cfg_file_paths = [f for f in file_paths if f.endswith(".cfg")]
+
+    logger.info(
+        f"Formatting {len(cfg_file_paths)} of {len(file_paths)} files in {path} with {workers} workers"
+    )
+    report = format_files(cfg_file_paths, max_perf_chunk_size, workers)
+    report["skipped"] += len(file_paths) - len(cfg_file_paths)
+    log_format_report(report)
+
+    return report
 
 
 def main() -> bool:
@@ -47,6 +140,24 @@ def main() -> bool:
     parser.add_argument(
         "--format_dir", type=str, help="The directory to format.", required=True
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="The number of processes to format with (1 formats serially, defaults to format_workers in the config)",
+        required=False,
+    )
+    parser.add_argument(
+        "--report",
+        type=str,
+        help="Write the format report to this JSON file.",
+        required=False,
+    )
+    parser.add_argument(
+        "--daemon_socket",
+        type=str,
+        help="Send the format request to the merge daemon listening on this socket.",
+        required=False,
+    )
 
     args = parser.parse_args()
 
@@ -54,13 +165,41 @@ def main() -> bool:
         logger.error(f"The specified path is not a directory: {args.format_dir}")
         return False
 
-    # Load the config file
-    config = load_config("config.json")
-    max_perf_chunk_size = config["max_perf_chunk_size"]
+    report = None
+    if args.daemon_socket:
+        try:
+            report = send_request(
+                args.daemon_socket,
+                {
+                    "command": "format",
+                    "format_dir": os.path.abspath(args.format_dir),
+                    "workers": args.workers,
+                },
+            )
+        except OSError as e:
+            logger.warning(
+                f"Unable to reach the merge daemon | Formatting locally: {e}"
+            )
+        else:
+            if report["status"] == "error":
+                logger.error(f"Merge daemon error: {report['error']}")
+                return False
+            log_format_report(report)
+
+    if report is None:
+        # Load the config file
+        config = load_config("config.json")
+        max_perf_chunk_size = config["max_perf_chunk_size"]
+        workers = args.workers or config.get("format_workers") or os.cpu_count() or 1
+
+        report = parallel_format_dir(args.format_dir, max_perf_chunk_size, workers)
 
-    recursive_format_dir(args.format_dir, max_perf_chunk_size)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=4)
+        logger.info(f"Saved format report to {args.report}")
 
-    return True
+    return not report["bad_depth"] and not report["error"]
 
 
 if __name__ == "__main__":
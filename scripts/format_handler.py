@@ -4,12 +4,14 @@
 
 """This module contains functions to handle formatting of files."""
 
+import difflib
 import logging
 import os
 import re
 import shutil
 
 from colorama import init
+from hash_handler import files_identical
 
 # Initialize colorama
 init(autoreset=True)
@@ -19,7 +21,8 @@ logging.basicConfig(
     level=logging.INFO,  # Set the log level
     format="%(asctime)s | %(levelname)s | %(message)s",  # Set the log format
     handlers=[
-        logging.FileHandler("merge_tool.log"),  # Log to a file
+        # Log to a file - escape any bytes that aren't valid UTF-8
+        logging.FileHandler("merge_tool.log", errors="backslashreplace"),
         logging.StreamHandler(),  # Also log to the console
     ],
 )
@@ -27,10 +30,122 @@ logging.basicConfig(
 # Create a logger object
 logger = logging.getLogger(__name__)
 
+# Files are compared as bytes and only decoded for display and the structural parser.
+#   surrogateescape round-trips any bytes that aren't valid UTF-8 unchanged.
+TEXT_ENCODING = "utf-8"
+TEXT_ERRORS = "surrogateescape"
+
+
+def decode_lines(lines) -> list:
+    """Decode lines of bytes to text for display and parsing."""
+    return [line.decode(TEXT_ENCODING, TEXT_ERRORS) for line in lines]
+
+
+def encode_lines(lines) -> list:
+    """Encode lines of text back to the bytes they were decoded from."""
+    return [line.encode(TEXT_ENCODING, TEXT_ERRORS) for line in lines]
+
+
+def load_compare_settings(config) -> dict:
+    """Load how lines are normalized before they are compared, with defaults."""
+    comment_prefixes = []
+    if config.get("ignore_comments", False):
+        comment_prefixes = config.get("comment_prefixes", ["//"])
+    return {
+        "ignore_whitespace": config.get("normalize_whitespace", True),
+        "comment_prefixes": tuple(
+            prefix.encode(TEXT_ENCODING) for prefix in comment_prefixes
+        ),
+    }
+
+
+def normalize_line(line, compare_settings) -> bytes:
+    """Normalize a line of bytes for comparison only - the original line is what gets written.
+    Drops comments if set, then indentation, trailing whitespace, and the line ending.
+    """
+    for prefix in compare_settings["comment_prefixes"]:
+        index = line.find(prefix)
+        # Only a prefix at the start of the line or after whitespace starts a comment
+        if index == 0 or (index > 0 and line[index - 1 : index].isspace()):
+            line = line[:index]
+    if compare_settings["ignore_whitespace"]:
+        return line.strip()
+    return line.rstrip(b"\r\n")
+
+
+def normalize_lines(lines, compare_settings) -> list:
+    """Normalize lines for comparison, dropping lines left empty when whitespace is ignored."""
+    normalized_lines = (normalize_line(line, compare_settings) for line in lines)
+    if compare_settings["ignore_whitespace"]:
+        return [line for line in normalized_lines if line]
+    return list(normalized_lines)
+
+
+def lines_equal(lines_a, lines_b, compare_settings=None) -> bool:
+    """Check if two lists of byte lines are equal, after normalizing them if settings are given."""
+    if lines_a == lines_b:
+        return True
+    if compare_settings is None:
+        return False
+    return normalize_lines(lines_a, compare_settings) == normalize_lines(
+        lines_b, compare_settings
+    )
+
+
+def format_range_unified(start, stop) -> str:
+    """Format one side of a unified diff hunk header the way difflib does."""
+    beginning = start + 1  # Unified Diff starts indexing at 1
+    length = stop - start
+    if length == 1:
+        return f"{beginning}"
+    if not length:
+        beginning -= 1  # An empty range starts at the line before it
+    return f"{beginning},{length}"
+
+
+def unified_diff_lines(
+    lines_a, lines_b, fromfile="", tofile="", compare_settings=None, context=3
+):
+    """Yield a unified diff of two lists of text lines like difflib.unified_diff.
+    If settings are given the lines are matched on their normalized keys, so lines that
+    only differ in what is ignored are context lines shown as they are in lines_a."""
+    if compare_settings is None:
+        yield from difflib.unified_diff(
+            lines_a, lines_b, fromfile=fromfile, tofile=tofile, n=context
+        )
+        return
+
+    keys_a = [normalize_line(line, compare_settings) for line in encode_lines(lines_a)]
+    keys_b = [normalize_line(line, compare_settings) for line in encode_lines(lines_b)]
+    matcher = difflib.SequenceMatcher(None, keys_a, keys_b, autojunk=False)
+    started = False
+    for group in matcher.get_grouped_opcodes(context):
+        if not started:
+            started = True
+            yield f"--- {fromfile}\n"
+            yield f"+++ {tofile}\n"
+
+        first, last = group[0], group[-1]
+        yield (
+            f"@@ -{format_range_unified(first[1], last[2])}"
+            f" +{format_range_unified(first[3], last[4])} @@\n"
+        )
+        for tag, start_a, end_a, start_b, end_b in group:
+            if tag == "equal":
+                for line in lines_a[start_a:end_a]:
+                    yield " " + line
+                continue
+            if tag in ("replace", "delete"):
+                for line in lines_a[start_a:end_a]:
+                    yield "-" + line
+            if tag in ("replace", "insert"):
+                for line in lines_b[start_b:end_b]:
+                    yield "+" + line
+
 
 def strip_whitespace(line) -> str:
-    """Strip leading and trailing whitespace from a line."""
-    return re.sub(r"^[ \t]+|[ \t]+$", "", line)
+    """Strip leading and trailing whitespace from a line, keeping its line ending."""
+    return re.sub(r"^[ \t]+|[ \t]+(?=\r?$)", "", line)
 
 
 def remove_trailing_whitespace_and_newlines(line) -> str:
@@ -51,23 +166,32 @@ def display_file_parts(final_file, new_file) -> None:
 
 # FIXME: Test the merge lines and dup line check more - seems still has issues
 def duplicate_line_check(
-    temp_merged_mod_file, new_tmp_merged_mod_lines, perf_chunk, final_perf_chunk_sizes
+    temp_merged_mod_file,
+    new_tmp_merged_mod_lines,
+    perf_chunk,
+    final_perf_chunk_sizes,
+    last_perf_chunk_lines=None,
 ) -> list:
-    """Check for duplicate lines in the temporary merged mod file."""
+    """Check for duplicate lines in the temporary merged mod file.
+    If the lines of the last performance chunk are still in memory they are used
+    instead of re-reading the temporary merged mod file."""
     if perf_chunk == 1:
         return new_tmp_merged_mod_lines
 
     # Check for duplicate lines caused by matching lines crossing over chunks
     cleansed_lines = []
-    last_perf_chunk_lines = []
     if perf_chunk > 1:
-        last_perf_chunk_start_line = sum(final_perf_chunk_sizes[:-1])
-        last_perf_chunk_end_line = sum(final_perf_chunk_sizes)
+        if last_perf_chunk_lines is not None:
+            last_perf_chunk_lines = [line.strip() for line in last_perf_chunk_lines]
+        else:
+            last_perf_chunk_lines = []
+            last_perf_chunk_start_line = sum(final_perf_chunk_sizes[:-1])
+            last_perf_chunk_end_line = sum(final_perf_chunk_sizes)
 
-        with open(temp_merged_mod_file, "r", encoding="utf-8") as tmp_merged_mod:
-            for i, line in enumerate(tmp_merged_mod):
-                if last_perf_chunk_start_line <= i < last_perf_chunk_end_line:
-                    last_perf_chunk_lines.append(line.strip())
+            with open(temp_merged_mod_file, "rb") as tmp_merged_mod:
+                for i, line in enumerate(tmp_merged_mod):
+                    if last_perf_chunk_start_line <= i < last_perf_chunk_end_line:
+                        last_perf_chunk_lines.append(line.strip())
 
         # Check for chunks of duplicate lines in the last performance chunk
         # NOTE: There could be singular duplicate lines or a few lines that are expected
@@ -140,19 +264,33 @@ def config_file_formatter(unformatted_lines, tab_level) -> list:
 
 def format_file(file_path, performance_chunk_size) -> bool:
     """Format a file."""
+    return (
+        format_file_status(file_path, performance_chunk_size)["status"] == "formatted"
+    )
+
+
+def format_file_status(file_path, performance_chunk_size) -> dict:
+    """Format a file and return a dict with the status: formatted, skipped, bad_depth, or error."""
     # Check if cfg file and format it accordingly, else just skip it until more file types are added
     if not file_path.endswith(".cfg"):
         logger.debug(f"Skipping non-cfg file: {file_path}")
-        return False
+        return {"status": "skipped", "file_path": file_path}
 
     if not os.path.exists(file_path):
         logger.error(f"Given file path does not exist: {file_path}")
-        return False
+        return {"status": "error", "file_path": file_path}
 
     temp_formatted_file = file_path + "_format.tmp"
     current_depth = 0
-    with open(file_path, "r", encoding="utf-8") as f, open(
-        temp_formatted_file, "w", encoding="utf-8"
+    # newline="" keeps each line's own line ending instead of rewriting them as \n
+    with open(
+        file_path, "r", encoding=TEXT_ENCODING, errors=TEXT_ERRORS, newline=""
+    ) as f, open(
+        temp_formatted_file,
+        "w",
+        encoding=TEXT_ENCODING,
+        errors=TEXT_ERRORS,
+        newline="",
     ) as f_temp:
         while True:
             lines = f.readlines(performance_chunk_size)
@@ -167,19 +305,30 @@ def format_file(file_path, performance_chunk_size) -> bool:
         # Flush the file to ensure all data is written
         f_temp.flush()
 
-        if current_depth != 0:
-            logger.warning(
-                f"Failed to format file - Did not end at tab level 0: {file_path}"
-            )
-            return False
+    if current_depth != 0:
+        logger.warning(
+            f"Failed to format file - Did not end at tab level 0: {file_path}"
+        )
+        os.remove(temp_formatted_file)
+        return {
+            "status": "bad_depth",
+            "file_path": file_path,
+            "tab_level": current_depth,
+        }
 
     if not os.path.exists(temp_formatted_file):
         logger.error(f"Temporary formatted file does not exist: {temp_formatted_file}")
-        return False
+        return {"status": "error", "file_path": file_path}
 
     if os.path.getsize(temp_formatted_file) == 0:
         logger.error(f"Temporary formatted file is empty: {temp_formatted_file}")
-        return False
+        return {"status": "error", "file_path": file_path}
+
+    # Leave a file that was already formatted untouched, so its mtime and anything
+    #   cached against it stay valid
+    if files_identical(temp_formatted_file, file_path):
+        os.remove(temp_formatted_file)
+        return {"status": "formatted", "file_path": file_path}
 
     try:
         shutil.move(temp_formatted_file, file_path)
@@ -187,10 +336,10 @@ def format_file(file_path, performance_chunk_size) -> bool:
         logger.error(
             f"Permission denied while replacing file: \n\tOrg: {file_path}\n\tNew: {temp_formatted_file}"
         )
-        return False
-    except Exception as e:
+        return {"status": "error", "file_path": file_path}
+    except (OSError, ValueError) as e:
         logger.error(f"An error occurred while replacing file: {file_path}")
         logger.error(e)
-        return False
+        return {"status": "error", "file_path": file_path}
 
-    return True
+    return {"status": "formatted", "file_path": file_path}
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+
+# Version 0.1.0
+
+"""This module contains functions to hash and compare files for change detection."""
+
+# Files are hashed in fixed size blocks so large paks never have to fit in memory.
+# hashlib releases the GIL while hashing, so a thread pool hashes files in parallel.
+# Two files are compared size first, then block by block so the first difference
+#   stops the read. Large files are memory mapped instead of read into buffers.
+
+import hashlib
+import logging
+import mmap
+import os
+
+from concurrent.futures import ThreadPoolExecutor
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,  # Set the log level
+    format="%(asctime)s | %(levelname)s | %(message)s",  # Set the log format
+    handlers=[
+        # Log to a file - escape any bytes that aren't valid UTF-8
+        logging.FileHandler("merge_tool.log", errors="backslashreplace"),
+        logging.StreamHandler(),  # Also log to the console
+    ],
+)
+
+# Create a logger object
+logger = logging.getLogger(__name__)
+
+HASH_ALGORITHM = "sha256"
+HASH_BLOCK_SIZE = 1024 * 1024
+MMAP_THRESHOLD = 64 * 1024 * 1024
+
+
+def hash_file(file_path, block_size=HASH_BLOCK_SIZE) -> str:
+    """Hash a file by streaming it in blocks."""
+    file_hash = hashlib.new(HASH_ALGORITHM)
+    with open(file_path, "rb") as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+
+def hash_blocks(blocks) -> str:
+    """Hash a stream of byte blocks, e.g. from a file system's iter_blocks."""
+    file_hash = hashlib.new(HASH_ALGORITHM)
+    for block in blocks:
+        file_hash.update(block)
+    return file_hash.hexdigest()
+
+
+def hash_files_parallel(file_paths, workers=None) -> dict:
+    """Hash files on a thread pool and return a dict of file path to hash.
+    Files that can't be read are left out of the result."""
+    workers = workers or os.cpu_count() or 1
+    file_paths = list(file_paths)
+
+    def try_hash_file(file_path):
+        try:
+            return hash_file(file_path)
+        except OSError as e:
+            logger.error(f"Error hashing {file_path}")
+            logger.error(e)
+            return None
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        file_hashes = dict(zip(file_paths, executor.map(try_hash_file, file_paths)))
+
+    return {path: value for path, value in file_hashes.items() if value is not None}
+
+
+def files_identical(
+    file_path_a, file_path_b, block_size=HASH_BLOCK_SIZE, mmap_threshold=MMAP_THRESHOLD
+) -> bool:
+    """Check if two files have the same content."""
+    size = os.path.getsize(file_path_a)
+    if size != os.path.getsize(file_path_b):
+        return False
+    if size == 0:
+        return True
+
+    with open(file_path_a, "rb") as file_a, open(file_path_b, "rb") as file_b:
+        if size >= mmap_threshold:
+            with mmap.mmap(
+                file_a.fileno(), 0, access=mmap.ACCESS_READ
+            ) as map_a, mmap.mmap(file_b.fileno(), 0, access=mmap.ACCESS_READ) as map_b:
+                for offset in range(0, size, block_size):
+                    if (
+                        map_a[offset : offset + block_size]
+                        != map_b[offset : offset + block_size]
+                    ):
+                        return False
+            return True
+
+        while True:
+            block_a = file_a.read(block_size)
+            if block_a != file_b.read(block_size):
+                return False
+            if not block_a:
+                return True
+
+
+def blocks_identical(blocks, file_path) -> bool:
+    """Check if a stream of byte blocks has the same content as a file."""
+    with open(file_path, "rb") as f:
+        for block in blocks:
+            if f.read(len(block)) != block:
+                return False
+        return not f.read(1)
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+
+# Version 0.1.0
+
+"""This module contains the SQLite store for the unpack and merge history."""
+
+# Each mod is a row in the mods table keyed by its clean name, with its version
+#   history in mod_versions and the manifest of its extracted files in mod_files.
+# Every mod is saved in its own transaction, so a crash only loses the mod in progress.
+# An existing configs/history.json is imported once the first time the database is opened.
+
+import json
+import logging
+import os
+import sqlite3
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,  # Set the log level
+    format="%(asctime)s | %(levelname)s | %(message)s",  # Set the log format
+    handlers=[
+        # Log to a file - escape any bytes that aren't valid UTF-8
+        logging.FileHandler("merge_tool.log", errors="backslashreplace"),
+        logging.StreamHandler(),  # Also log to the console
+    ],
+)
+
+# Create a logger object
+logger = logging.getLogger(__name__)
+
+# History paths: ..\configs\history.db and the legacy ..\configs\history.json
+HISTORY_DB = os.path.join(os.path.dirname(__file__), "..", "configs", "history.db")
+LEGACY_HISTORY_JSON = os.path.join(
+    os.path.dirname(__file__), "..", "configs", "history.json"
+)
+
+# Mod history keys stored as columns of the mods table
+MOD_COLUMNS = (
+    "last_modified",
+    "unpacked",
+    "merged",
+    "hash",
+    "extract_path",
+    "merged_path",
+    "merged_signature",
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS mods (
+    id INTEGER PRIMARY KEY,
+    clean_name TEXT NOT NULL UNIQUE,
+    last_modified TEXT,
+    unpacked TEXT,
+    merged TEXT,
+    hash TEXT,
+    extract_path TEXT,
+    merged_path TEXT,
+    merged_signature TEXT
+);
+CREATE TABLE IF NOT EXISTS mod_versions (
+    mod_id INTEGER NOT NULL REFERENCES mods(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    version TEXT NOT NULL,
+    PRIMARY KEY (mod_id, position)
+);
+CREATE TABLE IF NOT EXISTS mod_files (
+    mod_id INTEGER NOT NULL REFERENCES mods(id) ON DELETE CASCADE,
+    path TEXT NOT NULL,
+    PRIMARY KEY (mod_id, path)
+);
+"""
+
+
+class HistoryStore:
+    """Read and write the mod history in a SQLite database.
+
+    get returns the same dict shape history.json used, so a store can be passed
+    anywhere a history dict was read from, e.g. update_mod_version."""
+
+    def __init__(self, db_path=HISTORY_DB, legacy_json_path=LEGACY_HISTORY_JSON):
+        self.db_path = db_path
+        self.connection = sqlite3.connect(db_path)
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        with self.connection:
+            self.connection.executescript(SCHEMA)
+            self._add_missing_columns()
+
+        if legacy_json_path:
+            self.import_json_history(legacy_json_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _add_missing_columns(self) -> None:
+        """Add mods columns introduced after the database was created."""
+        existing_columns = {
+            row[1] for row in self.connection.execute("PRAGMA table_info(mods)")
+        }
+        for column in MOD_COLUMNS:
+            if column not in existing_columns:
+                self.connection.execute(f"ALTER TABLE mods ADD COLUMN {column} TEXT")
+
+    def import_json_history(self, json_path) -> int:
+        """Import a history.json file once and return the number of mods imported."""
+        imported = self.connection.execute(
+            "SELECT value FROM meta WHERE key = 'json_imported'"
+        ).fetchone()
+        if imported or not os.path.exists(json_path):
+            return 0
+
+        with open(json_path, "r", encoding="utf-8") as f:
+            history = json.load(f)
+
+        with self.connection:
+            for clean_name, mod_history in history.items():
+                self._save_mod(clean_name, mod_history)
+            self.connection.execute(
+                "INSERT INTO meta (key, value) VALUES ('json_imported', ?)",
+                (json_path,),
+            )
+
+        logger.info(
+            f"Imported {len(history)} mods from {json_path} into {self.db_path}"
+        )
+        return len(history)
+
+    def get(self, clean_name, default=None):
+        """Get the history of a mod as a dict, or default if it isn't in the history."""
+        row = self.connection.execute(
+            f"SELECT id, {', '.join(MOD_COLUMNS)} FROM mods WHERE clean_name = ?",
+            (clean_name,),
+        ).fetchone()
+        if row is None:
+            return default
+
+        mod_id = row[0]
+        mod_history = {
+            column: value for column, value in zip(MOD_COLUMNS, row[1:]) if value
+        }
+        mod_history["version"] = [
+            version
+            for (version,) in self.connection.execute(
+                "SELECT version FROM mod_versions WHERE mod_id = ? ORDER BY position",
+                (mod_id,),
+            )
+        ]
+
+        extracted_files = [
+            path
+            for (path,) in self.connection.execute(
+                "SELECT path FROM mod_files WHERE mod_id = ? ORDER BY path", (mod_id,)
+            )
+        ]
+        if extracted_files or mod_history.get("hash"):
+            mod_history["extracted_files"] = extracted_files
+
+        return mod_history
+
+    def save_mod(self, clean_name, mod_history) -> bool:
+        """Save the history of a single mod in its own transaction."""
+        with self.connection:
+            self._save_mod(clean_name, mod_history)
+        return True
+
+    def _save_mod(self, clean_name, mod_history) -> None:
+        """Replace the rows of a mod - the caller owns the transaction."""
+        values = [mod_history.get(column) for column in MOD_COLUMNS]
+        self.connection.execute(
+            f"INSERT INTO mods (clean_name, {', '.join(MOD_COLUMNS)}) "
+            f"VALUES (?, {', '.join('?' for _ in MOD_COLUMNS)}) "
+            f"ON CONFLICT(clean_name) DO UPDATE SET "
+            f"{', '.join(f'{column} = excluded.{column}' for column in MOD_COLUMNS)}",
+            [clean_name] + values,
+        )
+        (mod_id,) = self.connection.execute(
+            "SELECT id FROM mods WHERE clean_name = ?", (clean_name,)
+        ).fetchone()
+
+        self.connection.execute("DELETE FROM mod_versions WHERE mod_id = ?", (mod_id,))
+        self.connection.executemany(
+            "INSERT INTO mod_versions (mod_id, position, version) VALUES (?, ?, ?)",
+            [
+                (mod_id, position, str(version))
+                for position, version in enumerate(mod_history.get("version") or [])
+            ],
+        )
+
+        self.connection.execute("DELETE FROM mod_files WHERE mod_id = ?", (mod_id,))
+        self.connection.executemany(
+            "INSERT INTO mod_files (mod_id, path) VALUES (?, ?)",
+            [(mod_id, path) for path in mod_history.get("extracted_files") or []],
+        )
+
+    def close(self) -> None:
+        """Close the database connection."""
+        self.connection.close()
+
+
+def load_history(db_path=HISTORY_DB) -> HistoryStore:
+    """Open the history database, importing history.json the first time."""
+    return HistoryStore(db_path)
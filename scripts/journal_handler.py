@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+
+# Version 0.1.0
+
+"""This module contains the journal that lets an interrupted merge run resume at the file it stopped at."""
+
+# Every file the merge finishes is appended to <final_merged_mod_dir>.journal.jsonl as one JSON
+#   line with its outcome and the size and mtime of the files afterwards. A restarted run loads
+#   the journal into a dict and skips the files whose entry still matches the files on disk.
+# A file the merge stopped in the middle of isn't in the journal - it resumes from its own
+#   temp file and checkpoint. The journal is deleted once the whole run completes.
+
+import json
+import logging
+import os
+
+from vfs_handler import OsFileSystem
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,  # Set the log level
+    format="%(asctime)s | %(levelname)s | %(message)s",  # Set the log format
+    handlers=[
+        # Log to a file - escape any bytes that aren't valid UTF-8
+        logging.FileHandler("merge_tool.log", errors="backslashreplace"),
+        logging.StreamHandler(),  # Also log to the console
+    ],
+)
+
+# Create a logger object
+logger = logging.getLogger(__name__)
+
+JOURNAL_SUFFIX = ".journal.jsonl"
+
+
+def get_journal_path(output_dir) -> str:
+    """Get the path of the journal kept next to an output directory."""
+    return output_dir.rstrip("\\/") + JOURNAL_SUFFIX
+
+
+def get_file_stat(file_path, source_fs=None):
+    """Get the size and mtime of a file, or None if it doesn't exist.
+    Files read through another file system, e.g. out of a pak file, only have a size."""
+    if source_fs is not None and not isinstance(source_fs, OsFileSystem):
+        if not source_fs.exists(file_path):
+            return None
+        return [source_fs.getsize(file_path), None]
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def load_journal_entries(journal_path) -> dict:
+    """Load the entries of a journal keyed by new file path, or none if it doesn't exist."""
+    entries = {}
+    if not os.path.exists(journal_path):
+        return entries
+    with open(journal_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # The last line can be cut off if the run was killed while writing it
+                continue
+            entries[entry["new"]] = entry
+    return entries
+
+
+class MergeJournal:
+    """Append-only record of the files a merge run has finished."""
+
+    def __init__(self, journal_path):
+        self.journal_path = journal_path
+        self.entries = {}
+        self._file = None
+        self.load()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def load(self) -> int:
+        """Load the entries of an earlier run that didn't complete."""
+        self.entries = load_journal_entries(self.journal_path)
+        if self.entries:
+            logger.info(
+                f"Resuming from the journal of an interrupted run: {len(self.entries)} files done"
+            )
+        return len(self.entries)
+
+    def is_done(self, new_mods_item, final_merged_mod_item, source_fs=None) -> bool:
+        """Check if a file was finished by an earlier run and hasn't changed since."""
+        entry = self.entries.get(new_mods_item)
+        return (
+            entry is not None
+            and entry["final"] == final_merged_mod_item
+            and entry["final_stat"] == get_file_stat(final_merged_mod_item)
+            and entry["new_stat"] == get_file_stat(new_mods_item, source_fs)
+        )
+
+    def record(
+        self, new_mods_item, final_merged_mod_item, outcome, source_fs=None
+    ) -> None:
+        """Append a finished file to the journal."""
+        entry = {
+            "new": new_mods_item,
+            "final": final_merged_mod_item,
+            "outcome": outcome,
+            "new_stat": get_file_stat(new_mods_item, source_fs),
+            "final_stat": get_file_stat(final_merged_mod_item),
+        }
+        if self._file is None:
+            self._file = open(  # pylint: disable=consider-using-with
+                self.journal_path, "a", encoding="utf-8"
+            )
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+        self.entries[new_mods_item] = entry
+
+    def close(self) -> None:
+        """Close the journal file, keeping it for the next run."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def clear(self) -> None:
+        """Delete the journal once the run it records is complete."""
+        self.close()
+        self.entries = {}
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
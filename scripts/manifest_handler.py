@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+
+# Version 0.1.0
+
+"""This module contains functions to keep a hash manifest of the final merged mod directory."""
+
+# The manifest maps each output file's relative path to its size, mtime and content hash.
+# It is written next to the output directory, not inside it, so it is never merged or packed.
+# Files whose size and mtime match the last manifest keep their hash without being read,
+#   so only new or changed files are hashed when the manifest is refreshed.
+
+import json
+import logging
+import os
+
+from hash_handler import hash_files_parallel
+from journal_handler import get_file_stat, get_journal_path, load_journal_entries
+from walk_handler import get_relative_path, scan_files
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,  # Set the log level
+    format="%(asctime)s | %(levelname)s | %(message)s",  # Set the log format
+    handlers=[
+        # Log to a file - escape any bytes that aren't valid UTF-8
+        logging.FileHandler("merge_tool.log", errors="backslashreplace"),
+        logging.StreamHandler(),  # Also log to the console
+    ],
+)
+
+# Create a logger object
+logger = logging.getLogger(__name__)
+
+MANIFEST_SUFFIX = ".manifest.json"
+
+
+def get_manifest_path(output_dir) -> str:
+    """Get the path of the manifest file for an output directory."""
+    return output_dir.rstrip("\\/") + MANIFEST_SUFFIX
+
+
+def load_manifest(manifest_path) -> dict:
+    """Load a manifest file, or an empty manifest if it doesn't exist."""
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(manifest_path, manifest) -> bool:
+    """Write a manifest file atomically."""
+    part_path = manifest_path + ".part"
+    with open(part_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=4, sort_keys=True)
+    os.replace(part_path, manifest_path)
+    return True
+
+
+def scan_output_files(output_dir) -> dict:
+    """Stat every file below the output directory and return relative path to stat."""
+    output_files = {}
+    for entry in scan_files(output_dir, follow_symlinks=False):
+        # Skip leftover temporary files from interrupted merges
+        if entry.is_file() and not entry.name.endswith(".tmp"):
+            output_files[get_relative_path(entry.path, output_dir)] = entry.stat()
+    return output_files
+
+
+def build_manifest(output_dir, previous_manifest=None, workers=None) -> dict:
+    """Build the manifest of an output directory, reusing the hashes of unchanged files."""
+    previous_manifest = previous_manifest or {}
+    output_files = scan_output_files(output_dir)
+
+    manifest = {}
+    files_to_hash = {}
+    for relative_path, stat in output_files.items():
+        previous_entry = previous_manifest.get(relative_path)
+        if (
+            previous_entry
+            and previous_entry["size"] == stat.st_size
+            and previous_entry["mtime_ns"] == stat.st_mtime_ns
+        ):
+            manifest[relative_path] = previous_entry
+            continue
+
+        file_path = os.path.join(output_dir, *relative_path.split("/"))
+        files_to_hash[file_path] = relative_path
+        manifest[relative_path] = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+        }
+
+    logger.info(
+        f"Hashing {len(files_to_hash)} of {len(output_files)} files in {output_dir}"
+    )
+    file_hashes = hash_files_parallel(files_to_hash, workers)
+    for file_path, relative_path in files_to_hash.items():
+        if file_path not in file_hashes:
+            # The file went away or can't be read - leave it out of the manifest
+            del manifest[relative_path]
+            continue
+        manifest[relative_path]["hash"] = file_hashes[file_path]
+
+    return manifest
+
+
+def update_manifest(output_dir, workers=None) -> dict:
+    """Refresh the manifest of an output directory and save it."""
+    manifest_path = get_manifest_path(output_dir)
+    manifest = build_manifest(output_dir, load_manifest(manifest_path), workers)
+    save_manifest(manifest_path, manifest)
+    logger.info(f"Saved manifest of {len(manifest)} files to {manifest_path}")
+    return manifest
+
+
+def file_changed(manifest, output_dir, relative_path) -> bool:
+    """Check if a file changed since the manifest was written, from its stat alone."""
+    manifest_entry = manifest.get(relative_path)
+    file_path = os.path.join(output_dir, *relative_path.split("/"))
+    try:
+        stat = os.stat(file_path)
+    except FileNotFoundError:
+        return manifest_entry is not None
+
+    return (
+        manifest_entry is None
+        or manifest_entry["size"] != stat.st_size
+        or manifest_entry["mtime_ns"] != stat.st_mtime_ns
+    )
+
+
+def find_changed_files(manifest, output_dir) -> dict:
+    """Compare an output directory to its manifest by stat and list the added,
+    changed, and removed files."""
+    output_files = scan_output_files(output_dir)
+    changed_files = {"added": [], "changed": [], "removed": []}
+
+    for relative_path, stat in output_files.items():
+        manifest_entry = manifest.get(relative_path)
+        if manifest_entry is None:
+            changed_files["added"].append(relative_path)
+        elif (
+            manifest_entry["size"] != stat.st_size
+            or manifest_entry["mtime_ns"] != stat.st_mtime_ns
+        ):
+            changed_files["changed"].append(relative_path)
+
+    changed_files["removed"] = [
+        relative_path for relative_path in manifest if relative_path not in output_files
+    ]
+    for file_list in changed_files.values():
+        file_list.sort()
+    return changed_files
+
+
+def list_journaled_files(output_dir) -> set:
+    """List the output files a killed run wrote, from its resume journal, that are
+    unchanged since it wrote them."""
+    journal_entries = load_journal_entries(get_journal_path(output_dir))
+    return {
+        get_relative_path(entry["final"], output_dir)
+        for entry in journal_entries.values()
+        if entry["final_stat"] is not None
+        and entry["final_stat"] == get_file_stat(entry["final"])
+    }
+
+
+def warn_manual_edits(output_dir) -> dict:
+    """Log the files changed outside the merge tool since the last manifest was saved.
+    Files written by a run that was killed before it saved the manifest aren't edits."""
+    manifest_path = get_manifest_path(output_dir)
+    if not os.path.exists(manifest_path) or not os.path.isdir(output_dir):
+        return {"added": [], "changed": [], "removed": []}
+
+    changed_files = find_changed_files(load_manifest(manifest_path), output_dir)
+    journaled_files = list_journaled_files(output_dir)
+    for change in ("added", "changed"):
+        changed_files[change] = [
+            relative_path
+            for relative_path in changed_files[change]
+            if relative_path not in journaled_files
+        ]
+    for change, file_list in changed_files.items():
+        for relative_path in file_list:
+            logger.warning(f"File {change} since the last merge: {relative_path}")
+    return changed_files
@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+
+# Version 0.1.0
+
+"""This module contains a long running merge daemon that keeps its caches warm between requests."""
+
+# Usage:    python merge_daemon.py [--socket=<socket_path>] [--verbose]
+# Clients:  python merge_tool.py --daemon_socket=<socket_path> ...
+#           python format_dir.py --daemon_socket=<socket_path> ...
+# The requirements are validated once, the config is reloaded only when it changes,
+#   and output manifests are kept in memory and reloaded after every merge.
+# File hashes, formatted files and hunk counts are kept in memory while the files they
+#   were computed from are unchanged - merges skip formatting the files formatted before.
+# Requests are handled one at a time - merge prompts are shown in the daemon's console.
+
+import argparse
+import logging
+import os
+import socket
+
+from conflict_handler import build_conflict_matrix
+from daemon_handler import get_socket_path, read_message, write_message
+from format_dir import format_files, list_format_files, log_format_report
+from hash_handler import hash_files_parallel
+from journal_handler import MergeJournal, get_journal_path
+from manifest_handler import (
+    build_manifest,
+    find_changed_files,
+    get_manifest_path,
+    load_manifest,
+    save_manifest,
+    warn_manual_edits,
+)
+from merge_tool import merge_directories
+from requirements_handler import load_config, validate_requirements
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,  # Set the log level
+    format="%(asctime)s | %(levelname)s | %(message)s",  # Set the log format
+    handlers=[
+        # Log to a file - escape any bytes that aren't valid UTF-8
+        logging.FileHandler("merge_tool.log", errors="backslashreplace"),
+        logging.StreamHandler(),  # Also log to the console
+    ],
+)
+
+# Create a logger object
+logger = logging.getLogger(__name__)
+
+CONFIG_PATH = os.path.join(os.path.dirname(__file__), "..", "configs", "config.json")
+
+
+def stat_key(file_path):
+    """Get the size and mtime of a file, or None if it doesn't exist."""
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return (stat.st_size, stat.st_mtime_ns)
+
+
+def is_socket_live(socket_path) -> bool:
+    """Check if something is listening on a Unix socket."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        try:
+            client.connect(socket_path)
+        except OSError:
+            return False
+    return True
+
+
+class StatCache:
+    """Cache a value per file that is dropped once the file's size or mtime changes."""
+
+    def __init__(self):
+        self.entries = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, file_path):
+        """Get the cached value of a file, or None if it changed since it was cached."""
+        entry = self.entries.get(file_path)
+        if entry is None:
+            return None
+        if entry[0] != stat_key(file_path):
+            del self.entries[file_path]
+            return None
+        return entry[1]
+
+    def set(self, file_path, value) -> None:
+        """Cache a value for the current state of a file."""
+        key = stat_key(file_path)
+        if key is not None:
+            self.entries[file_path] = (key, value)
+
+
+class MergeDaemon:
+    """Serve merge, format and query requests with warm caches."""
+
+    def __init__(self):
+        self.valid_requirements = validate_requirements()
+        self.config = {}
+        self.config_key = None
+        self.reload_config()
+
+        self.hash_cache = StatCache()
+        self.format_cache = StatCache()
+        self.hunk_cache = {}
+        self.manifests = {}
+        self.running = True
+
+    def reload_config(self) -> dict:
+        """Reload the config file if it changed since it was last loaded."""
+        config_key = stat_key(CONFIG_PATH)
+        if config_key != self.config_key:
+            self.config = load_config("config.json")
+            self.config_key = config_key
+            logger.info("Loaded config.json")
+        return self.config
+
+    def hash_files(self, file_paths, workers=None) -> dict:
+        """Hash files, only reading the ones that changed since they were last hashed."""
+        file_hashes = {}
+        files_to_hash = []
+        for file_path in file_paths:
+            file_hash = self.hash_cache.get(file_path)
+            if file_hash is None:
+                files_to_hash.append(file_path)
+            else:
+                file_hashes[file_path] = file_hash
+
+        for file_path, file_hash in hash_files_parallel(files_to_hash, workers).items():
+            self.hash_cache.set(file_path, file_hash)
+            file_hashes[file_path] = file_hash
+        return file_hashes
+
+    def get_manifest(self, output_dir) -> dict:
+        """Get the manifest of an output directory from memory or from disk."""
+        if output_dir not in self.manifests:
+            self.manifests[output_dir] = load_manifest(get_manifest_path(output_dir))
+        return self.manifests[output_dir]
+
+    def reload_manifest(self, output_dir) -> dict:
+        """Drop the manifest of an output directory from memory and load it from disk."""
+        self.manifests.pop(output_dir, None)
+        return self.get_manifest(output_dir)
+
+    def merge(self, request) -> dict:
+        """Merge a mod directory into the final merged mod directory.
+        The manifest of the output is reloaded afterwards, also if the merge failed."""
+        final_merged_mod_dir = request["final_merged_mod_dir"]
+        try:
+            return self.run_merge(request)
+        finally:
+            self.reload_manifest(final_merged_mod_dir)
+
+    def run_merge(self, request) -> dict:
+        """Merge a mod directory with the warm format cache and record its manifest."""
+        new_mods_dir = request["new_mods_dir"]
+        final_merged_mod_dir = request["final_merged_mod_dir"]
+
+        config = self.config
+        if request.get("bulk_review"):
+            config = dict(config, bulk_review=True)
+
+        warn_manual_edits(final_merged_mod_dir)
+        with MergeJournal(get_journal_path(final_merged_mod_dir)) as journal:
+            result = merge_directories(
+                new_mods_dir,
+                final_merged_mod_dir,
+                self.valid_requirements,
+                config,
+                request.get("confirm", False),
+                request.get("org_comp", False),
+                journal=journal,
+                format_cache=self.format_cache,
+            )
+            if result != "quit":
+                journal.clear()
+
+        # Record the output also when the user quit partway, so the files merged so
+        #   far aren't reported as edited by hand next run
+        manifest = build_manifest(
+            final_merged_mod_dir,
+            self.get_manifest(final_merged_mod_dir),
+            self.config.get("manifest_workers"),
+        )
+        save_manifest(get_manifest_path(final_merged_mod_dir), manifest)
+        if result == "quit":
+            return {"status": "quit"}
+        return {"status": "merged", "files": len(manifest)}
+
+    def format(self, request) -> dict:
+        """Format the cfg files in a directory that changed since they were last formatted."""
+        format_dir = request["format_dir"]
+        file_paths = list_format_files(format_dir)
+        cfg_file_paths = [f for f in file_paths if f.endswith(".cfg")]
+        changed_file_paths = [
+            f for f in cfg_file_paths if self.format_cache.get(f) is None
+        ]
+
+        logger.info(
+            f"Formatting {len(changed_file_paths)} of {len(cfg_file_paths)} changed cfg files in {format_dir}"
+        )
+        workers = request.get("workers") or self.config.get("format_workers")
+        report = format_files(
+            changed_file_paths, self.config["max_perf_chunk_size"], workers
+        )
+        report["skipped"] += len(file_paths) - len(changed_file_paths)
+        log_format_report(report)
+
+        # Formatting a file that is already formatted leaves it as is, so only
+        #   files that need attention are formatted again next time
+        needs_attention = set(report["error"]) | {
+            bad_depth_file["file_path"] for bad_depth_file in report["bad_depth"]
+        }
+        for file_path in changed_file_paths:
+            if file_path not in needs_attention:
+                self.format_cache.set(file_path, True)
+
+        report["status"] = (
+            "formatted" if not needs_attention else "formatted_with_errors"
+        )
+        return report
+
+    def query(self, request) -> dict:
+        """Answer a question about files without changing them."""
+        query = request.get("query")
+        if query == "hash":
+            file_hashes = self.hash_files(
+                request["file_paths"], self.config.get("manifest_workers")
+            )
+            return {"status": "ok", "hashes": file_hashes}
+        if query == "changed":
+            output_dir = request["final_merged_mod_dir"]
+            changed_files = find_changed_files(
+                self.get_manifest(output_dir), output_dir
+            )
+            return {"status": "ok", "changed": changed_files}
+        if query == "conflicts":
+            report = build_conflict_matrix(
+                request["new_mods_dir"],
+                request.get("final_merged_mod_dir"),
+                self.config.get("valid_file_extensions"),
+                self.config.get("analyze_workers"),
+                self.hash_files,
+                self.hunk_cache,
+            )
+            report["status"] = "ok"
+            return report
+        if query == "stats":
+            return {
+                "status": "ok",
+                "hashes": len(self.hash_cache),
+                "formatted": len(self.format_cache),
+                "hunks": len(self.hunk_cache),
+                "manifests": len(self.manifests),
+            }
+        return {"status": "error", "error": f"Unknown query: {query}"}
+
+    def handle_request(self, request) -> dict:
+        """Run a single request and return its response.
+        Any error is returned as the response so the daemon keeps serving."""
+        command = None
+        try:
+            command = request.get("command")
+            logger.info(f"Request: {command}")
+            self.reload_config()
+            if command == "merge":
+                return self.merge(request)
+            if command == "format":
+                return self.format(request)
+            if command == "query":
+                return self.query(request)
+            if command == "shutdown":
+                self.running = False
+                return {"status": "ok"}
+        except Exception as e:  # pylint: disable=broad-except
+            logger.error(f"Error handling {command} request")
+            logger.error(e)
+            return {"status": "error", "error": f"{type(e).__name__}: {e}"}
+        return {"status": "error", "error": f"Unknown command: {command}"}
+
+    def handle_connection(self, connection) -> None:
+        """Answer every request sent on a connection until the client closes it."""
+        with connection, connection.makefile("rwb") as stream:
+            while self.running:
+                try:
+                    request = read_message(stream)
+                except ValueError as e:
+                    write_message(stream, {"status": "error", "error": str(e)})
+                    continue
+                if request is None:
+                    return
+                write_message(stream, self.handle_request(request))
+
+    def serve(self, socket_path) -> None:
+        """Listen on a Unix socket until a shutdown request or Ctrl+C."""
+        if not hasattr(socket, "AF_UNIX"):
+            raise OSError("Unix sockets are not available on this platform")
+
+        if os.path.exists(socket_path):
+            if is_socket_live(socket_path):
+                raise OSError(
+                    f"Another merge daemon is already listening on {socket_path}"
+                )
+            # A socket file left behind by a daemon that didn't shut down cleanly
+            logger.info(f"Removing stale socket: {socket_path}")
+            os.remove(socket_path)
+
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+            server.bind(socket_path)
+            server.listen()
+            logger.info(f"Merge daemon listening on {socket_path}")
+            try:
+                while self.running:
+                    connection, _ = server.accept()
+                    try:
+                        self.handle_connection(connection)
+                    except (BrokenPipeError, ConnectionResetError):
+                        logger.warning(
+                            "Client disconnected before the response was sent"
+                        )
+            except KeyboardInterrupt:
+                pass
+            finally:
+                os.remove(socket_path)
+        logger.info("Merge daemon stopped")
+
+
+def main() -> bool:
+    """Main function to run the merge daemon."""
+    # Define the command-line arguments
+    parser = argparse.ArgumentParser(description="Run the merge daemon.")
+    parser.add_argument(
+        "--socket",
+        help="The Unix socket to listen on (defaults to daemon_socket in the config)",
+        required=False,
+    )
+    parser.add_argument(
+        "--verbose", action="store_true", help="Enable verbose output", required=False
+    )
+    args = parser.parse_args()
+
+    # Update log level if verbose is set
+    if args.verbose:
+        logger.setLevel(logging.DEBUG)
+
+    daemon = MergeDaemon()
+    try:
+        daemon.serve(args.socket or get_socket_path(daemon.config))
+    except OSError as e:
+        logger.error(e)
+        return False
+    return True
+
+
+if __name__ == "__main__":
+    main()
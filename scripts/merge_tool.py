@@ -27,20 +27,49 @@
 
 import os
 import shutil
-import difflib
 import argparse
 import time
 import logging
 import json
 
+from daemon_handler import send_request
 from choice_handler import (
+    bulk_review_choice_handler,
     choice_handler,
+    split_display_hunks,
+    summarize_hunk,
     non_text_file_choice_handler,
     open_files_in_vscode_compare,
     bad_format_choice_handler,
 )
 from requirements_handler import validate_requirements, load_config
-from format_handler import format_file, duplicate_line_check, display_file_parts
+from format_handler import (
+    format_file,
+    duplicate_line_check,
+    display_file_parts,
+    decode_lines,
+    encode_lines,
+    lines_equal,
+    load_compare_settings,
+    unified_diff_lines,
+)
+from write_handler import MergeWriter, load_write_settings, truncate_to_checkpoint
+from pipeline_handler import BackgroundWorker, Prefetcher, get_queue_depth, warm_file
+from spill_handler import SpillList, fit_chunk_size, get_memory_budget, get_spill_bytes
+from manifest_handler import update_manifest, warn_manual_edits
+from journal_handler import MergeJournal, get_journal_path
+from vfs_handler import OsFileSystem
+from walk_handler import walk_tree
+from struct_tree_handler import (
+    SEGMENT_CHANGED,
+    SEGMENT_EQUAL,
+    SEGMENT_MOVED,
+    coalesce_segments,
+    diff_struct_trees,
+    iter_segment_chunks,
+    load_struct_tree,
+    read_lines,
+)
 
 
 # Set up logging
@@ -48,7 +77,8 @@ logging.basicConfig(
     level=logging.INFO,  # Set the log level
     format="%(asctime)s | %(levelname)s | %(message)s",  # Set the log format
     handlers=[
-        logging.FileHandler("merge_tool.log"),  # Log to a file
+        # Log to a file - escape any bytes that aren't valid UTF-8
+        logging.FileHandler("merge_tool.log", errors="backslashreplace"),
         logging.StreamHandler(),  # Also log to the console
     ],
 )
@@ -56,31 +86,159 @@ logging.basicConfig(
 # Create a logger object
 logger = logging.getLogger(__name__)
 
+# Memory a bulk review hunk summary takes besides its changed lines
+HUNK_OVERHEAD = 512
+
 
 def reload_temp_merged_mod_file(temp_merged_mod_file) -> int:
     """Reload the temporary merged mod file and return the last processed line."""
     if not os.path.exists(temp_merged_mod_file):
         return 0
 
-    with open(temp_merged_mod_file, "r", encoding="utf-8") as tmp_merged_mod:
-        lines = tmp_merged_mod.readlines()
-        last_processed_line = len(lines)
+    with open(temp_merged_mod_file, "rb") as tmp_merged_mod:
+        last_processed_line = sum(1 for _ in tmp_merged_mod)
 
     return last_processed_line
 
 
+def iter_line_chunks(final_merged_mod, new_mod, max_perf_chunk_size):
+    """Read two open files side by side and yield (final_chunk, new_chunk, kind)
+    of max_perf_chunk_size lines each until both files end."""
+    while True:
+        final_merged_mod_chunk = read_lines(final_merged_mod, max_perf_chunk_size)
+        new_mod_chunk = read_lines(new_mod, max_perf_chunk_size)
+        if not new_mod_chunk and not final_merged_mod_chunk:
+            return
+        yield final_merged_mod_chunk, new_mod_chunk, SEGMENT_CHANGED
+
+
+def read_chunk_pairs(
+    new_mods_file,
+    final_merged_mod_file,
+    segments,
+    max_perf_chunk_size,
+    done_chunks,
+    last_processed_line,
+    compare_settings=None,
+):
+    """Read the chunk pairs left to merge, skipping what was merged before the merge
+    was interrupted. Yields (perf_chunk, final_line, final_chunk, new_chunk, kind) where
+    final_line is the final merged mod line the chunk starts at, and chunks that are
+    equal once normalized are marked as equal."""
+    with open(new_mods_file, "rb") as new_mod, open(
+        final_merged_mod_file, "rb"
+    ) as final_merged_mod:
+        if segments is not None:
+            chunk_pairs = iter_segment_chunks(
+                final_merged_mod, new_mod, segments, max_perf_chunk_size
+            )
+            # Skip the chunks committed before the merge was interrupted
+            perf_chunk = done_chunks
+            final_line = 0
+            for _ in range(done_chunks):
+                final_merged_mod_chunk, _, _ = next(chunk_pairs, ([], [], None))
+                final_line += len(final_merged_mod_chunk)
+        else:
+            # if last_processed_line is not 0, skip to the last processed line
+            for _ in range(last_processed_line):
+                next(new_mod, None)
+                next(final_merged_mod, None)
+            chunk_pairs = iter_line_chunks(
+                final_merged_mod, new_mod, max_perf_chunk_size
+            )
+            perf_chunk = 0
+            final_line = last_processed_line
+
+        for final_merged_mod_chunk, new_mod_chunk, kind in chunk_pairs:
+            perf_chunk += 1
+            if kind == SEGMENT_CHANGED and lines_equal(
+                new_mod_chunk, final_merged_mod_chunk, compare_settings
+            ):
+                kind = SEGMENT_EQUAL
+            yield perf_chunk, final_line, final_merged_mod_chunk, new_mod_chunk, kind
+            final_line += len(final_merged_mod_chunk)
+
+
+def review_file_hunks(
+    new_mods_file,
+    final_merged_mod_file,
+    segments,
+    config,
+    compare_settings,
+    max_perf_chunk_size,
+    done_chunks,
+    last_processed_line,
+) -> dict:
+    """List every hunk left to merge in a file and let the user set decisions for
+    them in one step. Returns the decisions keyed by (perf chunk, display chunk index).
+    """
+    # The hunks of a huge file spill to disk past their share of the memory budget
+    hunks = SpillList(
+        get_spill_bytes(get_memory_budget(config)),
+        size_of=lambda hunk: sum(map(len, hunk["changed_lines"])) + HUNK_OVERHEAD,
+    )
+    hunk_keys = []
+    chunk_pairs = read_chunk_pairs(
+        new_mods_file,
+        final_merged_mod_file,
+        segments,
+        max_perf_chunk_size,
+        done_chunks,
+        last_processed_line,
+        compare_settings,
+    )
+    # The same chunks and diffs as the merge loop, so the hunks line up with its prompts
+    with Prefetcher(chunk_pairs, get_queue_depth(config)) as chunk_pairs:
+        for perf_chunk, final_line, final_chunk, new_chunk, kind in chunk_pairs:
+            if kind != SEGMENT_CHANGED:
+                continue
+            diff = unified_diff_lines(
+                decode_lines(final_chunk),
+                decode_lines(new_chunk),
+                fromfile=final_merged_mod_file,
+                tofile=new_mods_file,
+                compare_settings=compare_settings,
+            )
+            for index, hunk_lines in enumerate(split_display_hunks(diff)):
+                hunks.append(summarize_hunk(hunk_lines, final_line))
+                hunk_keys.append((perf_chunk, index))
+
+    # A single hunk is no quicker to review in bulk
+    if len(hunks) < config.get("bulk_review_min_hunks", 2):
+        return {"status": "continue", "decisions": {}}
+
+    review = bulk_review_choice_handler(hunks, final_merged_mod_file, new_mods_file)
+    if review["status"] == "quit":
+        return review
+
+    return {
+        "status": "continue",
+        "decisions": {
+            hunk_key: action
+            for hunk_key, action in zip(hunk_keys, review["decisions"])
+            if action
+        },
+    }
+
+
 def merge_files(
     new_mods_file,
     final_merged_mod_file,
     valid_requirements,
     config,
     confirm_user_choice=False,
+    format_cache=None,
 ) -> str:
-    """Merge the contents of two text files, handling conflicts."""
-    max_perf_chunk_size = config[
-        "max_perf_chunk_size"
-    ]  # Define the chunk size for reading the files
-    perf_chunk = 0  # Initialize the performance chunk counter
+    """Merge the contents of two text files, handling conflicts.
+    Files already in format_cache aren't formatted again before they are compared."""
+    # Define the chunk size for reading the files, lowered if it doesn't fit the memory budget
+    memory_budget = get_memory_budget(config)
+    max_perf_chunk_size = fit_chunk_size(
+        config["max_perf_chunk_size"],
+        [new_mods_file, final_merged_mod_file],
+        memory_budget,
+    )
+    spill_bytes = get_spill_bytes(memory_budget)
     quit_out_bool = False
     skip_file_bool = False
     overwrite_file_bool = False
@@ -90,10 +248,7 @@ def merge_files(
     final_merged_mod_filepath_no_ext, _ = os.path.splitext(final_merged_mod_file)
     perf_chunk_sizes_file = final_merged_mod_filepath_no_ext + "_perf_chunk_sizes.tmp"
 
-    # Reload the perf_chunk_sizes_file to get the final_perf_chunk_sizes
-    if os.path.exists(perf_chunk_sizes_file):
-        with open(perf_chunk_sizes_file, "r", encoding="utf-8") as f:
-            final_perf_chunk_sizes = json.loads(f.read())
+    write_settings = load_write_settings(config)
 
     display_file_parts(final_merged_mod_file, new_mods_file)
 
@@ -101,59 +256,128 @@ def merge_files(
 
     # Create a temporary file to store the merged contents
     temp_merged_mod_file = final_merged_mod_file + ".tmp"
-    # Check if the temporary file exists and reload the last processed line
-    last_processed_line = reload_temp_merged_mod_file(temp_merged_mod_file)
-
-    # Pre-format the files before reading them
-    format_file(new_mods_file, max_perf_chunk_size)
-    format_file(final_merged_mod_file, max_perf_chunk_size)
 
-    with open(new_mods_file, "r", encoding="utf-8") as new_mod, open(
-        final_merged_mod_file, "r", encoding="utf-8"
-    ) as final_merged_mod, open(
-        temp_merged_mod_file, "a", encoding="utf-8"
+    # Reload the perf_chunk_sizes_file checkpoint to get the final_perf_chunk_sizes
+    #   and drop anything written to the temp file after the last checkpoint
+    if os.path.exists(perf_chunk_sizes_file):
+        with open(perf_chunk_sizes_file, "r", encoding="utf-8") as f:
+            final_perf_chunk_sizes = json.loads(f.read())
+        last_processed_line = truncate_to_checkpoint(
+            temp_merged_mod_file, sum(final_perf_chunk_sizes)
+        )
+    else:
+        # Check if the temporary file exists and reload the last processed line
+        last_processed_line = reload_temp_merged_mod_file(temp_merged_mod_file)
+
+    # cfg files are compared with their lines normalized, which leaves the files as they
+    #   are on disk - without normalizing, they are formatted first to make them comparable
+    compare_settings = None
+    if new_mods_file.endswith(".cfg") and final_merged_mod_file.endswith(".cfg"):
+        compare_settings = load_compare_settings(config)
+    if compare_settings is None or not compare_settings["ignore_whitespace"]:
+        # Pre-format the files before reading them
+        for file_path in (new_mods_file, final_merged_mod_file):
+            if format_cache is not None and format_cache.get(file_path):
+                continue
+            if format_file(file_path, max_perf_chunk_size) and format_cache is not None:
+                format_cache.set(file_path, True)
+
+    # Compare cfg files struct by struct so only the changed structs are diffed.
+    #   A temp file without a checkpoint was written by the line by line comparison.
+    segments = None
+    if (
+        config.get("struct_tree_compare", True)
+        and new_mods_file.endswith(".cfg")
+        and final_merged_mod_file.endswith(".cfg")
+        and (final_perf_chunk_sizes or not last_processed_line)
+    ):
+        segments = coalesce_segments(
+            diff_struct_trees(
+                load_struct_tree(final_merged_mod_file, compare_settings),
+                load_struct_tree(new_mods_file, compare_settings),
+            ),
+            max_perf_chunk_size,
+        )
+        changed_line_count = sum(
+            segment[4] - segment[3]
+            for segment in segments
+            if segment[0] == SEGMENT_CHANGED
+        )
+        logger.info(f"Changed lines to compare: {changed_line_count}")
+        for segment in segments:
+            if segment[0] == SEGMENT_MOVED:
+                if segment[2] > segment[1]:
+                    logger.info(
+                        f"Block moved away from lines {segment[1] + 1}-{segment[2]} of {final_merged_mod_file}"
+                    )
+                if segment[4] > segment[3]:
+                    logger.info(
+                        f"Block moved to lines {segment[3] + 1}-{segment[4]} of {new_mods_file} | Taking the new mod's order"
+                    )
+
+    # Let the user set decisions for every hunk of the file before any are applied
+    bulk_decisions = {}
+    if config.get("bulk_review", False):
+        review = review_file_hunks(
+            new_mods_file,
+            final_merged_mod_file,
+            segments,
+            config,
+            compare_settings,
+            max_perf_chunk_size,
+            len(final_perf_chunk_sizes),
+            last_processed_line,
+        )
+        if review["status"] == "quit":
+            return "quit"
+        bulk_decisions = review["decisions"]
+
+    # Compare the files as bytes - only chunks that differ are decoded for the user.
+    #   The next chunks are read and compared on a background thread while the user
+    #   answers a prompt, and the temp file is written on another.
+    chunk_pairs = read_chunk_pairs(
+        new_mods_file,
+        final_merged_mod_file,
+        segments,
+        max_perf_chunk_size,
+        len(final_perf_chunk_sizes),
+        last_processed_line,
+        compare_settings,
+    )
+    with Prefetcher(chunk_pairs, get_queue_depth(config)) as chunk_pairs, MergeWriter(
+        temp_merged_mod_file,
+        perf_chunk_sizes_file,
+        final_perf_chunk_sizes,
+        write_settings,
     ) as temp_merged_mod:
-        # if last_processed_line is not 0, skip to the last processed line
-        if last_processed_line:
-            for _ in range(last_processed_line):
-                next(new_mod)
-                next(final_merged_mod)
-
-        # Loop through the merge files until the end of the two files
-        while True:
-            # Read a chunk of lines from each file based on the chunk size
-            perf_chunk += 1
-            new_mod_chunk = [
-                line
-                for line in (next(new_mod, None) for _ in range(max_perf_chunk_size))
-                if line is not None
-            ]
-            final_merged_mod_chunk = [
-                line
-                for line in (
-                    next(final_merged_mod, None) for _ in range(max_perf_chunk_size)
-                )
-                if line is not None
-            ]
-
-            if not new_mod_chunk and not final_merged_mod_chunk:
-                break
+        # Loop through the chunks until the end of the two files
+        for perf_chunk, _, final_merged_mod_chunk, new_mod_chunk, kind in chunk_pairs:
+            if kind == SEGMENT_MOVED:
+                # Blocks that only moved are taken in the new mod's order without a prompt
+                temp_merged_mod.write_chunk(new_mod_chunk)
+                continue
 
-            if new_mod_chunk == final_merged_mod_chunk:
-                # If the chunks are identical, write the final_merged_mod_chunk to the temporary file
-                final_perf_chunk_sizes.append(len(final_merged_mod_chunk))
-                temp_merged_mod.writelines(final_merged_mod_chunk)
-                temp_merged_mod.flush()  # Flush the buffer to write the lines to the file
+            if kind == SEGMENT_EQUAL:
+                # If the chunks are identical, buffer the final_merged_mod_chunk for the temporary file
+                temp_merged_mod.write_chunk(final_merged_mod_chunk)
                 continue
 
-            # Use difflib to create a unified diff for the chunk
-            diff = difflib.unified_diff(
+            final_merged_mod_chunk = decode_lines(final_merged_mod_chunk)
+            new_mod_chunk = decode_lines(new_mod_chunk)
+
+            # Create a unified diff for the chunk - lines that are equal once normalized
+            #   are context lines, so whitespace only changes don't become hunks
+            diff = unified_diff_lines(
                 final_merged_mod_chunk,
                 new_mod_chunk,
                 fromfile=final_merged_mod_file,
                 tofile=new_mods_file,
+                compare_settings=compare_settings,
             )
 
+            # Write out the buffered chunks so the temp file views show the current state
+            temp_merged_mod.flush()
+
             logger.info("\n\nHandling diff...")
             # Handle the user's choice for the diff
             choice = choice_handler(
@@ -167,6 +391,12 @@ def merge_files(
                 last_display_diff,
                 last_user_choice,
                 confirm_user_choice,
+                {
+                    index: action
+                    for (chunk, index), action in bulk_decisions.items()
+                    if chunk == perf_chunk
+                },
+                spill_bytes,
             )
 
             if choice["status"] == "skip":
@@ -178,19 +408,21 @@ def merge_files(
                 break
 
             if choice["status"] == "quit-save":
-                # Scan temp lines for duplicate lines caused by matching lines crossing over chunks
-                cleansed_lines = duplicate_line_check(
-                    temp_merged_mod_file,
-                    choice["processed_lines"],
-                    perf_chunk,
-                    final_perf_chunk_sizes,
-                )
-                final_perf_chunk_sizes.append(len(cleansed_lines))
-                temp_merged_mod.writelines(cleansed_lines)
-
-                # Write final_perf_chunk_sizes to a file to track the chunk sizes
-                with open(perf_chunk_sizes_file, "w", encoding="utf-8") as f:
-                    f.write(json.dumps(final_perf_chunk_sizes))
+                cleansed_lines = encode_lines(choice["processed_lines"])
+                # Struct chunks end on struct boundaries, so only fixed chunks can have
+                #   duplicate lines caused by matching lines crossing over chunks
+                if segments is None:
+                    cleansed_lines = duplicate_line_check(
+                        temp_merged_mod_file,
+                        cleansed_lines,
+                        perf_chunk,
+                        final_perf_chunk_sizes,
+                        temp_merged_mod.last_chunk_lines,
+                    )
+                temp_merged_mod.write_chunk(cleansed_lines)
+
+                # Commit the temp file and the final_perf_chunk_sizes checkpoint
+                temp_merged_mod.commit()
 
                 return "quit"
 
@@ -198,20 +430,25 @@ def merge_files(
                 quit_out_bool = True
                 break
 
-            # Scan temp lines for duplicate lines caused by matching lines crossing over chunks
-            cleansed_lines = duplicate_line_check(
-                temp_merged_mod_file,
-                choice["processed_lines"],
-                perf_chunk,
-                final_perf_chunk_sizes,
-            )
+            cleansed_lines = encode_lines(choice["processed_lines"])
+            # Struct chunks end on struct boundaries, so only fixed chunks can have
+            #   duplicate lines caused by matching lines crossing over chunks
+            if segments is None:
+                cleansed_lines = duplicate_line_check(
+                    temp_merged_mod_file,
+                    cleansed_lines,
+                    perf_chunk,
+                    final_perf_chunk_sizes,
+                    temp_merged_mod.last_chunk_lines,
+                )
             last_display_diff = choice["last_display_diff"]
             last_user_choice = choice["last_user_choice"]
 
-            # Write the new lines to the temporary file
-            final_perf_chunk_sizes.append(len(cleansed_lines))
-            temp_merged_mod.writelines(cleansed_lines)
-            temp_merged_mod.flush()  # Flush the buffer to write the lines to the file
+            # Buffer the new lines for the temporary file
+            temp_merged_mod.write_chunk(cleansed_lines)
+
+        if not quit_out_bool and not skip_file_bool and not overwrite_file_bool:
+            temp_merged_mod.commit()
 
     if not quit_out_bool and not skip_file_bool and not overwrite_file_bool:
         # Validate the formatting of the temp_merged_mod_file
@@ -255,6 +492,98 @@ def merge_files(
     return "continue"
 
 
+def merge_file(
+    new_mods_item,
+    final_merged_mod_item,
+    valid_requirements,
+    config,
+    confirm_user_choice=False,
+    org_comp=False,
+    source_fs=None,
+    final_exists=None,
+    format_cache=None,
+) -> str:
+    """Merge a single new mod file into the final merged mod file.
+    final_exists can be passed in if the caller already knows if the final file exists.
+    """
+    if source_fs is None:
+        source_fs = OsFileSystem()
+    if final_exists is None:
+        final_exists = os.path.exists(final_merged_mod_item)
+
+    # logger.debug(f"New Mods Item is a file: {new_mods_item}")
+
+    # Check if the final merged mod file exists and just copy it over if it doesn't
+    #   Unless the org_comp flag is set, then don't copy over the file
+    if not final_exists and not org_comp:
+        logger.info(
+            f"Final merged mod file does not exist. Copying {new_mods_item} to {final_merged_mod_item}"
+        )
+        source_fs.copy_file(new_mods_item, final_merged_mod_item)
+        return "continue"
+
+    if not final_exists and org_comp:
+        logger.debug(
+            f"Final merged mod file does not exist: {final_merged_mod_item}\n\tSkipping Merge of: {new_mods_item}"
+        )
+        return "continue"
+
+    # Validate the file extension to ensure it's a text file and not a binary file
+    file_extension = os.path.splitext(new_mods_item)[1]
+    valid_file_extensions = config["valid_file_extensions"]
+
+    # Skip binary files that are byte-identical without prompting or copying
+    if file_extension not in valid_file_extensions and source_fs.same_content(
+        new_mods_item, final_merged_mod_item
+    ):
+        logger.debug(f"Skipping identical non-text file: {new_mods_item}")
+        return "continue"
+
+    if (
+        file_extension not in valid_file_extensions
+        and confirm_user_choice
+        and not org_comp
+    ):
+        logger.info("Handling non-text file.")
+        result = non_text_file_choice_handler(final_merged_mod_item, new_mods_item)
+        if result["status"] == "quit":
+            return "quit"
+
+        if result["status"] == "skip":
+            return "continue"
+
+        if result["status"] == "overwrite":
+            source_fs.copy_file(new_mods_item, final_merged_mod_item)
+        return "continue"
+
+    if file_extension not in valid_file_extensions and not org_comp:
+        logger.info("Handling non-text file.")
+        source_fs.copy_file(new_mods_item, final_merged_mod_item)
+        return "continue"
+
+    if file_extension not in valid_file_extensions:
+        return "continue"
+
+    # Only files that need merging are written to disk when reading from a pak
+    new_mods_file = source_fs.materialize(new_mods_item)
+    try:
+        result = merge_files(
+            new_mods_file,
+            final_merged_mod_item,
+            valid_requirements,
+            config,
+            confirm_user_choice,
+            format_cache,
+        )
+    finally:
+        source_fs.release(new_mods_file)
+    if result == "quit":
+        logger.info("Merge aborted.")
+        return "quit"
+
+    return "continue"
+
+
 def merge_directories(
     new_mods_dir,
     final_merged_mod_dir,
@@ -262,107 +591,93 @@ def merge_directories(
     config,
     confirm_user_choice=False,
     org_comp=False,
+    source_fs=None,
+    journal=None,
+    format_cache=None,
 ) -> str:
-    """Recursively merge the contents of two directories."""
+    """Merge the contents of two directory trees.
+    The new mods are read through source_fs, which defaults to the directory on disk
+    and can be a PakFileSystem to merge straight out of a .pak file.
+    Files finished by an interrupted run are skipped and finished files are recorded
+    if a MergeJournal is given. A format_cache, like the merge daemon's, skips
+    formatting the files it knows are formatted."""
+    if source_fs is None:
+        source_fs = OsFileSystem()
+
     # Ensure the final_merged_mod directory exists
     if not os.path.exists(final_merged_mod_dir):
         os.makedirs(final_merged_mod_dir)
 
-    new_mods_dir_list = os.listdir(new_mods_dir)
-    sorted_new_mods_dir_list = sorted(new_mods_dir_list)
+    # Walk both trees as one flat list of work items, listing each directory once
+    work_items = list(
+        walk_tree(new_mods_dir, final_merged_mod_dir, source_fs, org_comp)
+    )
 
-    # Iterate through all items in the new_mods directory
-    for item in sorted_new_mods_dir_list:
-        new_mods_item = os.path.join(new_mods_dir, item)
-        final_merged_mod_item = os.path.join(final_merged_mod_dir, item)
+    # Read the next new mod files ahead on a background thread so they come from the OS
+    #   cache by the time they are merged - the merged files are left alone as they get
+    #   replaced, and new mods read out of a pak file aren't read ahead
+    queue_depth = get_queue_depth(config)
+    warm_items = []
+    if queue_depth and isinstance(source_fs, OsFileSystem):
+        warm_items = [item["new_path"] for item in work_items if item["kind"] == "file"]
 
-        if os.path.isdir(new_mods_item):
-            # logger.debug(f"New Mods Item is a dir: {new_mods_item}")
-            if not os.path.exists(final_merged_mod_item) and not org_comp:
-                logger.info(
-                    f"Final merged mod directory does not exist. Copying {new_mods_item} to {final_merged_mod_item}"
-                )
-                shutil.copytree(new_mods_item, final_merged_mod_item)
-                continue
+    with BackgroundWorker(queue_depth if warm_items else 0) as warmer:
+        warmed_count = 0
 
-            if not os.path.exists(final_merged_mod_item) and org_comp:
-                logger.debug(
-                    f"Final merged mod directory does not exist: {final_merged_mod_item}\n\tSkipping Merge of: {new_mods_item}"
-                )
-                continue
+        for item in work_items:
+            new_mods_item = item["new_path"]
+            final_merged_mod_item = item["final_path"]
 
-            # If the item is a directory, recursively merge it
-            result = merge_directories(
-                new_mods_item,
-                final_merged_mod_item,
-                valid_requirements,
-                config,
-                confirm_user_choice,
-                org_comp,
-            )
-            if result == "quit":
-                return "quit"
-        else:
-            # If the item is a file, handle conflicts
-            # logger.debug(f"New Mods Item is a file: {new_mods_item}")
+            # Keep the queue filled with the next files, without waiting for room
+            while warmed_count < len(warm_items) and warmer.submit(
+                warm_file, warm_items[warmed_count], block=False
+            ):
+                warmed_count += 1
 
-            # Check if the final merged mod file exists and just copy it over if it doesn't
-            #   Unless the org_comp flag is set, then don't copy over the file
-            if not os.path.exists(final_merged_mod_item) and not org_comp:
+            if item["kind"] == "copy_dir":
                 logger.info(
-                    f"Final merged mod file does not exist. Copying {new_mods_item} to {final_merged_mod_item}"
+                    f"Final merged mod directory does not exist. Copying {new_mods_item} to {final_merged_mod_item}"
                 )
-                shutil.copy2(new_mods_item, final_merged_mod_item)
+                source_fs.copy_tree(new_mods_item, final_merged_mod_item)
                 continue
 
-            if not os.path.exists(final_merged_mod_item) and org_comp:
+            if item["kind"] == "missing_dir":
                 logger.debug(
-                    f"Final merged mod file does not exist: {final_merged_mod_item}\n\tSkipping Merge of: {new_mods_item}"
+                    f"Final merged mod directory does not exist: {final_merged_mod_item}\n\tSkipping Merge of: {new_mods_item}"
                 )
                 continue
 
-            # Validate the file extension to ensure it's a text file and not a binary file
-            file_extension = os.path.splitext(new_mods_item)[1]
-            valid_file_extensions = config["valid_file_extensions"]
-
-            if (
-                file_extension not in valid_file_extensions
-                and confirm_user_choice
-                and not org_comp
+            # Skip the files finished before the run was interrupted
+            if journal is not None and journal.is_done(
+                new_mods_item, final_merged_mod_item, source_fs
             ):
-                logger.info("Handling non-text file.")
-                result = non_text_file_choice_handler(
-                    final_merged_mod_item, new_mods_item
-                )
-                if result["status"] == "quit":
-                    return "quit"
-
-                if result["status"] == "skip":
-                    continue
-
-                if result["status"] == "overwrite":
-                    shutil.copy2(new_mods_item, final_merged_mod_item)
-                continue
-
-            if file_extension not in valid_file_extensions and not org_comp:
-                logger.info("Handling non-text file.")
-                shutil.copy2(new_mods_item, final_merged_mod_item)
+                logger.debug(f"Already merged by the interrupted run: {new_mods_item}")
                 continue
 
-            if file_extension not in valid_file_extensions:
-                continue
-
-            result = merge_files(
+            # If the item is a file, handle conflicts
+            result = merge_file(
                 new_mods_item,
                 final_merged_mod_item,
                 valid_requirements,
                 config,
                 confirm_user_choice,
+                org_comp,
+                source_fs,
+                item["final_exists"],
+                format_cache,
             )
             if result == "quit":
-                logger.info("Merge aborted.")
                 return "quit"
 
+            if journal is not None:
+                if item["final_exists"]:
+                    outcome = "merged"
+                elif not org_comp:
+                    outcome = "copied"
+                else:
+                    outcome = "skipped"
+                journal.record(new_mods_item, final_merged_mod_item, outcome, source_fs)
+
     return "continue"
 
 
@@ -393,6 +708,17 @@ def main() -> bool:
         help="The directory containing the final merged mods",
         required=True,
     )
+    parser.add_argument(
+        "--bulk_review",
+        action="store_true",
+        help="Review every hunk of a file at once before any are applied",
+        required=False,
+    )
+    parser.add_argument(
+        "--daemon_socket",
+        help="Send the merge to the merge daemon listening on this socket",
+        required=False,
+    )
     args = parser.parse_args()
 
     # Update log level if verbose is set
@@ -403,21 +729,57 @@ def main() -> bool:
     logger.debug(f"Verbose: {args.verbose}")
     logger.debug(f"Confirm: {args.confirm}")
 
+    # Let a running daemon do the merge with its warm caches
+    if args.daemon_socket:
+        try:
+            response = send_request(
+                args.daemon_socket,
+                {
+                    "command": "merge",
+                    "new_mods_dir": os.path.abspath(args.new_mods_dir),
+                    "final_merged_mod_dir": os.path.abspath(args.final_merged_mod_dir),
+                    "confirm": args.confirm,
+                    "org_comp": args.org_comp,
+                    "bulk_review": args.bulk_review,
+                },
+            )
+        except OSError as e:
+            logger.warning(f"Unable to reach the merge daemon | Merging locally: {e}")
+        else:
+            if response["status"] == "error":
+                logger.error(f"Merge daemon error: {response['error']}")
+            logger.info(f"Merge daemon: {response['status']}")
+            return response["status"] == "merged"
+
     # Validate the requirements
     valid_requirements = validate_requirements()
 
     # Load the config file
     config = load_config("config.json")
-
-    result = merge_directories(
-        args.new_mods_dir,
-        args.final_merged_mod_dir,
-        valid_requirements,
-        config,
-        args.confirm,
-        args.org_comp,
-    )
-
+    if args.bulk_review:
+        config["bulk_review"] = True
+
+    # Warn about output files edited by hand since the last run
+    warn_manual_edits(args.final_merged_mod_dir)
+
+    # Skip the files finished by an interrupted run
+    with MergeJournal(get_journal_path(args.final_merged_mod_dir)) as journal:
+        result = merge_directories(
+            args.new_mods_dir,
+            args.final_merged_mod_dir,
+            valid_requirements,
+            config,
+            args.confirm,
+            args.org_comp,
+            journal=journal,
+        )
+
+        if result != "quit":
+            journal.clear()
+
+    # Record what the merged output looks like now, also when the user quit partway
+    #   so the files merged so far aren't reported as edited by hand next run
+    update_manifest(args.final_merged_mod_dir, config.get("manifest_workers"))
     if result == "quit":
         return False
 
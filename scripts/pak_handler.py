@@ -0,0 +1,712 @@
+#!/usr/bin/env python3
+
+# Version 0.1.0
+
+"""This module contains a native reader and writer for Unreal Engine .pak files."""
+
+# Reading supports pak versions 1 to 11, AES encrypted indexes and entries, and
+#   uncompressed, Zlib, or Gzip compressed entries. Oodle is not supported.
+# Writing creates unencrypted version 11 paks with uncompressed or Zlib entries.
+
+# NOTE: The encoded entries and full directory index are used for pak versions 10+
+#   The path hash index is not needed for extraction and is skipped
+
+import base64
+import hashlib
+import logging
+import os
+import struct
+import zlib
+
+from concurrent.futures import ThreadPoolExecutor
+from walk_handler import get_relative_path, walk_files
+
+try:
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+except ImportError:
+    Cipher = None
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,  # Set the log level
+    format="%(asctime)s | %(levelname)s | %(message)s",  # Set the log format
+    handlers=[
+        # Log to a file - escape any bytes that aren't valid UTF-8
+        logging.FileHandler("merge_tool.log", errors="backslashreplace"),
+        logging.StreamHandler(),  # Also log to the console
+    ],
+)
+
+# Create a logger object
+logger = logging.getLogger(__name__)
+
+PAK_MAGIC = 0x5A6F12E1
+AES_BLOCK_SIZE = 16
+COMPRESSION_NAME_SIZE = 32
+STREAM_READ_SIZE = 1024 * 1024
+
+# Pak versions with changes to the layout
+PAK_VERSION_NO_TIMESTAMPS = 2
+PAK_VERSION_COMPRESSION_ENCRYPTION = 3
+PAK_VERSION_INDEX_ENCRYPTION = 4
+PAK_VERSION_RELATIVE_CHUNK_OFFSETS = 5
+PAK_VERSION_ENCRYPTION_KEY_GUID = 7
+PAK_VERSION_FNAME_BASED_COMPRESSION = 8
+PAK_VERSION_FROZEN_INDEX = 9
+PAK_VERSION_PATH_HASH_INDEX = 10
+PAK_VERSION_FNV64_BUG_FIX = 11
+
+# Compression flags used before the compression methods were listed in the footer
+LEGACY_COMPRESSION_METHODS = {0x01: "Zlib", 0x02: "Gzip", 0x04: "Oodle"}
+
+
+class PakFormatError(Exception):
+    """Raised when a pak file can not be read."""
+
+
+def parse_aes_key(aes_key) -> bytes:
+    """Convert a 0x prefixed hex or base64 AES key into bytes."""
+    if not aes_key:
+        return b""
+    if aes_key.lower().startswith("0x"):
+        return bytes.fromhex(aes_key[2:])
+    return base64.b64decode(aes_key)
+
+
+def align_to_aes_block(size) -> int:
+    """Round a size up to the next AES block."""
+    return (size + AES_BLOCK_SIZE - 1) // AES_BLOCK_SIZE * AES_BLOCK_SIZE
+
+
+def decrypt_data(data, key) -> bytes:
+    """Decrypt AES-256 ECB encrypted data."""
+    if not key:
+        raise PakFormatError("Pak file is encrypted but no AES key was provided.")
+    if Cipher is None:
+        raise PakFormatError(
+            "Pak file is encrypted but the cryptography package is not installed - "
+            "install requirements.txt or use --unpak_backend repak."
+        )
+    decryptor = Cipher(algorithms.AES(key), modes.ECB()).decryptor()
+    return decryptor.update(data) + decryptor.finalize()
+
+
+def decompress_block(data, compression) -> bytes:
+    """Decompress a single compression block."""
+    if compression == "Zlib":
+        return zlib.decompress(data)
+    if compression == "Gzip":
+        return zlib.decompress(data, 31)
+    raise PakFormatError(f"Unsupported compression method: {compression}")
+
+
+def get_entry_header_size(version, compression_count, compression_index, block_count):
+    """Get the size of a serialized entry record for the given pak version."""
+    size = 8 + 8 + 8  # Offset, compressed size, uncompressed size
+    # Version 8 with 4 compression methods stores the compression index as a byte
+    size += 1 if version == 8 and compression_count == 4 else 4
+    if version < PAK_VERSION_NO_TIMESTAMPS:
+        size += 8  # Timestamp
+    size += 20  # SHA1 hash
+    if version >= PAK_VERSION_COMPRESSION_ENCRYPTION:
+        if compression_index:
+            size += 4 + 16 * block_count  # Block count and block start and end
+        size += 1 + 4  # Encrypted flag and compression block size
+    return size
+
+
+class _ByteReader:
+    """Read little endian values from a bytes buffer."""
+
+    def __init__(self, data):
+        self.data = data
+        self.position = 0
+
+    def read(self, size) -> bytes:
+        """Read raw bytes."""
+        if self.position + size > len(self.data):
+            raise PakFormatError("Unexpected end of pak index.")
+        value = self.data[self.position : self.position + size]
+        self.position += size
+        return value
+
+    def unpack(self, fmt):
+        """Read a single struct value."""
+        size = struct.calcsize(fmt)
+        return struct.unpack(fmt, self.read(size))[0]
+
+    def u8(self) -> int:
+        """Read an unsigned byte."""
+        return self.unpack("<B")
+
+    def u32(self) -> int:
+        """Read an unsigned 32 bit integer."""
+        return self.unpack("<I")
+
+    def i32(self) -> int:
+        """Read a signed 32 bit integer."""
+        return self.unpack("<i")
+
+    def u64(self) -> int:
+        """Read an unsigned 64 bit integer."""
+        return self.unpack("<Q")
+
+    def fstring(self) -> str:
+        """Read an Unreal FString."""
+        length = self.i32()
+        if length == 0:
+            return ""
+        if length > 0:
+            return self.read(length).decode("utf-8", errors="replace").rstrip("\0")
+        return self.read(-length * 2).decode("utf-16-le").rstrip("\0")
+
+
+def check_entry_path(relative_path) -> str:
+    """Check that a path from a pak stays below the directory it is extracted to.
+    Raises PakFormatError for absolute paths and paths with empty, . or .. parts."""
+    parts = relative_path.split("/")
+    if (
+        relative_path.startswith("/")
+        or os.path.isabs(relative_path)
+        or any(part in ("", ".", "..") or "\\" in part or ":" in part for part in parts)
+    ):
+        raise PakFormatError(f"Unsafe entry path in pak: {relative_path!r}")
+    return relative_path
+
+
+def join_entry_path(root, relative_path) -> str:
+    """Join a checked entry path onto root and make sure the result resolves below root."""
+    target_path = os.path.join(root, *check_entry_path(relative_path).split("/"))
+    real_root = os.path.realpath(root)
+    if os.path.commonpath([real_root, os.path.realpath(target_path)]) != real_root:
+        raise PakFormatError(f"Entry path leaves the extract path: {relative_path!r}")
+    return target_path
+
+
+class PakReader:
+    """Read the index and entries of an Unreal Engine .pak file."""
+
+    def __init__(self, pak_path, aes_key=None):
+        self.pak_path = pak_path
+        self.key = parse_aes_key(aes_key) if isinstance(aes_key, str) else aes_key
+        self.version = 0
+        self.mount_point = ""
+        self.index_offset = 0
+        self.index_size = 0
+        self.index_encrypted = False
+        self.compression_methods = []
+        self.entries = {}
+
+        with open(pak_path, "rb") as pak:
+            self._read_footer(pak)
+            self._read_index(pak)
+
+    def _read_footer(self, pak) -> None:
+        """Find the footer at the end of the file and read the index location."""
+        pak.seek(0, os.SEEK_END)
+        pak_size = pak.tell()
+
+        # (compression method count, frozen index flag) for each footer layout
+        footer_layouts = [(5, 0), (5, 1), (4, 0), (0, 0)]
+        for compression_count, frozen_size in footer_layouts:
+            tail_size = 4 + 4 + 8 + 8 + 20 + frozen_size
+            tail_size += compression_count * COMPRESSION_NAME_SIZE
+            magic_offset = pak_size - tail_size
+            if magic_offset < 0:
+                continue
+
+            pak.seek(magic_offset)
+            tail = _ByteReader(pak.read(tail_size))
+            if tail.u32() != PAK_MAGIC:
+                continue
+
+            version = tail.u32()
+            if (compression_count == 4 and version != 8) or (
+                compression_count == 5 and version < 8
+            ):
+                continue
+            if frozen_size and version != PAK_VERSION_FROZEN_INDEX:
+                continue
+            if not compression_count and version >= 8:
+                continue
+
+            self.version = version
+            self.index_offset = tail.u64()
+            self.index_size = tail.u64()
+            tail.read(20)  # Index hash
+            tail.read(frozen_size)
+            for _ in range(compression_count):
+                name = tail.read(COMPRESSION_NAME_SIZE).rstrip(b"\0").decode("ascii")
+                self.compression_methods.append(name)
+
+            if version >= PAK_VERSION_INDEX_ENCRYPTION:
+                pak.seek(magic_offset - 1)
+                self.index_encrypted = pak.read(1) != b"\0"
+            return
+
+        raise PakFormatError(f"Pak footer not found: {self.pak_path}")
+
+    def _read_encrypted_block(self, pak, offset, size) -> bytes:
+        """Read a block of data, decrypting it if the index is encrypted."""
+        pak.seek(offset)
+        data = pak.read(size)
+        if len(data) != size:
+            raise PakFormatError(f"Unexpected end of pak file: {self.pak_path}")
+        if self.index_encrypted:
+            data = decrypt_data(data, self.key)
+        return data
+
+    def _compression_name(self, compression_index) -> str:
+        """Convert the compression index of an entry to the method name."""
+        if not compression_index:
+            return "None"
+        if self.version < PAK_VERSION_FNAME_BASED_COMPRESSION:
+            return LEGACY_COMPRESSION_METHODS.get(compression_index, "Unknown")
+        if compression_index > len(self.compression_methods):
+            return "Unknown"
+        return self.compression_methods[compression_index - 1]
+
+    def _read_entry_record(self, reader) -> dict:
+        """Read a full entry record."""
+        entry = {
+            "offset": reader.u64(),
+            "compressed_size": reader.u64(),
+            "uncompressed_size": reader.u64(),
+        }
+        if self.version == 8 and len(self.compression_methods) == 4:
+            compression_index = reader.u8()
+        else:
+            compression_index = reader.u32()
+        if self.version < PAK_VERSION_NO_TIMESTAMPS:
+            reader.u64()  # Timestamp
+        reader.read(20)  # SHA1 hash
+
+        blocks = []
+        encrypted = False
+        block_size = 0
+        if self.version >= PAK_VERSION_COMPRESSION_ENCRYPTION:
+            if compression_index:
+                for _ in range(reader.u32()):
+                    blocks.append((reader.u64(), reader.u64()))
+            encrypted = reader.u8() != 0
+            block_size = reader.u32()
+
+        # Block offsets are relative to the entry offset from version 5 onwards
+        if self.version < PAK_VERSION_RELATIVE_CHUNK_OFFSETS:
+            blocks = [
+                (start - entry["offset"], end - entry["offset"])
+                for start, end in blocks
+            ]
+
+        entry["compression"] = self._compression_name(compression_index)
+        entry["encrypted"] = encrypted
+        entry["block_size"] = block_size
+        entry["blocks"] = blocks
+        entry["header_size"] = get_entry_header_size(
+            self.version,
+            len(self.compression_methods),
+            compression_index,
+            len(blocks),
+        )
+        return entry
+
+    def _read_encoded_entry(self, reader) -> dict:
+        """Read a bit-packed entry from the encoded entries of a version 10+ index."""
+        bits = reader.u32()
+        compression_index = (bits >> 23) & 0x3F
+        encrypted = (bits & (1 << 22)) != 0
+        block_count = (bits >> 6) & 0xFFFF
+        block_size = (bits & 0x3F) << 11
+        if (bits & 0x3F) == 0x3F:
+            block_size = reader.u32()
+
+        offset = reader.u32() if bits & (1 << 31) else reader.u64()
+        uncompressed_size = reader.u32() if bits & (1 << 30) else reader.u64()
+        compressed_size = uncompressed_size
+        if compression_index:
+            compressed_size = reader.u32() if bits & (1 << 29) else reader.u64()
+
+        header_size = get_entry_header_size(
+            self.version,
+            len(self.compression_methods),
+            compression_index,
+            block_count,
+        )
+        blocks = []
+        if block_count == 1 and not encrypted:
+            blocks.append((header_size, header_size + compressed_size))
+        elif block_count:
+            block_start = header_size
+            for _ in range(block_count):
+                compressed_block_size = reader.u32()
+                blocks.append((block_start, block_start + compressed_block_size))
+                if encrypted:
+                    compressed_block_size = align_to_aes_block(compressed_block_size)
+                block_start += compressed_block_size
+
+        return {
+            "offset": offset,
+            "compressed_size": compressed_size,
+            "uncompressed_size": uncompressed_size,
+            "compression": self._compression_name(compression_index),
+            "encrypted": encrypted,
+            "block_size": block_size,
+            "blocks": blocks,
+            "header_size": header_size,
+        }
+
+    def _read_index(self, pak) -> None:
+        """Read the index and build the entry lookup by path."""
+        index = _ByteReader(
+            self._read_encrypted_block(pak, self.index_offset, self.index_size)
+        )
+        self.mount_point = index.fstring()
+        record_count = index.u32()
+
+        if self.version < PAK_VERSION_PATH_HASH_INDEX:
+            for _ in range(record_count):
+                path = index.fstring()
+                self.entries[path] = self._read_entry_record(index)
+            return
+
+        index.u64()  # Path hash seed
+        if index.u32():
+            index.read(8 + 8 + 20)  # Path hash index offset, size, and hash
+
+        if not index.u32():
+            raise PakFormatError(
+                f"Pak file has no full directory index: {self.pak_path}"
+            )
+        directory_index_offset = index.u64()
+        directory_index_size = index.u64()
+        index.read(20)  # Full directory index hash
+
+        encoded_entries = _ByteReader(index.read(index.u32()))
+        unencoded_entries = [self._read_entry_record(index) for _ in range(index.u32())]
+
+        directory_index = _ByteReader(
+            self._read_encrypted_block(
+                pak, directory_index_offset, directory_index_size
+            )
+        )
+        for _ in range(directory_index.u32()):
+            directory_name = directory_index.fstring()
+            for _ in range(directory_index.u32()):
+                file_name = directory_index.fstring()
+                encoded_offset = directory_index.i32()
+                if encoded_offset < 0:
+                    entry = unencoded_entries[-encoded_offset - 1]
+                else:
+                    encoded_entries.position = encoded_offset
+                    entry = self._read_encoded_entry(encoded_entries)
+
+                path = (directory_name + file_name).lstrip("/")
+                self.entries[path] = entry
+
+    def iter_entry_blocks(self, path):
+        """Read, decrypt, and decompress an entry one compression block at a time."""
+        entry = self.entries[path]
+        if entry["compression"] == "None" or not entry["blocks"]:
+            data_start = entry["header_size"]
+            data_end = data_start + entry["compressed_size"]
+            blocks = [(data_start, data_end)]
+            # Plain entries are streamed in fixed size reads instead of a single block
+            if not entry["encrypted"]:
+                blocks = [
+                    (block_start, min(block_start + STREAM_READ_SIZE, data_end))
+                    for block_start in range(data_start, data_end, STREAM_READ_SIZE)
+                ] or blocks
+        else:
+            blocks = entry["blocks"]
+
+        remaining_size = entry["uncompressed_size"]
+        with open(self.pak_path, "rb") as pak:
+            for block_start, block_end in blocks:
+                block_size = block_end - block_start
+                read_size = block_size
+                if entry["encrypted"]:
+                    read_size = align_to_aes_block(block_size)
+
+                pak.seek(entry["offset"] + block_start)
+                block = pak.read(read_size)
+                if len(block) != read_size:
+                    raise PakFormatError(f"Unexpected end of pak file: {self.pak_path}")
+                if entry["encrypted"]:
+                    block = decrypt_data(block, self.key)[:block_size]
+                if entry["compression"] != "None":
+                    block = decompress_block(block, entry["compression"])
+
+                block = block[:remaining_size]
+                remaining_size -= len(block)
+                yield block
+
+    def read_entry(self, path) -> bytes:
+        """Read, decrypt, and decompress the contents of an entry."""
+        return b"".join(self.iter_entry_blocks(path))
+
+    def mount_relative_path(self, path) -> str:
+        """Get the path of an entry below the mount point with the ../ prefixes removed.
+        Raises PakFormatError if the entry path is absolute or has .. parts."""
+        if path.startswith("/") or os.path.isabs(path):
+            raise PakFormatError(f"Unsafe entry path in pak: {path!r}")
+        mount_point = self.mount_point
+        while mount_point.startswith("../"):
+            mount_point = mount_point[3:]
+        return check_entry_path((mount_point.lstrip("/") + path).lstrip("/"))
+
+    def extract_entry(self, path, extract_path) -> str:
+        """Extract a single entry below the extract path and return its relative path."""
+        relative_path = self.mount_relative_path(path)
+        target_path = join_entry_path(extract_path, relative_path)
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        with open(target_path, "wb") as f:
+            for block in self.iter_entry_blocks(path):
+                f.write(block)
+        return relative_path
+
+
+def extract_pak(pak_path, extract_path, aes_key=None, workers=None) -> list:
+    """Extract every entry of a pak file in parallel and return the extracted relative paths."""
+    reader = PakReader(pak_path, aes_key)
+    logger.info(
+        f"Extracting {len(reader.entries)} entries from {pak_path} (pak version {reader.version})"
+    )
+
+    # zlib and the AES cipher release the GIL, so threads decompress on every core
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+        extracted_paths = list(
+            executor.map(
+                lambda path: reader.extract_entry(path, extract_path),
+                sorted(reader.entries),
+            )
+        )
+
+    return extracted_paths
+
+
+def fnv64_path_hash(path, seed) -> int:
+    """Hash an entry path for the path hash index (pak version 11 FNV-64)."""
+    path_hash = (0xCBF29CE484222325 + seed) & 0xFFFFFFFFFFFFFFFF
+    for byte in path.lower().encode("utf-16-le"):
+        path_hash ^= byte
+        path_hash = (path_hash * 0x00000100000001B3) & 0xFFFFFFFFFFFFFFFF
+    return path_hash
+
+
+def serialize_fstring(value) -> bytes:
+    """Serialize an Unreal FString, using UTF-16 when the value is not ASCII."""
+    if value.isascii():
+        encoded = value.encode("ascii") + b"\0"
+        return struct.pack("<i", len(encoded)) + encoded
+    encoded = value.encode("utf-16-le") + b"\0\0"
+    return struct.pack("<i", -(len(encoded) // 2)) + encoded
+
+
+def serialize_entry_header(
+    compression_index, stored_size, file_size, blocks, block_size
+):
+    """Serialize the version 11 entry record written in front of the entry data."""
+    header = struct.pack("<QQQI", 0, stored_size, file_size, compression_index)
+    header += b"\0" * 20  # SHA1 hash - filled in by the caller
+    if compression_index:
+        header += struct.pack("<I", len(blocks))
+        for block_start, block_end in blocks:
+            header += struct.pack("<QQ", block_start, block_end)
+    header += struct.pack("<BI", 0, block_size if compression_index else 0)
+    return header
+
+
+def serialize_encoded_entry(
+    offset, stored_size, file_size, compression_index, blocks, block_size
+):
+    """Serialize the bit-packed entry stored in the encoded entries of the index."""
+    bits = compression_index << 23
+    bits |= len(blocks) << 6
+    if offset <= 0xFFFFFFFF:
+        bits |= 1 << 31
+    if file_size <= 0xFFFFFFFF:
+        bits |= 1 << 30
+    if stored_size <= 0xFFFFFFFF:
+        bits |= 1 << 29
+
+    compression_block_size = block_size if compression_index else 0
+    if compression_block_size & 0x7FF == 0 and (compression_block_size >> 11) < 0x3F:
+        bits |= compression_block_size >> 11
+    else:
+        bits |= 0x3F
+
+    encoded = struct.pack("<I", bits)
+    if bits & 0x3F == 0x3F:
+        encoded += struct.pack("<I", compression_block_size)
+    encoded += struct.pack("<I" if bits & (1 << 31) else "<Q", offset)
+    encoded += struct.pack("<I" if bits & (1 << 30) else "<Q", file_size)
+    if compression_index:
+        encoded += struct.pack("<I" if bits & (1 << 29) else "<Q", stored_size)
+    if len(blocks) > 1:
+        for block_start, block_end in blocks:
+            encoded += struct.pack("<I", block_end - block_start)
+    return encoded
+
+
+def compress_pak_entry(file_path, compression, block_size) -> dict:
+    """Read and compress a file into the blocks stored in the pak."""
+    with open(file_path, "rb") as f:
+        data = f.read()
+
+    compressed_blocks = []
+    if compression != "None" and data:
+        compressed_blocks = [
+            zlib.compress(data[i : i + block_size])
+            for i in range(0, len(data), block_size)
+        ]
+
+    # Store the file uncompressed when compression does not make it smaller
+    if not compressed_blocks or sum(map(len, compressed_blocks)) >= len(data):
+        return {"file_size": len(data), "blocks": [], "payload": data}
+
+    return {
+        "file_size": len(data),
+        "blocks": compressed_blocks,
+        "payload": b"".join(compressed_blocks),
+    }
+
+
+def pack_directory(
+    source_dir,
+    pak_path,
+    compression="Zlib",
+    workers=None,
+    mount_point="../../../",
+    block_size=0x10000,
+) -> int:
+    """Pack a directory tree into a version 11 .pak file and return the entry count.
+    Files are compressed on a thread pool and written in order as they finish,
+    then the index is written once at the end."""
+    if compression not in ("None", "Zlib"):
+        raise PakFormatError(f"Unsupported pack compression method: {compression}")
+    compression_index = 1 if compression == "Zlib" else 0
+    workers = workers or os.cpu_count() or 1
+
+    relative_paths = []
+    for file_path in walk_files(source_dir):
+        # Skip leftover temporary files from interrupted merges
+        if file_path.endswith(".tmp"):
+            logger.debug(f"Skipping temporary file: {file_path}")
+            continue
+        relative_paths.append(get_relative_path(file_path, source_dir))
+
+    path_hash_seed = zlib.crc32(os.path.basename(pak_path).lower().encode("utf-16-le"))
+    encoded_entries = b""
+    path_hashes = []
+    directories = {}
+
+    logger.info(
+        f"Packing {len(relative_paths)} files from {source_dir} into {pak_path} with {workers} workers"
+    )
+
+    with open(pak_path, "wb") as pak, ThreadPoolExecutor(
+        max_workers=workers
+    ) as executor:
+        # Keep a bounded window of compression jobs running ahead of the writer
+        pending = []
+        next_index = 0
+        for relative_path in relative_paths:
+            while next_index < len(relative_paths) and len(pending) < workers * 2:
+                pending.append(
+                    executor.submit(
+                        compress_pak_entry,
+                        os.path.join(
+                            source_dir, *relative_paths[next_index].split("/")
+                        ),
+                        compression,
+                        block_size,
+                    )
+                )
+                next_index += 1
+
+            packed_entry = pending.pop(0).result()
+            entry_compression = compression_index if packed_entry["blocks"] else 0
+            payload = packed_entry["payload"]
+
+            block_count = len(packed_entry["blocks"])
+            header_size = get_entry_header_size(
+                PAK_VERSION_FNV64_BUG_FIX, 5, entry_compression, block_count
+            )
+            blocks = []
+            block_start = header_size
+            for compressed_block in packed_entry["blocks"]:
+                blocks.append((block_start, block_start + len(compressed_block)))
+                block_start += len(compressed_block)
+
+            offset = pak.tell()
+            header = serialize_entry_header(
+                entry_compression,
+                len(payload),
+                packed_entry["file_size"],
+                blocks,
+                block_size,
+            )
+            payload_hash = hashlib.sha1(payload).digest()
+            pak.write(header[:28] + payload_hash + header[48:])
+            pak.write(payload)
+
+            encoded_offset = len(encoded_entries)
+            encoded_entries += serialize_encoded_entry(
+                offset,
+                len(payload),
+                packed_entry["file_size"],
+                entry_compression,
+                blocks,
+                block_size,
+            )
+            path_hashes.append(
+                (fnv64_path_hash(relative_path, path_hash_seed), encoded_offset)
+            )
+            directory, file_name = os.path.split("/" + relative_path)
+            directory_name = directory.lstrip("/") + "/"
+            directories.setdefault(directory_name, []).append(
+                (file_name, encoded_offset)
+            )
+
+        # Write the index and the two secondary indexes in a single pass
+        path_hash_index = struct.pack("<I", len(path_hashes))
+        for path_hash, encoded_offset in path_hashes:
+            path_hash_index += struct.pack("<Qi", path_hash, encoded_offset)
+        path_hash_index += struct.pack("<I", 0)
+
+        directory_index = struct.pack("<I", len(directories))
+        for directory_name, directory_files in directories.items():
+            directory_index += serialize_fstring(directory_name)
+            directory_index += struct.pack("<I", len(directory_files))
+            for file_name, encoded_offset in directory_files:
+                directory_index += serialize_fstring(file_name)
+                directory_index += struct.pack("<i", encoded_offset)
+
+        index_offset = pak.tell()
+        index_size = len(serialize_fstring(mount_point)) + 4 + 8
+        index_size += (4 + 8 + 8 + 20) * 2
+        index_size += 4 + len(encoded_entries) + 4
+        path_hash_index_offset = index_offset + index_size
+        directory_index_offset = path_hash_index_offset + len(path_hash_index)
+
+        index = serialize_fstring(mount_point)
+        index += struct.pack("<IQ", len(relative_paths), path_hash_seed)
+        index += struct.pack("<IQQ", 1, path_hash_index_offset, len(path_hash_index))
+        index += hashlib.sha1(path_hash_index).digest()
+        index += struct.pack("<IQQ", 1, directory_index_offset, len(directory_index))
+        index += hashlib.sha1(directory_index).digest()
+        index += struct.pack("<I", len(encoded_entries)) + encoded_entries
+        index += struct.pack("<I", 0)  # No unencoded entries
+
+        pak.write(index)
+        pak.write(path_hash_index)
+        pak.write(directory_index)
+
+        pak.write(b"\0" * 16)  # Encryption key guid
+        pak.write(struct.pack("<BII", 0, PAK_MAGIC, PAK_VERSION_FNV64_BUG_FIX))
+        pak.write(struct.pack("<QQ", index_offset, len(index)))
+        pak.write(hashlib.sha1(index).digest())
+        for name in ["Zlib", "", "", "", ""]:
+            pak.write(name.encode("ascii").ljust(COMPRESSION_NAME_SIZE, b"\0"))
+
+    return len(relative_paths)
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+
+# Version 0.1.0
+
+"""This module contains the background stages used to overlap reading and writing with merging."""
+
+# Prefetcher runs a reading generator on its own thread and hands its items over through a
+#   bounded queue, so the next chunks are read and compared while the current one is merged.
+# BackgroundWorker runs queued calls in order on its own thread, for writes that don't need
+#   to finish before the merge goes on, and for reading files ahead to warm the OS cache.
+# A queue depth of 0 runs everything inline on the calling thread instead.
+
+import logging
+import queue
+import threading
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,  # Set the log level
+    format="%(asctime)s | %(levelname)s | %(message)s",  # Set the log format
+    handlers=[
+        # Log to a file - escape any bytes that aren't valid UTF-8
+        logging.FileHandler("merge_tool.log", errors="backslashreplace"),
+        logging.StreamHandler(),  # Also log to the console
+    ],
+)
+
+# Create a logger object
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE_DEPTH = 4
+# Block size files are read in to warm the OS cache
+WARM_BLOCK_SIZE = 1024 * 1024
+# How often a blocked stage checks if it was stopped
+STOP_POLL_SECONDS = 0.1
+
+_DONE = object()
+
+
+def get_queue_depth(config) -> int:
+    """Get the pipeline queue depth from the config - 0 disables the background stages."""
+    return max(0, int(config.get("pipeline_queue_depth", DEFAULT_QUEUE_DEPTH)))
+
+
+def warm_file(file_path) -> None:
+    """Read a file and drop its contents so the next read comes from the OS cache."""
+    try:
+        with open(file_path, "rb", buffering=0) as f:
+            while f.read(WARM_BLOCK_SIZE):
+                pass
+    except OSError:
+        # Only a hint - the merge reads and reports the file itself
+        pass
+
+
+class Prefetcher:
+    """Iterate a generator on a background thread, up to queue_depth items ahead.
+    Errors raised by the generator are raised again where the items are consumed.
+    Leaving the context stops the generator and closes it on its own thread."""
+
+    def __init__(self, items, queue_depth=DEFAULT_QUEUE_DEPTH):
+        self.items = items
+        self.queue_depth = queue_depth
+        self._queue = queue.Queue(maxsize=max(1, queue_depth))
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        if self.queue_depth > 0:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _put(self, item) -> bool:
+        """Queue an item, giving up if the consumer stopped."""
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=STOP_POLL_SECONDS)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _run(self) -> None:
+        try:
+            for item in self.items:
+                if not self._put((item, None)):
+                    break
+        except Exception as e:  # pylint: disable=broad-except
+            self._put((_DONE, e))
+        finally:
+            self.items.close()
+            self._put((_DONE, None))
+
+    def __iter__(self):
+        if self._thread is None:
+            yield from self.items
+            return
+
+        while True:
+            item, error = self._queue.get()
+            if error is not None:
+                raise error
+            if item is _DONE:
+                return
+            yield item
+
+    def close(self) -> None:
+        """Stop reading ahead and wait for the background thread to finish."""
+        if self._thread is None:
+            self.items.close()
+            return
+        self._stop.set()
+        self._thread.join()
+
+
+class BackgroundWorker:
+    """Run calls in order on a background thread, up to queue_depth calls behind.
+    An error raised by a call is raised again by the next wait."""
+
+    def __init__(self, queue_depth=DEFAULT_QUEUE_DEPTH):
+        self.queue_depth = queue_depth
+        self._queue = queue.Queue(maxsize=max(1, queue_depth))
+        self._error = None
+        self._thread = None
+        if queue_depth > 0:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _run(self) -> None:
+        while True:
+            call = self._queue.get()
+            try:
+                if call is _DONE:
+                    return
+                # Once a call failed the ones queued after it would write out of order
+                if self._error is None:
+                    call[0](*call[1])
+            except Exception as e:  # pylint: disable=broad-except
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def submit(self, function, *args, block=True) -> bool:
+        """Queue a call, waiting for room if block is set.
+        Returns False if the queue was full and the call was dropped."""
+        if self._thread is None:
+            function(*args)
+            return True
+        try:
+            self._queue.put((function, args), block=block)
+        except queue.Full:
+            return False
+        return True
+
+    def wait(self) -> None:
+        """Wait for every queued call to finish."""
+        if self._thread is not None:
+            self._queue.join()
+        if self._error is not None:
+            error = self._error
+            self._error = None
+            raise error
+
+    def close(self) -> None:
+        """Finish the queued calls and stop the background thread."""
+        if self._thread is None:
+            return
+        self._queue.put(_DONE)
+        self._thread.join()
+        self._thread = None
+        if self._error is not None:
+            error = self._error
+            self._error = None
+            raise error
@@ -20,20 +20,37 @@
 import os
 import argparse
 import subprocess
-import json
 import logging
 import re
+import zlib
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
+from conflict_handler import analyze_conflicts
+from hash_handler import hash_blocks, hash_file, hash_files_parallel
+from history_handler import load_history
+from journal_handler import MergeJournal, get_journal_path
+from manifest_handler import update_manifest, warn_manual_edits
 from merge_tool import merge_directories
-from requirements_handler import load_config, save_config
+from pak_handler import extract_pak, pack_directory, PakFormatError
+from requirements_handler import load_config, save_config, validate_requirements
+from resolution_handler import (
+    apply_resolutions,
+    export_conflicts,
+    get_resolutions_dir,
+)
+from update_handler import update_mod
+from watch_handler import InotifyWatcher, wait_for_changes
+from vfs_handler import OsFileSystem, PakFileSystem
+from walk_handler import get_relative_path, scan_files, walk_files
 
 # Set up logging
 logging.basicConfig(
     level=logging.INFO,  # Set the log level
     format="%(asctime)s | %(levelname)s | %(message)s",  # Set the log format
     handlers=[
-        logging.FileHandler("merge_tool.log"),  # Log to a file
+        # Log to a file - escape any bytes that aren't valid UTF-8
+        logging.FileHandler("merge_tool.log", errors="backslashreplace"),
         logging.StreamHandler(),  # Also log to the console
     ],
 )
@@ -41,6 +58,9 @@ logging.basicConfig(
 # Create a logger object
 logger = logging.getLogger(__name__)
 
+# Default AES key for the Stalker 2 paks - can be overridden with aes_key in the config
+AES_KEY = "0x33A604DF49A07FFD4A4C919962161F5C35A134D37EFA98DB37A34F6450D7D386"
+
 
 def sanitize_mod_name(pak_file_name) -> dict:
     """Sanitize the mod name to remove special characters and version numbers."""
@@ -89,20 +109,96 @@ def update_mod_version(history, pak_file_clean_name, new_pak_file_version) -> di
     return pak_file_history
 
 
-def unpack_files(repak_path, pak_dir, extract_dir, resume) -> bool:
-    """Unpack the .pak, .ucas, and .utoc files in the directory."""
-    aes_key = "0x33A604DF49A07FFD4A4C919962161F5C35A134D37EFA98DB37A34F6450D7D386"
+def run_repak_unpack(repak_path, aes_key, pak_file_path, extract_path) -> dict:
+    """Run repak to unpack a single pak file."""
+    try:
+        subprocess.run(
+            [
+                repak_path,
+                "--aes-key",
+                aes_key,
+                "unpack",
+                pak_file_path,
+                "--output",
+                extract_path,
+            ],
+            check=True,
+        )
+    except (subprocess.CalledProcessError, OSError) as e:
+        logger.error(f"Error unpacking {pak_file_path}")
+        logger.error(e)
+        return {"status": "error", "pak_file_path": pak_file_path}
+
+    return {"status": "unpacked", "pak_file_path": pak_file_path}
+
+
+def run_native_unpack(aes_key, pak_file_path, extract_path, workers) -> dict:
+    """Extract a single pak file with the native pak reader."""
+    try:
+        extracted_files = extract_pak(pak_file_path, extract_path, aes_key, workers)
+    except (PakFormatError, OSError, zlib.error) as e:
+        logger.error(f"Error unpacking {pak_file_path}")
+        logger.error(e)
+        return {"status": "error", "pak_file_path": pak_file_path}
+
+    return {
+        "status": "unpacked",
+        "pak_file_path": pak_file_path,
+        "extracted_files": sorted(extracted_files),
+    }
+
+
+def list_extracted_files(extract_path) -> list:
+    """List the files below an extract path as sorted relative paths."""
+    return sorted(
+        get_relative_path(entry.path, extract_path)
+        for entry in scan_files(extract_path)
+    )
 
-    # Json config path: ..\configs\config.json
-    config = load_config("config.json")
 
-    # Check if the repak_path is valid and save to config file if new
+def get_mod_signature(mod_path) -> str:
+    """Hash the sizes and mtimes of a mod's pak file, or of every file in its directory,
+    to tell the mod merged last apart from a new version dropped in under the same name.
+    """
+    if os.path.isfile(mod_path):
+        file_paths = [mod_path]
+    else:
+        file_paths = walk_files(mod_path)
+    stat_lines = []
+    for file_path in file_paths:
+        stat = os.stat(file_path)
+        relative_path = os.path.relpath(file_path, mod_path).replace(os.sep, "/")
+        stat_lines.append(
+            f"{relative_path}|{stat.st_size}|{stat.st_mtime_ns}\n".encode("utf-8")
+        )
+    return hash_blocks(stat_lines)
+
+
+def is_unpacked(pak_file_history, pak_hash, extract_path) -> bool:
+    """Check if the history shows this exact pak content unpacked to extract_path,
+    and that every file of its extract manifest is still on disk."""
+    if not pak_hash or pak_file_history.get("hash") != pak_hash:
+        return False
+    if pak_file_history.get("extract_path") != extract_path:
+        return False
+
+    extracted_files = pak_file_history.get("extracted_files")
+    if extracted_files is None or not os.path.isdir(extract_path):
+        return False
+    return all(
+        os.path.isfile(os.path.join(extract_path, *path.split("/")))
+        for path in extracted_files
+    )
+
+
+def resolve_repak_path(repak_path, config) -> str:
+    """Validate the repak path, falling back to the config file, and save it if new."""
     if not repak_path:
         logger.info("repak path not provided. Checking config file.")
         # Check if there is a valid repak path in the config file
         if not config.get("repak_path"):
             logger.error("repak path not found in config file.")
-            return False
+            return ""
 
         # TODO: Add support for FModel to extract game assets and repak them
         if (
@@ -110,113 +206,295 @@ def unpack_files(repak_path, pak_dir, extract_dir, resume) -> bool:
             or "repak.exe" not in config["repak_path"]
         ):
             logger.error(f"Invalid repak path in config file: {config['repak_path']}")
-            return False
+            return ""
+
+        return config["repak_path"]
+
+    # Check if the repak_path is valid
+    if not os.path.exists(repak_path) or "repak.exe" not in repak_path:
+        logger.error(f"Invalid repak path provided: {repak_path}")
+        return ""
+
+    # Save the repak_path to the config file
+    config["repak_path"] = repak_path
+    save_config(config)
+    return repak_path
+
+
+def iter_unpack_results(
+    unpack_jobs, unpack_backend, repak_path, aes_key, unpack_workers
+):
+    """Run the unpack jobs and yield each result as soon as it finishes.
+    The native backend unpacks one pak at a time and spreads its entries over the workers,
+    the repak backend runs up to unpack_workers repak processes at once."""
+    if unpack_backend == "native":
+        for pak_file_path, unpack_job in unpack_jobs.items():
+            yield run_native_unpack(
+                aes_key, pak_file_path, unpack_job["extract_path"], unpack_workers
+            )
+        return
 
-        repak_path = config["repak_path"]
-    else:
-        # Check if the repak_path is valid
-        if not os.path.exists(repak_path) or "repak.exe" not in repak_path:
-            logger.error(f"Invalid repak path provided: {repak_path}")
+    with ThreadPoolExecutor(max_workers=unpack_workers) as executor:
+        futures = [
+            executor.submit(
+                run_repak_unpack,
+                repak_path,
+                aes_key,
+                pak_file_path,
+                unpack_job["extract_path"],
+            )
+            for pak_file_path, unpack_job in unpack_jobs.items()
+        ]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def unpack_files(
+    repak_path,
+    pak_dir,
+    extract_dir,
+    resume,
+    unpack_workers=None,
+    unpack_backend=None,
+    pak_file_names=None,
+) -> bool:
+    """Unpack the .pak, .ucas, and .utoc files in the directory.
+    Uses the native pak reader or repak depending on unpack_backend, and records
+    each pak in the history as soon as it has been unpacked.
+    If pak_file_names is set, only those paks are considered."""
+    # Json config path: ..\configs\config.json
+    config = load_config("config.json")
+    aes_key = config.get("aes_key") or AES_KEY
+
+    if not unpack_backend:
+        unpack_backend = config.get("unpack_backend", "native")
+
+    if unpack_backend == "repak":
+        repak_path = resolve_repak_path(repak_path, config)
+        if not repak_path:
             return False
 
-        # Save the repak_path to the config file
-        config["repak_path"] = repak_path
-        save_config(config)
+    if not unpack_workers:
+        unpack_workers = config.get("unpack_workers") or os.cpu_count() or 1
 
     # List all .pak files in the directory
-    pak_files = [f for f in os.listdir(pak_dir) if f.endswith(".pak")]
+    pak_files = [
+        f
+        for f in os.listdir(pak_dir)
+        if f.endswith(".pak") and (pak_file_names is None or f in pak_file_names)
+    ]
     history = load_history()
 
+    # Pak file names can change between version - need to save in history with a unique identifier and regex match
+    pak_file_parts = {pak_file: sanitize_mod_name(pak_file) for pak_file in pak_files}
+    pak_file_histories = {
+        pak_file: history.get(pak_file_parts[pak_file].get("clean_name")) or {}
+        for pak_file in pak_files
+    }
+    # Hash the paks up front only when the hash is compared - to skip a pak on resume,
+    #   or to keep the hash next to the extract manifest of an earlier unpack current.
+    #   The others are hashed once they have been unpacked.
+    pak_hashes = hash_files_parallel(
+        [
+            os.path.join(pak_dir, pak_file)
+            for pak_file in pak_files
+            if resume or pak_file_histories[pak_file].get("extracted_files") is not None
+        ],
+        unpack_workers,
+    )
+
+    unpack_jobs = {}
     for pak_file in pak_files:
         pak_file_path = os.path.join(pak_dir, pak_file)
         extract_path = os.path.join(extract_dir, pak_file)
 
-        # Pak file names can change between version - need to save in history with a unique identifier and regex match
-        pak_file_name_parts = sanitize_mod_name(pak_file)
+        pak_file_name_parts = pak_file_parts[pak_file]
         pak_file_clean_name = pak_file_name_parts.get("clean_name")
         new_pak_file_version = pak_file_name_parts.get("version")
-        pak_file_history = history.get(pak_file_clean_name) or {}
-        version_history = pak_file_history.get("version") or []
-        last_version = version_history[-1] if version_history else None
+        pak_file_history = pak_file_histories[pak_file]
+        pak_hash = pak_hashes.get(pak_file_path)
 
-        if (
-            resume
-            and pak_file_history
-            and last_version
-            and new_pak_file_version == last_version
-            and pak_file_history.get("unpacked")
-        ):
-            logger.info(
-                f"Version number matches last version for {pak_file}: {new_pak_file_version}"
-            )
+        if resume and is_unpacked(pak_file_history, pak_hash, extract_path):
+            logger.info(f"Hash matches last unpack for {pak_file}: {pak_hash}")
             logger.info(f"Skipping {pak_file} as it has already been unpacked.")
             continue
 
-        history[pak_file_clean_name] = update_mod_version(
-            history, pak_file_clean_name, new_pak_file_version
+        unpack_jobs[pak_file_path] = {
+            "clean_name": pak_file_clean_name,
+            "version": new_pak_file_version,
+            "extract_path": extract_path,
+            "hash": pak_hash,
+        }
+
+    logger.info(
+        f"Unpacking {len(unpack_jobs)} pak files using {unpack_backend} with {unpack_workers} workers."
+    )
+
+    all_unpacked = True
+    # Only this thread touches the history, so it is updated as each job finishes
+    for result in iter_unpack_results(
+        unpack_jobs, unpack_backend, repak_path, aes_key, unpack_workers
+    ):
+        pak_file_path = result["pak_file_path"]
+        if result["status"] != "unpacked":
+            all_unpacked = False
+            continue
+
+        unpack_job = unpack_jobs[pak_file_path]
+        pak_file_clean_name = unpack_job["clean_name"]
+        pak_file_history = update_mod_version(
+            history, pak_file_clean_name, unpack_job["version"]
         )
 
         # Save the last modified date of the pak file to the history file
         timestamp = os.path.getmtime(pak_file_path)
         last_modified = datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")
-        history[pak_file_clean_name]["last_modified"] = last_modified
-        history[pak_file_clean_name]["unpacked"] = datetime.now().strftime(
-            "%Y-%m-%d %H:%M:%S"
+        pak_file_history["last_modified"] = last_modified
+        pak_file_history["unpacked"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+        # Save the pak hash and what it extracted so an unchanged pak is skipped next time
+        extracted_files = result.get("extracted_files")
+        if extracted_files is None:
+            extracted_files = list_extracted_files(unpack_job["extract_path"])
+        # A pak that wasn't hashed up front is hashed now, while it is still in the
+        #   page cache from the unpack, so the next resume can skip it
+        pak_hash = unpack_job["hash"]
+        if pak_hash is None:
+            try:
+                pak_hash = hash_file(pak_file_path)
+            except OSError as e:
+                logger.warning(f"Unable to hash {pak_file_path}: {e}")
+        pak_file_history["hash"] = pak_hash
+        pak_file_history["extract_path"] = unpack_job["extract_path"]
+        pak_file_history["extracted_files"] = extracted_files
+        history.save_mod(pak_file_clean_name, pak_file_history)
+        logger.info(f"Unpacked {pak_file_path}")
+
+    history.close()
+    return all_unpacked
+
+
+def merge_mod(
+    history,
+    new_mod_dir,
+    new_mods_dir,
+    final_merged_mod_dir,
+    valid_requirements,
+    config,
+    aes_key,
+    confirm,
+    org_comp,
+    resume,
+    merge_from_paks,
+    update=False,
+) -> bool:
+    """Merge a single mod and save it in the history. Returns False if the user quit.
+    If update is set and an older version of the mod was merged, only the changes
+    between the two versions are applied."""
+    new_mod_dir_path = os.path.join(new_mods_dir, new_mod_dir)
+    is_pak_file = merge_from_paks and new_mod_dir.endswith(".pak")
+    if not is_pak_file and not os.path.isdir(new_mod_dir_path):
+        return True
+
+    # Skip mods that have already been merged
+    pak_file_name_parts = sanitize_mod_name(new_mod_dir)
+    pak_file_clean_name = pak_file_name_parts.get("clean_name")
+    mod_history = history.get(pak_file_clean_name) or {}
+    merged_date = mod_history.get("merged")
+    last_modified_date = mod_history.get("last_modified")
+    if (
+        resume
+        and merged_date
+        and last_modified_date
+        and merged_date >= last_modified_date
+    ):
+        logger.info(
+            f"Resume set and current mod version in history | Skipping mod: {new_mod_dir}"
         )
+        return True
 
-        # Run repak to unpack the files
-        result = subprocess.run(
-            [
-                repak_path,
-                "--aes-key",
-                aes_key,
-                "unpack",
-                pak_file_path,
-                "--output",
-                extract_path,
-            ],
-            shell=True,
-            check=True,
+    # The version that was merged last is already in the merged tree
+    merged_path = mod_history.get("merged_path")
+    mod_signature = get_mod_signature(new_mod_dir_path)
+    if update and merged_path == new_mod_dir_path:
+        if mod_history.get("merged_signature") == mod_signature:
+            logger.info(
+                f"Update set and mod version already merged | Skipping mod: {new_mod_dir}"
+            )
+            return True
+        # The old version was replaced in place, so there is nothing left to diff against
+        logger.info(
+            f"Mod changed in place since it was merged | Merging it again: {new_mod_dir}"
         )
-        if result.returncode != 0:
-            logger.error(f"Error unpacking {pak_file_path}")
-            save_history(history)
-            return False
-
-    save_history(history)
-    return True
-
-
-def save_history(history) -> bool:
-    """Save the history to a file."""
-    # History config path: ..\configs\history.json
-    history_config = os.path.join(
-        os.path.dirname(__file__), "..", "configs", "history.json"
+        merged_path = None
+
+    logger.info(f"Processing mod: {new_mod_dir}")
+    logger.info(f"New Mod Directory: {new_mod_dir_path}")
+
+    source_fs = None
+    old_fs = None
+    try:
+        if is_pak_file:
+            source_fs = PakFileSystem(new_mod_dir_path, aes_key)
+        if update and merged_path and os.path.exists(merged_path):
+            old_fs = (
+                PakFileSystem(merged_path, aes_key)
+                if os.path.isfile(merged_path)
+                else OsFileSystem()
+            )
+    except (PakFormatError, OSError) as e:
+        logger.error(f"Unable to read pak file for mod: {new_mod_dir}")
+        logger.error(e)
+        return True
+
+    try:
+        if old_fs is not None:
+            logger.info(f"Updating mod from {merged_path}")
+            result = update_mod(
+                old_fs,
+                merged_path,
+                source_fs or OsFileSystem(),
+                new_mod_dir_path,
+                final_merged_mod_dir,
+                valid_requirements,
+                config,
+                confirm,
+                org_comp,
+            )
+        else:
+            # Skip the files of the mod finished by an interrupted run
+            with MergeJournal(get_journal_path(final_merged_mod_dir)) as journal:
+                result = merge_directories(
+                    new_mod_dir_path,
+                    final_merged_mod_dir,
+                    valid_requirements,
+                    config,
+                    confirm,
+                    org_comp,
+                    source_fs,
+                    journal,
+                )
+                if result != "quit":
+                    journal.clear()
+    finally:
+        for file_system in (source_fs, old_fs):
+            if isinstance(file_system, PakFileSystem):
+                file_system.close()
+
+    if result == "quit":
+        return False
+
+    # Add the mod to the history as merged with the current date
+    mod_history = update_mod_version(
+        history, pak_file_clean_name, pak_file_name_parts.get("version")
     )
-    with open(history_config, "w", encoding="utf-8") as f:
-        json.dump(history, f, indent=4)
-
+    mod_history["merged"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    mod_history["merged_path"] = new_mod_dir_path
+    mod_history["merged_signature"] = mod_signature
+    history.save_mod(pak_file_clean_name, mod_history)
     return True
 
 
-def load_history() -> dict:
-    """Load the history from a file."""
-    # History config path: ..\configs\history.json
-    history_config = os.path.join(
-        os.path.dirname(__file__), "..", "configs", "history.json"
-    )
-    # history = (
-    #     json.load(open(history_config, "r", encoding="utf-8"))
-    #     if os.path.exists(history_config)
-    #     else {}
-    # )
-    history = {}
-    with open(history_config, "r", encoding="utf-8") as f:
-        history = json.load(f)
-
-    return history
-
-
 def merge_mods(
     sorted_new_mods_dir_list,
     new_mods_dir,
@@ -225,58 +503,240 @@ def merge_mods(
     confirm,
     org_comp,
     resume,
+    merge_from_paks=False,
+    update=False,
 ) -> bool:
-    """Merge the mods in the new_mods_dir into the final_merged_mod_dir."""
-    # Load the history file
+    """Merge the mods in the new_mods_dir into the final_merged_mod_dir.
+    If merge_from_paks is set, .pak files are merged straight out of the archive
+    without unpacking them first. If update is set, mods with an older merged version
+    only have the changes between versions applied."""
+    # Load the history database
     history = load_history()
-    for new_mod_dir in sorted_new_mods_dir_list:
-        new_mod_dir_path = os.path.join(new_mods_dir, new_mod_dir)
-        if not os.path.isdir(new_mod_dir_path):
-            continue
+    valid_requirements = validate_requirements()
+    config = load_config("config.json")
+    aes_key = config.get("aes_key") or AES_KEY
+
+    # Warn about output files edited by hand since the last run
+    warn_manual_edits(final_merged_mod_dir)
+
+    completed = True
+    try:
+        for new_mod_dir in sorted_new_mods_dir_list:
+            if not merge_mod(
+                history,
+                new_mod_dir,
+                new_mods_dir,
+                final_merged_mod_dir,
+                valid_requirements,
+                config,
+                aes_key,
+                confirm,
+                org_comp,
+                resume,
+                merge_from_paks,
+                update,
+            ):
+                completed = False
+                break
+    finally:
+        history.close()
+
+    # Record what the merged output looks like now, also when the user quit partway
+    #   so the files merged so far aren't reported as edited by hand next run
+    update_manifest(final_merged_mod_dir, config.get("manifest_workers"))
+    return completed
+
+
+def pack_merged_mod(final_merged_mod_dir, pack_path=None, pack_workers=None) -> bool:
+    """Pack the final_merged_mod_dir into a .pak file."""
+    config = load_config("config.json")
+    if not pack_path:
+        pack_path = final_merged_mod_dir.rstrip("\\/") + ".pak"
+    if not pack_workers:
+        pack_workers = config.get("pack_workers") or os.cpu_count() or 1
+    pack_compression = config.get("pack_compression", "Zlib")
+
+    try:
+        entry_count = pack_directory(
+            final_merged_mod_dir, pack_path, pack_compression, pack_workers
+        )
+    except (PakFormatError, OSError) as e:
+        logger.error(f"Error packing {final_merged_mod_dir} into {pack_path}")
+        logger.error(e)
+        return False
 
-        # Skip mods that have already been merged
-        mod_history = history.get(new_mod_dir) or {}
-        merged_date = mod_history.get("merged")
-        last_modified_date = mod_history.get("last_modified")
-        if (
-            resume
-            and merged_date
-            and last_modified_date
-            and merged_date >= last_modified_date
-        ):
-            logger.info(
-                f"Resume set and current mod version in history | Skipping mod: {new_mod_dir}"
-            )
-            continue
+    logger.info(f"Packed {entry_count} files into {pack_path}")
+    return True
 
-        logger.info(f"Processing mod: {new_mod_dir}")
-        logger.info(f"New Mod Directory: {new_mod_dir_path}")
 
-        result = merge_directories(
-            new_mods_dir=new_mod_dir_path,
-            final_merged_mod_dir=final_merged_mod_dir,
-            verbose=verbose,
-            confirm=confirm,
-            org_comp=org_comp,
+def analyze_mods(
+    new_mods_dir, final_merged_mod_dir, report_path=None, analyze_workers=None
+) -> bool:
+    """Report which mods conflict on which files without merging anything."""
+    config = load_config("config.json")
+    if not report_path:
+        report_path = final_merged_mod_dir.rstrip("\\/") + ".conflicts.json"
+    if not analyze_workers:
+        analyze_workers = config.get("analyze_workers") or os.cpu_count() or 1
+
+    base_dir = final_merged_mod_dir if os.path.isdir(final_merged_mod_dir) else None
+    try:
+        analyze_conflicts(
+            new_mods_dir,
+            base_dir,
+            report_path,
+            config.get("valid_file_extensions"),
+            analyze_workers,
         )
+    except OSError as e:
+        logger.error(f"Error analyzing the mods in {new_mods_dir}")
+        logger.error(e)
+        return False
 
-        if not result:
-            save_history(history)
-            return False
+    return True
 
-        # Add the mod to the history file as merged with the current date
-        pak_file_name_parts = sanitize_mod_name(new_mod_dir)
-        pak_file_clean_name = pak_file_name_parts.get("clean_name")
-        new_pak_file_version = pak_file_name_parts.get("version")
 
-        history[pak_file_clean_name] = update_mod_version(
-            history, pak_file_clean_name, new_pak_file_version
-        )
-        history[pak_file_clean_name]["merged"] = datetime.now().strftime(
-            "%Y-%m-%d %H:%M:%S"
-        )
+def export_mod_conflicts(
+    new_mods_dir, final_merged_mod_dir, resolutions_dir=None
+) -> bool:
+    """Export the conflicts of every mod as conflict marker files to resolve offline."""
+    config = load_config("config.json")
+    resolutions_dir = resolutions_dir or get_resolutions_dir(final_merged_mod_dir)
+    try:
+        export_conflicts(new_mods_dir, final_merged_mod_dir, resolutions_dir, config)
+    except OSError as e:
+        logger.error(f"Error exporting the conflicts of the mods in {new_mods_dir}")
+        logger.error(e)
+        return False
+
+    return True
+
+
+def apply_mod_resolutions(
+    new_mods_dir, final_merged_mod_dir, resolutions_dir=None
+) -> bool:
+    """Apply the resolved conflict files of an export, and add the mods that were fully
+    applied to the history as merged."""
+    config = load_config("config.json")
+    resolutions_dir = resolutions_dir or get_resolutions_dir(final_merged_mod_dir)
+    try:
+        report = apply_resolutions(resolutions_dir, final_merged_mod_dir)
+    except (OSError, ValueError, KeyError) as e:
+        logger.error(f"Error applying the resolutions in {resolutions_dir}")
+        logger.error(e)
+        return False
+
+    history = load_history()
+    try:
+        for new_mod_dir in report["merged_mods"]:
+            pak_file_name_parts = sanitize_mod_name(new_mod_dir)
+            pak_file_clean_name = pak_file_name_parts.get("clean_name")
+            mod_history = update_mod_version(
+                history, pak_file_clean_name, pak_file_name_parts.get("version")
+            )
+            mod_history["merged"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            mod_history["merged_path"] = os.path.join(new_mods_dir, new_mod_dir)
+            mod_history["merged_signature"] = get_mod_signature(
+                mod_history["merged_path"]
+            )
+            history.save_mod(pak_file_clean_name, mod_history)
+            logger.info(f"Merged mod from its resolutions: {new_mod_dir}")
+    finally:
+        history.close()
+
+    # Record the resolved output so it isn't reported as edited by hand
+    update_manifest(final_merged_mod_dir, config.get("manifest_workers"))
+    return report["status"] == "applied"
+
+
+def watch_new_mods(
+    new_mods_dir,
+    final_merged_mod_dir,
+    repak_path,
+    unpack,
+    unpack_only,
+    unpack_workers,
+    unpack_backend,
+    confirm,
+    org_comp,
+    merge_from_paks,
+    update,
+    pack,
+    pack_path,
+) -> bool:
+    """Watch the new_mods_dir and unpack and merge each mod as it lands.
+    The config, requirements, and history are loaded once and kept for every batch."""
+    config = load_config("config.json")
+    valid_requirements = validate_requirements()
+    aes_key = config.get("aes_key") or AES_KEY
+    debounce_seconds = config.get("watch_debounce_seconds", 2)
+
+    try:
+        watcher = InotifyWatcher(new_mods_dir)
+    except OSError as e:
+        logger.error(f"Unable to watch {new_mods_dir}")
+        logger.error(e)
+        return False
+
+    history = load_history()
+    logger.info(f"Watching {new_mods_dir} for new mods | Press Ctrl+C to stop")
+    try:
+        while True:
+            changed_names = wait_for_changes(watcher, debounce_seconds)
+            changed_names = sorted(
+                name
+                for name in changed_names
+                if os.path.exists(os.path.join(new_mods_dir, name))
+            )
+            if not changed_names:
+                continue
+            logger.info(f"Changed mods: {', '.join(changed_names)}")
+
+            if unpack:
+                changed_pak_files = [n for n in changed_names if n.endswith(".pak")]
+                if changed_pak_files:
+                    unpack_files(
+                        repak_path,
+                        new_mods_dir,
+                        final_merged_mod_dir,
+                        True,
+                        unpack_workers,
+                        unpack_backend,
+                        changed_pak_files,
+                    )
+            if unpack_only:
+                continue
+
+            # A changed mod is merged again even if the history shows it merged
+            for new_mod_dir in changed_names:
+                if not merge_mod(
+                    history,
+                    new_mod_dir,
+                    new_mods_dir,
+                    final_merged_mod_dir,
+                    valid_requirements,
+                    config,
+                    aes_key,
+                    confirm,
+                    org_comp,
+                    False,
+                    merge_from_paks,
+                    update,
+                ):
+                    update_manifest(
+                        final_merged_mod_dir, config.get("manifest_workers")
+                    )
+                    return False
+
+            update_manifest(final_merged_mod_dir, config.get("manifest_workers"))
+            if pack:
+                pack_merged_mod(final_merged_mod_dir, pack_path)
+    except KeyboardInterrupt:
+        logger.info(f"Stopped watching {new_mods_dir}")
+    finally:
+        history.close()
+        watcher.close()
 
-    save_history(history)
     return True
 
 
@@ -302,6 +762,75 @@ def main() -> bool:
     parser.add_argument(
         "--unpak_only", action="store_true", help="Only unpack the mods", required=False
     )
+    parser.add_argument(
+        "--unpak_backend",
+        choices=["native", "repak"],
+        help="Unpack with the native pak reader or repak (defaults to unpack_backend in the config)",
+        required=False,
+    )
+    parser.add_argument(
+        "--unpak_workers",
+        type=int,
+        help="The number of repak processes or native extraction threads to run at once",
+        required=False,
+    )
+    parser.add_argument(
+        "--merge_from_paks",
+        action="store_true",
+        help="Merge .pak files in the new_mods_dir without unpacking them",
+        required=False,
+    )
+    parser.add_argument(
+        "--update",
+        action="store_true",
+        help="Only apply the changes between the last merged version of a mod and its new version",
+        required=False,
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Keep running and unpack and merge new mods as they are added to the new_mods_dir (Linux only)",
+        required=False,
+    )
+    parser.add_argument(
+        "--pack",
+        action="store_true",
+        help="Pack the final_merged_mod_dir into a .pak file after merging",
+        required=False,
+    )
+    parser.add_argument(
+        "--pack_path",
+        help="The path of the .pak file to pack (defaults to the final_merged_mod_dir with a .pak extension)",
+        required=False,
+    )
+    parser.add_argument(
+        "--analyze",
+        action="store_true",
+        help="Only report which mods change which files and estimate the hunks to review, without merging",
+        required=False,
+    )
+    parser.add_argument(
+        "--analyze_report",
+        help="The path of the conflict report (defaults to the final_merged_mod_dir with a .conflicts.json extension)",
+        required=False,
+    )
+    parser.add_argument(
+        "--export_conflicts",
+        action="store_true",
+        help="Export the conflicts of every mod as conflict marker files to resolve offline, without merging",
+        required=False,
+    )
+    parser.add_argument(
+        "--apply_resolutions",
+        action="store_true",
+        help="Apply the resolved conflict files of an export, without merging",
+        required=False,
+    )
+    parser.add_argument(
+        "--resolutions_dir",
+        help="The directory conflicts are exported to and applied from (defaults to the final_merged_mod_dir with a .resolutions extension)",
+        required=False,
+    )
     parser.add_argument(
         "--org_comp",
         action="store_true",
@@ -332,6 +861,13 @@ def main() -> bool:
     logger.info(f"Confirm: {args.confirm}")
     logger.info(f"Unpak: {args.unpak or args.unpak_only}")
     logger.info(f"Org Comp: {args.org_comp}")
+    logger.info(f"Merge From Paks: {args.merge_from_paks}")
+    logger.info(f"Update: {args.update}")
+    logger.info(f"Pack: {args.pack}")
+    logger.info(f"Watch: {args.watch}")
+    logger.info(f"Analyze: {args.analyze}")
+    logger.info(f"Export Conflicts: {args.export_conflicts}")
+    logger.info(f"Apply Resolutions: {args.apply_resolutions}")
     logger.info(f"Resume: {args.resume}")
 
     # TODO: Add option to save default directories to the config file
@@ -346,21 +882,47 @@ def main() -> bool:
     sorted_new_mods_dir_list = sorted(new_mods_dir_list)
 
     # Unpack new mods or base game paks if requested
+    repak_path = args.repak_path
+    unpack_backend = args.unpak_backend
     if args.unpak or args.unpak_only:
-        if not args.repak_path:
-            logger.error("Set to unpack files but no repak path provided.")
-            return False
+        config = load_config("config.json")
+        unpack_backend = args.unpak_backend or config.get("unpack_backend", "native")
+        # Falls back to the repak path saved in the config
+        if unpack_backend == "repak":
+            repak_path = resolve_repak_path(repak_path, config)
+            if not repak_path:
+                return False
 
-        repak_path = args.repak_path
         pak_dir = new_mods_dir
         extract_dir = final_merged_mod_dir
-        unpack_files(repak_path, pak_dir, extract_dir, args.resume)
+        unpack_files(
+            repak_path,
+            pak_dir,
+            extract_dir,
+            args.resume,
+            args.unpak_workers,
+            unpack_backend,
+        )
 
-        if args.unpak_only:
+        if args.unpak_only and not args.watch:
             return True
 
+    # Analyze the unpacked mods instead of merging them
+    if args.analyze:
+        return analyze_mods(new_mods_dir, final_merged_mod_dir, args.analyze_report)
+
+    # Resolve the conflicts offline instead of in the merge prompts
+    if args.export_conflicts:
+        return export_mod_conflicts(
+            new_mods_dir, final_merged_mod_dir, args.resolutions_dir
+        )
+    if args.apply_resolutions:
+        return apply_mod_resolutions(
+            new_mods_dir, final_merged_mod_dir, args.resolutions_dir
+        )
+
     # Merge the new mods using merge_tool.py
-    merge_mods(
+    merged = args.unpak_only or merge_mods(
         sorted_new_mods_dir_list,
         new_mods_dir,
         final_merged_mod_dir,
@@ -368,8 +930,35 @@ def main() -> bool:
         args.confirm,
         args.org_comp,
         args.resume,
+        args.merge_from_paks,
+        args.update,
     )
 
+    # Pack the merged mods once every mod has been merged
+    if args.pack and not args.unpak_only:
+        if not merged:
+            logger.warning("Merge did not finish | Skipping pack")
+            return False
+        if not pack_merged_mod(final_merged_mod_dir, args.pack_path):
+            return False
+
+    if args.watch and merged:
+        return watch_new_mods(
+            new_mods_dir,
+            final_merged_mod_dir,
+            repak_path,
+            args.unpak or args.unpak_only,
+            args.unpak_only,
+            args.unpak_workers,
+            unpack_backend,
+            args.confirm,
+            args.org_comp,
+            args.merge_from_paks,
+            args.update,
+            args.pack,
+            args.pack_path,
+        )
+
     return True
 
 
@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+
+# Version 0.1.0
+
+"""This module contains functions to export conflicts as files and apply their resolutions."""
+
+# Export writes every text file the mods change in the merged tree as one copy of the merged
+#   file under <export_dir>/, with git style conflict markers around each changed region.
+# Hunks of different mods that overlap go in the same region, with a section per mod:
+#   <<<<<<< merged, the merged lines, then "=======" and the mod's lines for a single mod or
+#   "======= <mod>" before each mod's lines for several, closed by ">>>>>>> <mods>".
+# The files can be split up and resolved offline by removing the markers and keeping the
+#   lines wanted, in any editor. Apply then writes every resolved file back in one batch.
+# Each export records the hash of the merged file it was made from - a resolution whose
+#   merged file changed since the export is stale and is skipped instead of overwriting it.
+# Files a mod adds are copied on apply - several mods adding different versions of the same
+#   text file get a conflict file against an empty merged file instead.
+# A mod is fully merged once every file it touches is applied.
+
+import difflib
+import json
+import logging
+import os
+import shutil
+
+from conflict_handler import scan_mod_files
+from format_handler import load_compare_settings, normalize_line
+from hash_handler import files_identical, hash_file
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,  # Set the log level
+    format="%(asctime)s | %(levelname)s | %(message)s",  # Set the log format
+    handlers=[
+        # Log to a file - escape any bytes that aren't valid UTF-8
+        logging.FileHandler("merge_tool.log", errors="backslashreplace"),
+        logging.StreamHandler(),  # Also log to the console
+    ],
+)
+
+# Create a logger object
+logger = logging.getLogger(__name__)
+
+RESOLUTION_INDEX_FILE = "resolutions.json"
+MARKER_MERGED = b"<<<<<<< "
+MARKER_SEPARATOR = b"======="
+MARKER_NEW = b">>>>>>> "
+
+
+def get_resolutions_dir(final_merged_mod_dir) -> str:
+    """Get the default export directory of a final merged mod directory."""
+    return final_merged_mod_dir.rstrip("\\/") + ".resolutions"
+
+
+def end_with_newline(lines) -> list:
+    """Make sure the last line ends with a newline so a marker can follow it."""
+    if lines and not lines[-1].endswith(b"\n"):
+        return lines[:-1] + [lines[-1] + b"\n"]
+    return lines
+
+
+def get_mod_hunks(final_keys, new_keys) -> list:
+    """Get the (final_start, final_end, new_start, new_end) of every changed hunk of a mod."""
+    matcher = difflib.SequenceMatcher(None, final_keys, new_keys, autojunk=False)
+    return [
+        (final_start, final_end, new_start, new_end)
+        for tag, final_start, final_end, new_start, new_end in matcher.get_opcodes()
+        if tag != "equal"
+    ]
+
+
+def group_hunks(mod_hunks) -> list:
+    """Group the hunks of every mod into regions of the merged file, in order.
+    Hunks that overlap, or an insertion that touches another hunk, share a region.
+    Returns a list of (final_start, final_end, {mod_name: hunks})."""
+    hunks = sorted(
+        (hunk[0], hunk[1], mod_name, hunk)
+        for mod_name, mod_hunks_list in mod_hunks.items()
+        for hunk in mod_hunks_list
+    )
+    regions = []
+    for final_start, final_end, mod_name, hunk in hunks:
+        if regions:
+            region_start, region_end, region_hunks, insert_at_end = regions[-1]
+            if final_start < region_end or (
+                final_start == region_end
+                and (final_start == final_end or insert_at_end)
+            ):
+                region_hunks.setdefault(mod_name, []).append(hunk)
+                new_end = max(region_end, final_end)
+                regions[-1] = (
+                    region_start,
+                    new_end,
+                    region_hunks,
+                    (final_start == final_end == new_end)
+                    or (insert_at_end and new_end == region_end),
+                )
+                continue
+        regions.append(
+            (final_start, final_end, {mod_name: [hunk]}, final_start == final_end)
+        )
+    return [(start, end, region_hunks) for start, end, region_hunks, _ in regions]
+
+
+def apply_region_hunks(final_lines, new_lines, region_start, region_end, hunks) -> list:
+    """Get a mod's version of a region of the merged file from its hunks in it."""
+    lines = []
+    position = region_start
+    for final_start, final_end, new_start, new_end in hunks:
+        lines.extend(final_lines[position:final_start])
+        lines.extend(new_lines[new_start:new_end])
+        position = final_end
+    lines.extend(final_lines[position:region_end])
+    return lines
+
+
+def build_conflict_lines(final_lines, mods_lines, compare_settings=None):
+    """Build the merged file's lines with conflict markers around every region the mods
+    change, mods_lines holding the lines of each mod's version in order.
+    Returns the lines and the number of regions, 0 if the files are all the same."""
+    final_keys = final_lines
+    if compare_settings is not None:
+        final_keys = [normalize_line(line, compare_settings) for line in final_lines]
+
+    mod_hunks = {}
+    for mod_name, new_lines in mods_lines.items():
+        new_keys = new_lines
+        if compare_settings is not None:
+            new_keys = [normalize_line(line, compare_settings) for line in new_lines]
+        hunks = get_mod_hunks(final_keys, new_keys)
+        if hunks:
+            mod_hunks[mod_name] = hunks
+
+    conflict_lines = []
+    position = 0
+    regions = group_hunks(mod_hunks)
+    for region_start, region_end, region_hunks in regions:
+        conflict_lines.extend(final_lines[position:region_start])
+        position = region_end
+        conflict_lines = end_with_newline(conflict_lines)
+        conflict_lines.append(MARKER_MERGED + b"merged\n")
+        conflict_lines.extend(end_with_newline(final_lines[region_start:region_end]))
+        mod_names = [name for name in mods_lines if name in region_hunks]
+        for mod_name in mod_names:
+            if len(mod_names) == 1:
+                conflict_lines.append(MARKER_SEPARATOR + b"\n")
+            else:
+                conflict_lines.append(
+                    MARKER_SEPARATOR + b" " + mod_name.encode("utf-8") + b"\n"
+                )
+            conflict_lines.extend(
+                end_with_newline(
+                    apply_region_hunks(
+                        final_lines,
+                        mods_lines[mod_name],
+                        region_start,
+                        region_end,
+                        region_hunks[mod_name],
+                    )
+                )
+            )
+        conflict_lines.append(MARKER_NEW + ", ".join(mod_names).encode("utf-8") + b"\n")
+    conflict_lines.extend(final_lines[position:])
+    return conflict_lines, len(regions)
+
+
+def has_conflict_markers(file_path) -> bool:
+    """Check if a file still has conflict markers left in it."""
+    with open(file_path, "rb") as f:
+        for line in f:
+            if (
+                line.startswith(MARKER_MERGED)
+                or line.startswith(MARKER_NEW)
+                or line.rstrip(b"\r\n") == MARKER_SEPARATOR
+                or line.startswith(MARKER_SEPARATOR + b" ")
+            ):
+                return True
+    return False
+
+
+def write_file_atomic(file_path, lines) -> None:
+    """Write lines to a temp file next to file_path and move it into place."""
+    temp_file_path = file_path + ".tmp"
+    with open(temp_file_path, "wb") as f:
+        f.writelines(lines)
+    os.replace(temp_file_path, file_path)
+
+
+def read_lines(file_path) -> list:
+    """Read the lines of a file as bytes."""
+    with open(file_path, "rb") as f:
+        return f.readlines()
+
+
+def export_conflicts(new_mods_dir, final_merged_mod_dir, export_dir, config) -> dict:
+    """Export every text file the mods change in the final merged mod directory as one
+    conflict marker file with the hunks of all of them, and save an index of them to
+    apply the resolutions from."""
+    valid_file_extensions = config["valid_file_extensions"]
+    cfg_compare_settings = load_compare_settings(config)
+    entries = []
+    incomplete_mods = []
+
+    mod_names = sorted(
+        name
+        for name in os.listdir(new_mods_dir)
+        if os.path.isdir(os.path.join(new_mods_dir, name))
+    )
+    # The version of every file each mod has, in mod order
+    file_mods = {}
+    for mod_name in mod_names:
+        mod_files = scan_mod_files(os.path.join(new_mods_dir, mod_name))
+        for relative_path, mod_file_path in mod_files.items():
+            file_mods.setdefault(relative_path, {})[mod_name] = mod_file_path
+
+    for relative_path in sorted(file_mods):
+        mod_files = file_mods[relative_path]
+        final_file_path = os.path.join(final_merged_mod_dir, *relative_path.split("/"))
+        final_exists = os.path.isfile(final_file_path)
+        is_text = os.path.splitext(relative_path)[1] in valid_file_extensions
+        # New files have no conflict and are copied as they are, unless the mods
+        #   add different versions of them
+        if not final_exists:
+            first_path = next(iter(mod_files.values()))
+            differing_mods = [
+                mod_name
+                for mod_name, mod_file_path in mod_files.items()
+                if not files_identical(first_path, mod_file_path)
+            ]
+            if not differing_mods or not is_text:
+                entries.append(
+                    {
+                        "mods": [
+                            name for name in mod_files if name not in differing_mods
+                        ],
+                        "path": relative_path,
+                        "source": os.path.abspath(first_path),
+                    }
+                )
+                # Non-text files are left to the merge prompt
+                incomplete_mods.extend(differing_mods)
+                continue
+        # Non-text files are left to the merge prompt
+        elif not is_text:
+            final_hash = hash_file(final_file_path)
+            incomplete_mods.extend(
+                mod_name
+                for mod_name, mod_file_path in mod_files.items()
+                if hash_file(mod_file_path) != final_hash
+            )
+            continue
+
+        final_lines = read_lines(final_file_path) if final_exists else []
+        conflict_lines, hunks = build_conflict_lines(
+            final_lines,
+            {
+                mod_name: read_lines(mod_file_path)
+                for mod_name, mod_file_path in mod_files.items()
+            },
+            cfg_compare_settings if relative_path.endswith(".cfg") else None,
+        )
+        if not hunks:
+            continue
+
+        conflict_file_path = os.path.join(export_dir, *relative_path.split("/"))
+        os.makedirs(os.path.dirname(conflict_file_path), exist_ok=True)
+        with open(conflict_file_path, "wb") as f:
+            f.writelines(conflict_lines)
+
+        entries.append(
+            {
+                "mods": list(mod_files),
+                "path": relative_path,
+                "conflict_file": relative_path,
+                "merged_hash": hash_file(final_file_path) if final_exists else None,
+                "hunks": hunks,
+            }
+        )
+
+    index = {
+        "mods": {
+            mod_name: {"complete": mod_name not in incomplete_mods}
+            for mod_name in mod_names
+        },
+        "files": entries,
+    }
+    os.makedirs(export_dir, exist_ok=True)
+    with open(
+        os.path.join(export_dir, RESOLUTION_INDEX_FILE), "w", encoding="utf-8"
+    ) as f:
+        json.dump(index, f, indent=4)
+
+    conflict_entries = [entry for entry in entries if "conflict_file" in entry]
+    hunks = sum(entry["hunks"] for entry in conflict_entries)
+    logger.info(
+        f"Exported {len(conflict_entries)} files with {hunks} conflicting hunks to {export_dir}"
+    )
+    for mod_name in sorted(set(incomplete_mods)):
+        logger.info(f"Non-text files of {mod_name} are left to the merge prompt")
+    return {
+        "status": "exported",
+        "files": len(conflict_entries),
+        "new_files": len(entries) - len(conflict_entries),
+        "hunks": hunks,
+    }
+
+
+def apply_resolutions(export_dir, final_merged_mod_dir) -> dict:
+    """Write every resolved conflict file of an export into the final merged mod directory,
+    and copy the files the mods add. Files with markers left in them, or whose merged file
+    changed since the export, are left as they are and reported. The mods with all of their
+    files applied are returned as merged_mods."""
+    with open(
+        os.path.join(export_dir, RESOLUTION_INDEX_FILE), "r", encoding="utf-8"
+    ) as f:
+        index = json.load(f)
+
+    report = {"applied": [], "copied": [], "unresolved": [], "stale": [], "missing": []}
+    unmerged_mods = {
+        mod_name for mod_name, mod in index["mods"].items() if not mod["complete"]
+    }
+    for entry in index["files"]:
+        final_file_path = os.path.join(final_merged_mod_dir, *entry["path"].split("/"))
+        if "source" in entry:
+            if not os.path.isfile(entry["source"]):
+                report["missing"].append(entry["source"])
+                unmerged_mods.update(entry["mods"])
+            elif not os.path.exists(final_file_path):
+                os.makedirs(os.path.dirname(final_file_path), exist_ok=True)
+                shutil.copy2(entry["source"], final_file_path)
+                report["copied"].append(entry["path"])
+            elif files_identical(entry["source"], final_file_path):
+                # Copied by an earlier apply
+                report["copied"].append(entry["path"])
+            else:
+                report["stale"].append(entry["path"])
+                unmerged_mods.update(entry["mods"])
+            continue
+
+        conflict_file_path = os.path.join(
+            export_dir, *entry["conflict_file"].split("/")
+        )
+        if not os.path.isfile(conflict_file_path):
+            report["missing"].append(entry["conflict_file"])
+            unmerged_mods.update(entry["mods"])
+            continue
+        if has_conflict_markers(conflict_file_path):
+            report["unresolved"].append(entry["conflict_file"])
+            unmerged_mods.update(entry["mods"])
+            continue
+        if os.path.isfile(final_file_path) and files_identical(
+            conflict_file_path, final_file_path
+        ):
+            # Applied by an earlier apply
+            report["applied"].append(entry["conflict_file"])
+            continue
+        # The merged file changed since the export, the resolution needs exporting again
+        merged_hash = (
+            hash_file(final_file_path) if os.path.isfile(final_file_path) else None
+        )
+        if merged_hash != entry["merged_hash"]:
+            report["stale"].append(entry["conflict_file"])
+            unmerged_mods.update(entry["mods"])
+            continue
+
+        os.makedirs(os.path.dirname(final_file_path), exist_ok=True)
+        write_file_atomic(final_file_path, read_lines(conflict_file_path))
+        report["applied"].append(entry["conflict_file"])
+
+    logger.info(
+        f"Applied: {len(report['applied'])} | Copied: {len(report['copied'])} | Unresolved: {len(report['unresolved'])} | "
+        f"Stale: {len(report['stale'])} | Missing: {len(report['missing'])}"
+    )
+    for status in ("unresolved", "stale", "missing"):
+        for conflict_file in report[status]:
+            logger.warning(f"{status.capitalize()}: {conflict_file}")
+
+    report["merged_mods"] = sorted(set(index["mods"]) - unmerged_mods)
+    report["status"] = (
+        "applied"
+        if not report["unresolved"] and not report["stale"] and not report["missing"]
+        else "applied_with_errors"
+    )
+    return report
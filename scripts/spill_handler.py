@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+
+# Version 0.1.0
+
+"""This module contains the memory budget and the list that spills its items to disk."""
+
+# memory_budget_mb caps what one merge holds in memory. The chunk size is lowered when the
+#   chunks themselves wouldn't fit, and the diff, hunk, and merged line buffers spill their
+#   items to a temp file in batches once they pass their share of the budget.
+# A budget of 0 keeps everything in memory with the configured chunk size.
+
+import logging
+import os
+import pickle
+import sys
+import tempfile
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,  # Set the log level
+    format="%(asctime)s | %(levelname)s | %(message)s",  # Set the log format
+    handlers=[
+        # Log to a file - escape any bytes that aren't valid UTF-8
+        logging.FileHandler("merge_tool.log", errors="backslashreplace"),
+        logging.StreamHandler(),  # Also log to the console
+    ],
+)
+
+# Create a logger object
+logger = logging.getLogger(__name__)
+
+# Copies of a chunk line held at once while a chunk is compared and diffed: the raw and
+#   decoded lines of both chunks and difflib's index of them
+CHUNK_LINE_COPIES = 6
+# Share of the budget each spilling buffer may hold before it spills
+SPILL_SHARE = 8
+# Smallest chunk size the budget can lower the chunk size to
+MIN_CHUNK_SIZE = 64
+# Bytes of each file read to estimate its line length
+LINE_SAMPLE_SIZE = 64 * 1024
+
+
+def get_memory_budget(config) -> int:
+    """Get the memory budget in bytes from the config - 0 means no budget."""
+    return max(0, int(config.get("memory_budget_mb", 0) * 1024 * 1024))
+
+
+def get_spill_bytes(memory_budget) -> int:
+    """Get how many bytes a spilling buffer may hold, or None if it never spills."""
+    return memory_budget // SPILL_SHARE if memory_budget else None
+
+
+def estimate_line_size(file_path) -> int:
+    """Estimate the memory a line of a file takes from the start of the file."""
+    try:
+        with open(file_path, "rb") as f:
+            sample = f.read(LINE_SAMPLE_SIZE)
+    except OSError:
+        return 0
+    lines = sample.count(b"\n") or 1
+    return sys.getsizeof(b"") + len(sample) // lines
+
+
+def fit_chunk_size(max_perf_chunk_size, file_paths, memory_budget) -> int:
+    """Lower the chunk size until the chunks of the files being merged fit the budget."""
+    if not memory_budget:
+        return max_perf_chunk_size
+
+    line_size = max(estimate_line_size(file_path) for file_path in file_paths)
+    budget_lines = memory_budget // max(1, line_size * CHUNK_LINE_COPIES)
+    if budget_lines >= max_perf_chunk_size:
+        return max_perf_chunk_size
+
+    chunk_size = max(MIN_CHUNK_SIZE, budget_lines)
+    logger.info(
+        f"Lowering the chunk size from {max_perf_chunk_size} to {chunk_size} lines to fit the memory budget"
+    )
+    return chunk_size
+
+
+class SpillList:
+    """A list that is appended to and read in order, which moves its items to a temp
+    file in batches once they take more than spill_bytes of memory.
+    Slices only load the spilled batches they overlap. With spill_bytes None it never
+    spills. size_of estimates the memory of an item. The temp file is deleted when the
+    list is closed or garbage collected."""
+
+    def __init__(self, spill_bytes=None, items=(), size_of=sys.getsizeof):
+        self.spill_bytes = spill_bytes
+        self.size_of = size_of
+        self._items = []
+        self._size = 0
+        self._file = None
+        # (first index, item count, file offset) of every spilled batch
+        self._batches = []
+        # Items moved to the temp file so far
+        self.spilled_count = 0
+        self.extend(items)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self.spilled_count + len(self._items)
+
+    def append(self, item) -> None:
+        """Add an item, spilling the items in memory if they pass spill_bytes."""
+        self._items.append(item)
+        if self.spill_bytes is None:
+            return
+        self._size += self.size_of(item)
+        if self._size > self.spill_bytes:
+            self.spill()
+
+    def extend(self, items) -> None:
+        """Add every item of an iterable."""
+        if self.spill_bytes is None:
+            self._items.extend(items)
+            return
+        for item in items:
+            self.append(item)
+
+    def spill(self) -> None:
+        """Move the items in memory to the temp file as one batch."""
+        if not self._items:
+            return
+        if self._file is None:
+            self._file = tempfile.TemporaryFile(  # pylint: disable=consider-using-with
+                prefix="pak_merge_tool_", suffix=".spill"
+            )
+            logger.debug("Spilling to a temp file to stay within the memory budget")
+        self._file.seek(0, os.SEEK_END)
+        self._batches.append((self.spilled_count, len(self._items), self._file.tell()))
+        pickle.dump(self._items, self._file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.spilled_count += len(self._items)
+        self._items = []
+        self._size = 0
+
+    def _load_batch(self, offset) -> list:
+        self._file.seek(offset)
+        return pickle.load(self._file)
+
+    def __iter__(self):
+        for _, _, offset in self._batches:
+            yield from self._load_batch(offset)
+        yield from list(self._items)
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            items = self[index : index + 1] if index >= 0 else self[index:][:1]
+            if not items:
+                raise IndexError("SpillList index out of range")
+            return items[0]
+
+        start, stop, step = index.indices(len(self))
+        if step != 1:
+            return list(self)[index]
+
+        items = []
+        for first, count, offset in self._batches:
+            if first + count <= start or first >= stop:
+                continue
+            batch = self._load_batch(offset)
+            items.extend(batch[max(0, start - first) : stop - first])
+        if stop > self.spilled_count:
+            items.extend(
+                self._items[
+                    max(0, start - self.spilled_count) : stop - self.spilled_count
+                ]
+            )
+        return items
+
+    def close(self) -> None:
+        """Delete the temp file."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._batches = []
+        self.spilled_count = 0
+        self._items = []
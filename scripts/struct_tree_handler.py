@@ -0,0 +1,424 @@
+#!/usr/bin/env python3
+
+# Version 0.1.0
+
+"""This module contains a hash tree over the struct blocks of cfg files."""
+
+# Every struct.begin/struct.end block is a node whose hash covers its header, children,
+#   and end line, and every run of lines between structs is a leaf node.
+# Two versions of a file are compared by aligning the node hashes of each level and only
+#   descending into structs whose hashes differ, so unchanged structs are never compared
+#   line by line. The result is a list of equal and changed line ranges.
+# Blocks that were deleted in one place and inserted unchanged in another are reported
+#   as moved instead of changed.
+# With compare settings, lines are hashed normalized, e.g. without indentation, so
+#   whitespace only changes leave the hashes equal.
+# Trees are cached under configs/cache, keyed by the file's content hash and size and the
+#   compare settings, so copies of a file, e.g. mod files read out of a pak into a new temp
+#   directory each run, share one entry. The least recently used entries are pruned once
+#   there are more than STRUCT_TREE_CACHE_MAX_ENTRIES.
+
+import difflib
+import hashlib
+import json
+import logging
+import os
+
+from collections import Counter
+from format_handler import normalize_line
+from hash_handler import HASH_ALGORITHM, hash_file
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,  # Set the log level
+    format="%(asctime)s | %(levelname)s | %(message)s",  # Set the log format
+    handlers=[
+        # Log to a file - escape any bytes that aren't valid UTF-8
+        logging.FileHandler("merge_tool.log", errors="backslashreplace"),
+        logging.StreamHandler(),  # Also log to the console
+    ],
+)
+
+# Create a logger object
+logger = logging.getLogger(__name__)
+
+# Struct tree cache directory: ..\configs\cache\struct_trees
+STRUCT_TREE_CACHE_DIR = os.path.join(
+    os.path.dirname(__file__), "..", "configs", "cache", "struct_trees"
+)
+# Bumped when the layout of the cached trees changes
+STRUCT_TREE_CACHE_VERSION = 2
+STRUCT_TREE_CACHE_MAX_ENTRIES = 2000
+# Share of the entries left after a prune, so the cache isn't pruned on every write
+STRUCT_TREE_CACHE_PRUNE_TO = 0.9
+
+STRUCT_BEGIN = b"struct.begin"
+STRUCT_END = b"struct.end"
+
+# Segment kinds
+SEGMENT_EQUAL = "equal"
+SEGMENT_CHANGED = "changed"
+SEGMENT_MOVED = "moved"
+
+
+def new_node(start) -> dict:
+    """Create a struct node starting at a line."""
+    return {"start": start, "end": start, "hash": "", "children": []}
+
+
+def close_run(parent, run_start, run_end, run_hash, run_blank=False) -> None:
+    """Add the run of plain lines in progress to a node's children.
+    Runs of only blank lines are marked, as they all hash the same."""
+    if run_start is None:
+        return
+    run = {"start": run_start, "end": run_end, "hash": run_hash.hexdigest()}
+    if run_blank:
+        run["blank"] = True
+    parent["children"].append(run)
+
+
+def close_struct(node, end, end_line) -> None:
+    """Set the end and hash of a struct node from its header, children and end line."""
+    header = node.pop("header")
+    node["end"] = end
+    node["closed"] = end_line is not None
+    node["begin_hash"] = hashlib.new(HASH_ALGORITHM, header).hexdigest()
+    node["end_hash"] = hashlib.new(HASH_ALGORITHM, end_line or b"").hexdigest()
+    struct_hash = hashlib.new(HASH_ALGORITHM, header)
+    for child in node["children"]:
+        struct_hash.update(bytes.fromhex(child["hash"]))
+    struct_hash.update(end_line or b"")
+    node["hash"] = struct_hash.hexdigest()
+
+
+def build_struct_tree(lines, compare_settings=None) -> list:
+    """Build the hash tree of an iterable of byte lines and return the top level nodes.
+    Each node has its [start, end) line range and hash, and structs have children
+    that cover every line between their struct.begin and struct.end lines.
+    Lines are hashed normalized with compare_settings if they are given."""
+    stack = [new_node(0)]
+    run_start = None
+    run_hash = None
+    run_blank = True
+    line_count = 0
+    for raw_line in lines:
+        line = raw_line
+        if compare_settings is not None:
+            line = normalize_line(raw_line, compare_settings)
+        if STRUCT_BEGIN in line:
+            close_run(stack[-1], run_start, line_count, run_hash, run_blank)
+            run_start = None
+            node = new_node(line_count)
+            node["header"] = line
+            stack.append(node)
+        elif STRUCT_END in line and len(stack) > 1:
+            close_run(stack[-1], run_start, line_count, run_hash, run_blank)
+            run_start = None
+            node = stack.pop()
+            close_struct(node, line_count + 1, line)
+            stack[-1]["children"].append(node)
+        else:
+            if run_start is None:
+                run_start = line_count
+                run_hash = hashlib.new(HASH_ALGORITHM)
+                run_blank = True
+            # Hash each line with its end so runs of lines can't run together.
+            #   Lines left empty by normalizing don't count.
+            if line:
+                run_hash.update(line + b"\n")
+            if line.strip():
+                run_blank = False
+        line_count += 1
+
+    close_run(stack[-1], run_start, line_count, run_hash, run_blank)
+    # Structs left open at the end of the file end with it
+    while len(stack) > 1:
+        node = stack.pop()
+        close_struct(node, line_count, None)
+        stack[-1]["children"].append(node)
+
+    return stack[0]["children"]
+
+
+def get_cache_path(content_hash, size, compare_key) -> str:
+    """Get the cache file of the struct tree of a file's content."""
+    cache_key = hashlib.sha1(
+        f"{STRUCT_TREE_CACHE_VERSION}|{content_hash}|{size}|{compare_key}".encode(
+            "utf-8"
+        )
+    ).hexdigest()
+    return os.path.join(STRUCT_TREE_CACHE_DIR, cache_key + ".json")
+
+
+def prune_struct_tree_cache(max_entries=STRUCT_TREE_CACHE_MAX_ENTRIES) -> int:
+    """Delete the least recently used cached trees once there are more than max_entries.
+    Returns the number of entries deleted."""
+    try:
+        with os.scandir(STRUCT_TREE_CACHE_DIR) as entries:
+            cache_entries = [entry for entry in entries if entry.name.endswith(".json")]
+    except OSError:
+        return 0
+    if len(cache_entries) <= max_entries:
+        return 0
+
+    cache_entries.sort(key=lambda entry: entry.stat().st_mtime_ns)
+    stale_entries = cache_entries[
+        : len(cache_entries) - int(max_entries * STRUCT_TREE_CACHE_PRUNE_TO)
+    ]
+    for entry in stale_entries:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+    logger.debug(f"Pruned {len(stale_entries)} cached struct trees")
+    return len(stale_entries)
+
+
+def load_struct_tree(file_path, compare_settings=None) -> list:
+    """Load the struct tree of a file from the cache, or build and cache it
+    if no file with the same content was cached with the same compare settings."""
+    stat = os.stat(file_path)
+    compare_key = repr(sorted(compare_settings.items())) if compare_settings else ""
+    cache_path = get_cache_path(hash_file(file_path), stat.st_size, compare_key)
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            cached = json.load(f)
+        # Mark the entry as used so it is pruned last
+        os.utime(cache_path)
+        return cached["tree"]
+    except (OSError, ValueError, KeyError):
+        pass
+
+    with open(file_path, "rb") as f:
+        tree = build_struct_tree(f, compare_settings)
+
+    try:
+        os.makedirs(STRUCT_TREE_CACHE_DIR, exist_ok=True)
+        part_path = cache_path + ".part"
+        with open(part_path, "w", encoding="utf-8") as f:
+            json.dump({"tree": tree}, f)
+        os.replace(part_path, cache_path)
+        prune_struct_tree_cache()
+    except OSError as e:
+        logger.warning(f"Unable to cache the struct tree of {file_path}: {e}")
+
+    return tree
+
+
+def add_segment(segments, kind, old_start, old_end, new_start, new_end) -> None:
+    """Add a line range to the segments, joining it to the last one if it's the same kind."""
+    if old_start == old_end and new_start == new_end:
+        return
+    if segments and segments[-1][0] == kind:
+        segments[-1] = (kind, segments[-1][1], old_end, segments[-1][3], new_end)
+        return
+    segments.append((kind, old_start, old_end, new_start, new_end))
+
+
+def segment_kind(equal) -> str:
+    """Get the kind of a segment from whether its lines are equal."""
+    return SEGMENT_EQUAL if equal else SEGMENT_CHANGED
+
+
+def node_offset(nodes, index, line_range) -> int:
+    """Get the first line of nodes[index], or the end of the range past the last node."""
+    return nodes[index]["start"] if index < len(nodes) else line_range[1]
+
+
+def node_key(node, by_header) -> str:
+    """Get the key a node is aligned by - its hash, or its header for structs
+    when pairing up structs that changed."""
+    if by_header:
+        return node.get("begin_hash", node["hash"])
+    return node["hash"]
+
+
+def find_moved_opcodes(old_nodes, new_nodes, opcodes) -> set:
+    """Find the changed opcodes whose blocks were all moved, as (old_i1, new_i1).
+    Blocks are paired by count, so a block removed twice and added once, or one
+    duplicated, isn't a move. Runs of blank lines are never moved."""
+    candidates = {}
+    for tag, old_i1, old_i2, new_i1, new_i2 in opcodes:
+        old_block = old_nodes[old_i1:old_i2]
+        new_block = new_nodes[new_i1:new_i2]
+        if tag != "equal" and not any(
+            node.get("blank") for node in old_block + new_block
+        ):
+            candidates[(old_i1, new_i1)] = (
+                Counter(node["hash"] for node in old_block),
+                Counter(node["hash"] for node in new_block),
+            )
+
+    # Drop the opcodes with a block that isn't removed as many times as it is added
+    #   by the other candidates, until every block left pairs up
+    while candidates:
+        old_counts = Counter()
+        new_counts = Counter()
+        for old_block_counts, new_block_counts in candidates.values():
+            old_counts.update(old_block_counts)
+            new_counts.update(new_block_counts)
+        unpaired = {
+            block_hash
+            for block_hash in old_counts | new_counts
+            if old_counts[block_hash] != new_counts[block_hash]
+        }
+        if not unpaired:
+            break
+        candidates = {
+            key: counts
+            for key, counts in candidates.items()
+            if unpaired.isdisjoint(counts[0]) and unpaired.isdisjoint(counts[1])
+        }
+    return set(candidates)
+
+
+def diff_nodes(
+    old_nodes, new_nodes, old_range, new_range, segments, by_header=False
+) -> None:
+    """Align two lists of sibling nodes by hash and add their segments.
+    Nodes that only moved are marked as moved, nodes that were replaced are aligned
+    again by their struct headers, and pairs of structs with the same header are
+    descended into."""
+    matcher = difflib.SequenceMatcher(
+        None,
+        [node_key(node, by_header) for node in old_nodes],
+        [node_key(node, by_header) for node in new_nodes],
+        autojunk=False,
+    )
+    opcodes = matcher.get_opcodes()
+
+    # Blocks removed from one place and added unchanged in another have moved
+    moved_opcodes = set()
+    if not by_header:
+        moved_opcodes = find_moved_opcodes(old_nodes, new_nodes, opcodes)
+
+    for tag, old_i1, old_i2, new_i1, new_i2 in opcodes:
+        # Sibling nodes cover their range without gaps, so a run of nodes
+        #   ends where the node after it starts
+        old_start = node_offset(old_nodes, old_i1, old_range)
+        old_end = node_offset(old_nodes, old_i2, old_range)
+        new_start = node_offset(new_nodes, new_i1, new_range)
+        new_end = node_offset(new_nodes, new_i2, new_range)
+
+        if tag == "equal" and by_header:
+            for old_struct, new_struct in zip(
+                old_nodes[old_i1:old_i2], new_nodes[new_i1:new_i2]
+            ):
+                if old_struct["hash"] == new_struct["hash"]:
+                    add_segment(
+                        segments,
+                        SEGMENT_EQUAL,
+                        old_struct["start"],
+                        old_struct["end"],
+                        new_struct["start"],
+                        new_struct["end"],
+                    )
+                else:
+                    diff_structs(old_struct, new_struct, segments)
+        elif tag == "equal":
+            add_segment(segments, SEGMENT_EQUAL, old_start, old_end, new_start, new_end)
+        elif (old_i1, new_i1) in moved_opcodes:
+            add_segment(segments, SEGMENT_MOVED, old_start, old_end, new_start, new_end)
+        elif tag == "replace" and not by_header:
+            diff_nodes(
+                old_nodes[old_i1:old_i2],
+                new_nodes[new_i1:new_i2],
+                (old_start, old_end),
+                (new_start, new_end),
+                segments,
+                by_header=True,
+            )
+        else:
+            add_segment(
+                segments, SEGMENT_CHANGED, old_start, old_end, new_start, new_end
+            )
+
+
+def diff_structs(old_struct, new_struct, segments) -> None:
+    """Add the segments of two structs in the same place that have different hashes."""
+    # The struct.begin lines
+    add_segment(
+        segments,
+        segment_kind(old_struct["begin_hash"] == new_struct["begin_hash"]),
+        old_struct["start"],
+        old_struct["start"] + 1,
+        new_struct["start"],
+        new_struct["start"] + 1,
+    )
+    old_body_end = old_struct["end"] - (1 if old_struct["closed"] else 0)
+    new_body_end = new_struct["end"] - (1 if new_struct["closed"] else 0)
+    diff_nodes(
+        old_struct["children"],
+        new_struct["children"],
+        (old_struct["start"] + 1, old_body_end),
+        (new_struct["start"] + 1, new_body_end),
+        segments,
+    )
+    # The struct.end lines
+    add_segment(
+        segments,
+        segment_kind(old_struct["end_hash"] == new_struct["end_hash"]),
+        old_body_end,
+        old_struct["end"],
+        new_body_end,
+        new_struct["end"],
+    )
+
+
+def diff_struct_trees(old_tree, new_tree) -> list:
+    """Compare two struct trees and return the (kind, old_start, old_end, new_start, new_end)
+    segments that cover both files in order, where kind is equal, changed, or moved."""
+    segments = []
+    old_line_count = old_tree[-1]["end"] if old_tree else 0
+    new_line_count = new_tree[-1]["end"] if new_tree else 0
+    diff_nodes(old_tree, new_tree, (0, old_line_count), (0, new_line_count), segments)
+    return segments
+
+
+def coalesce_segments(segments, max_lines) -> list:
+    """Join changed segments separated by a short equal segment into one changed segment,
+    as long as it stays within max_lines on both sides, so nearby changes are reviewed
+    together."""
+    coalesced = []
+    for segment in segments:
+        if (
+            segment[0] == SEGMENT_CHANGED
+            and len(coalesced) >= 2
+            and coalesced[-1][0] == SEGMENT_EQUAL
+            and coalesced[-2][0] == SEGMENT_CHANGED
+            and segment[2] - coalesced[-2][1] <= max_lines
+            and segment[4] - coalesced[-2][3] <= max_lines
+        ):
+            previous = coalesced[-2]
+            coalesced[-2:] = [
+                (SEGMENT_CHANGED, previous[1], segment[2], previous[3], segment[4])
+            ]
+        else:
+            coalesced.append(segment)
+    return coalesced
+
+
+def read_lines(file, count) -> list:
+    """Read up to count lines from a file."""
+    return [
+        line for line in (next(file, None) for _ in range(count)) if line is not None
+    ]
+
+
+def iter_segment_chunks(old_file, new_file, segments, max_perf_chunk_size):
+    """Read two open files along their segments and yield (old_chunk, new_chunk, kind)
+    of at most max_perf_chunk_size lines each. Equal segments yield chunks that compare
+    equal with the compare settings the trees were built with, which can still differ
+    byte for byte, e.g. in indentation, when whitespace is normalized."""
+    for kind, old_start, old_end, new_start, new_end in segments:
+        old_size = old_end - old_start
+        new_size = new_end - new_start
+        while old_size or new_size:
+            old_chunk = read_lines(old_file, min(old_size, max_perf_chunk_size))
+            new_chunk = read_lines(new_file, min(new_size, max_perf_chunk_size))
+            if not old_chunk and not new_chunk:
+                # The files are shorter than their trees - they changed since
+                return
+            old_size -= min(old_size, max_perf_chunk_size)
+            new_size -= min(new_size, max_perf_chunk_size)
+            yield old_chunk, new_chunk, kind
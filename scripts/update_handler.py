@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+
+# Version 0.1.0
+
+"""This module contains functions to apply a mod's version update to the merged tree."""
+
+# The old and new versions of a mod are diffed file by file, and only the changed files
+#   are touched. For each changed text file the hunks between the old and new version are
+#   applied to the merged file wherever the old lines still sit unchanged in it.
+# A hunk that overlaps lines another mod changed is a conflict, and the file falls back
+#   to the normal interactive merge.
+
+import difflib
+import logging
+import os
+
+from format_handler import load_compare_settings, normalize_line
+from hash_handler import hash_blocks
+from merge_tool import merge_file
+from walk_handler import get_relative_path, walk_tree
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,  # Set the log level
+    format="%(asctime)s | %(levelname)s | %(message)s",  # Set the log format
+    handlers=[
+        # Log to a file - escape any bytes that aren't valid UTF-8
+        logging.FileHandler("merge_tool.log", errors="backslashreplace"),
+        logging.StreamHandler(),  # Also log to the console
+    ],
+)
+
+# Create a logger object
+logger = logging.getLogger(__name__)
+
+
+def list_mod_files(source_fs, root) -> dict:
+    """List every file below root as relative path to size."""
+    mod_files = {}
+    for item in walk_tree(root, source_fs=source_fs):
+        relative_path = get_relative_path(item["new_path"], root)
+        mod_files[relative_path] = source_fs.getsize(item["new_path"])
+    return mod_files
+
+
+def diff_mod_trees(old_fs, old_root, new_fs, new_root) -> dict:
+    """Compare two versions of a mod and list the added, changed, and removed files."""
+    old_files = list_mod_files(old_fs, old_root)
+    new_files = list_mod_files(new_fs, new_root)
+
+    changed_files = []
+    for relative_path in sorted(set(old_files) & set(new_files)):
+        if old_files[relative_path] != new_files[relative_path]:
+            changed_files.append(relative_path)
+            continue
+
+        # Same size - compare the content hashes streamed from both versions
+        old_item = os.path.join(old_root, *relative_path.split("/"))
+        new_item = os.path.join(new_root, *relative_path.split("/"))
+        if hash_blocks(old_fs.iter_blocks(old_item)) != hash_blocks(
+            new_fs.iter_blocks(new_item)
+        ):
+            changed_files.append(relative_path)
+
+    return {
+        "added": sorted(set(new_files) - set(old_files)),
+        "changed": changed_files,
+        "removed": sorted(set(old_files) - set(new_files)),
+    }
+
+
+def match_merged_lines(lines, replaced_lines, merged_lines, reindent=False) -> list:
+    """Write the lines taken from a mod the way the merged file writes them - with its
+    line ending, and the indentation of the merged lines they replace if reindent is set.
+    """
+    if not merged_lines or not isinstance(merged_lines[0], bytes):
+        return lines
+    newline = b"\r\n" if merged_lines[0].endswith(b"\r\n") else b"\n"
+    matched_lines = []
+    for index, line in enumerate(lines):
+        if line.endswith(b"\n"):
+            line = line.rstrip(b"\r\n") + newline
+        if reindent and index < len(replaced_lines) and line.strip():
+            replaced_line = replaced_lines[index]
+            indent = replaced_line[: len(replaced_line) - len(replaced_line.lstrip())]
+            line = indent + line.lstrip()
+        matched_lines.append(line)
+    return matched_lines
+
+
+def apply_version_delta(old_lines, new_lines, merged_lines, compare_settings=None):
+    """Apply the hunks between the old and new lines of a mod file to the merged lines.
+    Lines are matched on their normalize_line keys if compare_settings are given, so
+    reindented lines or other line endings in the merged file still anchor the hunks.
+    Returns the updated merged lines, or None if a hunk conflicts with the merged file.
+    """
+    old_keys, new_keys, merged_keys = old_lines, new_lines, merged_lines
+    if compare_settings is not None:
+        old_keys, new_keys, merged_keys = (
+            [normalize_line(line, compare_settings) for line in lines]
+            for lines in (old_lines, new_lines, merged_lines)
+        )
+
+    # Map every old line that survived unchanged into the merged file to its position there
+    old_to_merged = {}
+    matcher = difflib.SequenceMatcher(None, old_keys, merged_keys, autojunk=False)
+    for block in matcher.get_matching_blocks():
+        for offset in range(block.size):
+            old_to_merged[block.a + offset] = block.b + offset
+
+    edits = []
+    matcher = difflib.SequenceMatcher(None, old_keys, new_keys, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            continue
+
+        # The replaced old lines must all still be in the merged file, next to each other
+        if i2 > i1:
+            merged_positions = [old_to_merged.get(i) for i in range(i1, i2)]
+            if None in merged_positions or merged_positions != list(
+                range(merged_positions[0], merged_positions[0] + i2 - i1)
+            ):
+                return None
+            start, end = merged_positions[0], merged_positions[-1] + 1
+        elif i1 > 0 and i1 - 1 in old_to_merged:
+            start = end = old_to_merged[i1 - 1] + 1
+        elif i1 < len(old_lines) and i1 in old_to_merged:
+            start = end = old_to_merged[i1]
+        elif not old_lines and not merged_lines:
+            start = end = 0
+        else:
+            return None
+
+        # The context lines around the hunk must be unchanged in the merged file too
+        if i1 == 0 and start != 0:
+            return None
+        if i1 > 0 and old_to_merged.get(i1 - 1) != start - 1:
+            return None
+        if i2 == len(old_lines) and end != len(merged_lines):
+            return None
+        if i2 < len(old_lines) and old_to_merged.get(i2) != end:
+            return None
+
+        lines = match_merged_lines(
+            new_lines[j1:j2],
+            merged_lines[start:end],
+            merged_lines,
+            compare_settings is not None and compare_settings["ignore_whitespace"],
+        )
+        edits.append((start, end, lines))
+
+    # Lines outside the hunks are the merged file's own lines
+    updated_lines = list(merged_lines)
+    for start, end, lines in reversed(edits):
+        updated_lines[start:end] = lines
+    return updated_lines
+
+
+def read_mod_file(source_fs, path) -> bytes:
+    """Read the whole contents of a mod file."""
+    return b"".join(source_fs.iter_blocks(path))
+
+
+def write_file_atomic(file_path, data) -> None:
+    """Write a file through a temporary file so it is never left half written."""
+    temp_file_path = file_path + ".update.tmp"
+    with open(temp_file_path, "wb") as f:
+        f.write(data)
+    os.replace(temp_file_path, file_path)
+
+
+def update_mod(
+    old_fs,
+    old_root,
+    new_fs,
+    new_root,
+    final_merged_mod_dir,
+    valid_requirements,
+    config,
+    confirm_user_choice=False,
+    org_comp=False,
+) -> str:
+    """Apply the changes between two versions of a mod to the final merged mod directory."""
+    changes = diff_mod_trees(old_fs, old_root, new_fs, new_root)
+    logger.info(
+        f"Update from {old_root} to {new_root}: {len(changes['added'])} added, "
+        f"{len(changes['changed'])} changed, {len(changes['removed'])} removed files"
+    )
+
+    for relative_path in changes["removed"]:
+        logger.warning(
+            f"File removed in the new version, left in the merged tree: {relative_path}"
+        )
+
+    valid_file_extensions = config["valid_file_extensions"]
+    compare_settings = load_compare_settings(config)
+    for relative_path in changes["added"] + changes["changed"]:
+        old_item = os.path.join(old_root, *relative_path.split("/"))
+        new_item = os.path.join(new_root, *relative_path.split("/"))
+        final_merged_mod_item = os.path.join(
+            final_merged_mod_dir, *relative_path.split("/")
+        )
+
+        if relative_path in changes["changed"] and os.path.exists(
+            final_merged_mod_item
+        ):
+            old_data = read_mod_file(old_fs, old_item)
+            new_data = read_mod_file(new_fs, new_item)
+            with open(final_merged_mod_item, "rb") as f:
+                merged_data = f.read()
+
+            # No other mod touched the file - the new version replaces it as is
+            if merged_data == old_data:
+                logger.info(f"Replacing unmerged file: {relative_path}")
+                write_file_atomic(final_merged_mod_item, new_data)
+                continue
+
+            if os.path.splitext(relative_path)[1] in valid_file_extensions:
+                updated_lines = apply_version_delta(
+                    old_data.splitlines(keepends=True),
+                    new_data.splitlines(keepends=True),
+                    merged_data.splitlines(keepends=True),
+                    compare_settings,
+                )
+                if updated_lines is not None:
+                    logger.info(f"Applied version changes to: {relative_path}")
+                    write_file_atomic(final_merged_mod_item, b"".join(updated_lines))
+                    continue
+
+            logger.info(f"Version changes conflict, merging: {relative_path}")
+
+        if not org_comp:
+            os.makedirs(os.path.dirname(final_merged_mod_item), exist_ok=True)
+        result = merge_file(
+            new_item,
+            final_merged_mod_item,
+            valid_requirements,
+            config,
+            confirm_user_choice,
+            org_comp,
+            new_fs,
+        )
+        if result == "quit":
+            return "quit"
+
+    return "continue"
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+
+# Version 0.1.0
+
+"""This module contains the file systems the merge tool reads new mods through."""
+
+# The OS file system reads an unpacked mod directory on disk.
+# The pak file system lists and streams entries straight out of a .pak file
+#   so only files that need merging are written to disk.
+
+import logging
+import os
+import shutil
+import tempfile
+
+from hash_handler import blocks_identical, files_identical
+from pak_handler import PakReader, join_entry_path
+from walk_handler import list_entries
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,  # Set the log level
+    format="%(asctime)s | %(levelname)s | %(message)s",  # Set the log format
+    handlers=[
+        # Log to a file - escape any bytes that aren't valid UTF-8
+        logging.FileHandler("merge_tool.log", errors="backslashreplace"),
+        logging.StreamHandler(),  # Also log to the console
+    ],
+)
+
+# Create a logger object
+logger = logging.getLogger(__name__)
+
+
+class OsFileSystem:
+    """Read new mods from a directory tree on disk."""
+
+    def listdir(self, path) -> list:
+        """List the names in a directory."""
+        return os.listdir(path)
+
+    def list_entries(self, path) -> list:
+        """List the names in a directory with whether each one is a directory,
+        using the types os.scandir reads along with the names."""
+        return list_entries(path)
+
+    def isdir(self, path) -> bool:
+        """Check if a path is a directory."""
+        return os.path.isdir(path)
+
+    def exists(self, path) -> bool:
+        """Check if a path exists."""
+        return os.path.exists(path)
+
+    def getsize(self, path) -> int:
+        """Get the size of a file."""
+        return os.path.getsize(path)
+
+    def iter_blocks(self, path, block_size=1024 * 1024):
+        """Stream the contents of a file."""
+        with open(path, "rb") as f:
+            while True:
+                block = f.read(block_size)
+                if not block:
+                    break
+                yield block
+
+    def same_content(self, path, target_path) -> bool:
+        """Check if a file has the same content as a file on disk."""
+        return files_identical(path, target_path)
+
+    def copy_file(self, path, target_path) -> None:
+        """Copy a file to the target path."""
+        shutil.copy2(path, target_path)
+
+    def copy_tree(self, path, target_path) -> None:
+        """Copy a directory tree to the target path."""
+        shutil.copytree(path, target_path)
+
+    def materialize(self, path) -> str:
+        """Get a path on disk for the file - already on disk."""
+        return path
+
+    def release(self, path) -> None:
+        """Release a path returned by materialize - nothing to clean up."""
+
+
+class PakFileSystem:
+    """Read new mods straight out of a .pak file.
+
+    The pak file path acts as the root directory, so the paths below it match
+    the tree unpack_files would have extracted for the same pak."""
+
+    def __init__(self, pak_path, aes_key=None):
+        self.root = pak_path
+        self.reader = PakReader(pak_path, aes_key)
+        self.files = {}
+        self.directories = {"": set()}
+        self._temp_dir = None
+
+        for entry_path in self.reader.entries:
+            # Raises PakFormatError for entries that would land outside the mod directory
+            relative_path = self.reader.mount_relative_path(entry_path)
+            self.files[relative_path] = entry_path
+
+            # Register every parent directory of the entry
+            parts = relative_path.split("/")
+            for depth, part in enumerate(parts):
+                parent = "/".join(parts[:depth])
+                self.directories.setdefault(parent, set()).add(part)
+
+    def _relative(self, path) -> str:
+        """Convert a path below the pak file into an entry relative path."""
+        relative_path = os.path.relpath(path, self.root)
+        if relative_path == ".":
+            return ""
+        return relative_path.replace(os.sep, "/")
+
+    def listdir(self, path) -> list:
+        """List the names in a directory of the pak."""
+        relative_path = self._relative(path)
+        if relative_path not in self.directories:
+            raise FileNotFoundError(f"Directory not found in pak: {path}")
+        return list(self.directories[relative_path])
+
+    def list_entries(self, path) -> list:
+        """List the names in a directory of the pak with whether each one is a directory."""
+        relative_path = self._relative(path)
+        return [
+            (
+                name,
+                (f"{relative_path}/{name}" if relative_path else name)
+                in self.directories,
+            )
+            for name in self.listdir(path)
+        ]
+
+    def isdir(self, path) -> bool:
+        """Check if a path is a directory of the pak."""
+        return self._relative(path) in self.directories
+
+    def exists(self, path) -> bool:
+        """Check if a path exists in the pak."""
+        relative_path = self._relative(path)
+        return relative_path in self.files or relative_path in self.directories
+
+    def getsize(self, path) -> int:
+        """Get the uncompressed size of an entry."""
+        entry_path = self.files[self._relative(path)]
+        return self.reader.entries[entry_path]["uncompressed_size"]
+
+    def iter_blocks(self, path):
+        """Stream the decompressed contents of an entry."""
+        return self.reader.iter_entry_blocks(self.files[self._relative(path)])
+
+    def same_content(self, path, target_path) -> bool:
+        """Check if an entry has the same content as a file on disk."""
+        if self.getsize(path) != os.path.getsize(target_path):
+            return False
+        return blocks_identical(self.iter_blocks(path), target_path)
+
+    def copy_file(self, path, target_path) -> None:
+        """Write an entry to the target path."""
+        with open(target_path, "wb") as f:
+            for block in self.iter_blocks(path):
+                f.write(block)
+
+    def copy_tree(self, path, target_path) -> None:
+        """Write every entry below a directory of the pak to the target path."""
+        os.makedirs(target_path, exist_ok=True)
+        for name in sorted(self.listdir(path)):
+            item_path = os.path.join(path, name)
+            item_target_path = join_entry_path(target_path, name)
+            if self.isdir(item_path):
+                self.copy_tree(item_path, item_target_path)
+            else:
+                self.copy_file(item_path, item_target_path)
+
+    def materialize(self, path) -> str:
+        """Write a single entry to a temporary directory and return its path on disk."""
+        if self._temp_dir is None:
+            self._temp_dir = tempfile.mkdtemp(prefix="pak_merge_")
+
+        relative_path = self._relative(path)
+        temp_path = join_entry_path(self._temp_dir, relative_path)
+        os.makedirs(os.path.dirname(temp_path), exist_ok=True)
+        self.copy_file(path, temp_path)
+        logger.debug(f"Materialized {relative_path} from {self.root}")
+        return temp_path
+
+    def release(self, path) -> None:
+        """Delete a file returned by materialize."""
+        if os.path.exists(path):
+            os.remove(path)
+
+    def close(self) -> None:
+        """Delete the temporary directory used for materialized entries."""
+        if self._temp_dir is not None:
+            shutil.rmtree(self._temp_dir, ignore_errors=True)
+            self._temp_dir = None
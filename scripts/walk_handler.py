@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+
+# Version 0.1.0
+
+"""This module contains the os.scandir tree walks shared by every entry point of the tool."""
+
+# Each directory of the new mods is listed once with its entry types, through os.scandir for
+#   mods on disk, and the matching directory of the output is listed once into a set, so
+#   checking if an item exists in the output or is a directory doesn't stat it again.
+# The walk yields a flat list of work items in the same order the directories used to be
+#   visited recursively:
+#   file - a file to merge, with final_exists set if it is already in the output
+#   copy_dir - a directory missing from the output, to copy as a whole
+#   missing_dir - a directory missing from the output when only comparing, to skip
+# Directories found in the output are walked into instead of being yielded.
+# scan_files yields the DirEntry of every file below a directory, for the scans that only
+#   need the files on disk and the stat results scandir caches with them.
+
+import logging
+import os
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,  # Set the log level
+    format="%(asctime)s | %(levelname)s | %(message)s",  # Set the log format
+    handlers=[
+        # Log to a file - escape any bytes that aren't valid UTF-8
+        logging.FileHandler("merge_tool.log", errors="backslashreplace"),
+        logging.StreamHandler(),  # Also log to the console
+    ],
+)
+
+# Create a logger object
+logger = logging.getLogger(__name__)
+
+
+def list_entries(path) -> list:
+    """List the names in a directory on disk with whether each one is a directory,
+    using the types os.scandir reads along with the names."""
+    with os.scandir(path) as entries:
+        return [(entry.name, entry.is_dir()) for entry in entries]
+
+
+def get_relative_path(path, root) -> str:
+    """Get the path of a file below root with / separators."""
+    return os.path.relpath(path, root).replace(os.sep, "/")
+
+
+def scan_files(path, follow_symlinks=True):
+    """Yield the DirEntry of every file below a directory, in no particular order.
+    Symlinked directories are only walked into if follow_symlinks is set."""
+    pending_dirs = [path]
+    while pending_dirs:
+        current_dir = pending_dirs.pop()
+        with os.scandir(current_dir) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=follow_symlinks):
+                    pending_dirs.append(entry.path)
+                else:
+                    yield entry
+
+
+def list_names(path) -> set:
+    """List the names in a directory on disk into a set, empty if it doesn't exist.
+    Names are case folded the same way the OS compares paths."""
+    try:
+        with os.scandir(path) as entries:
+            return {os.path.normcase(entry.name) for entry in entries}
+    except (FileNotFoundError, NotADirectoryError):
+        return set()
+
+
+def list_work_items(new_dir, final_dir, source_fs, sort_key=None):
+    """Yield a work item for each entry of a new mods directory, in sorted order.
+    Both directories are listed when the first item is taken."""
+    if source_fs is None:
+        entries = list_entries(new_dir)
+    else:
+        entries = source_fs.list_entries(new_dir)
+    entries.sort(key=(lambda entry: sort_key(entry[0])) if sort_key else None)
+    final_names = list_names(final_dir) if final_dir is not None else set()
+
+    for name, is_dir in entries:
+        yield {
+            "kind": "dir" if is_dir else "file",
+            "new_path": os.path.join(new_dir, name),
+            "final_path": (
+                os.path.join(final_dir, name) if final_dir is not None else None
+            ),
+            "final_exists": os.path.normcase(name) in final_names,
+        }
+
+
+def walk_tree(new_dir, final_dir=None, source_fs=None, org_comp=False, sort_key=None):
+    """Walk a new mods directory and the matching output directory together and
+    yield the work items of the merge depth first.
+    Without final_dir every directory is walked into and only files are yielded.
+    The new mods are listed through source_fs, the directory on disk by default."""
+    pending = [list_work_items(new_dir, final_dir, source_fs, sort_key)]
+    while pending:
+        item = next(pending[-1], None)
+        if item is None:
+            pending.pop()
+            continue
+
+        if item["kind"] == "dir":
+            if final_dir is None or item["final_exists"]:
+                pending.append(
+                    list_work_items(
+                        item["new_path"], item["final_path"], source_fs, sort_key
+                    )
+                )
+                continue
+            item["kind"] = "missing_dir" if org_comp else "copy_dir"
+
+        yield item
+
+
+def walk_files(path, sort_key=None) -> list:
+    """List every file below a directory, depth first in sorted order."""
+    return [item["new_path"] for item in walk_tree(path, sort_key=sort_key)]
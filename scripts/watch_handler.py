@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+
+# Version 0.1.0
+
+"""This module contains an inotify watcher for the new mods directory."""
+
+# Uses the Linux inotify API through ctypes, so there are no extra dependencies.
+# Every directory below the watched root is watched, and each change is reported
+#   as the top level name below the root it happened in - a pak file or mod folder.
+# Bursts of events, like a large pak being copied in, are debounced into one batch.
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,  # Set the log level
+    format="%(asctime)s | %(levelname)s | %(message)s",  # Set the log format
+    handlers=[
+        # Log to a file - escape any bytes that aren't valid UTF-8
+        logging.FileHandler("merge_tool.log", errors="backslashreplace"),
+        logging.StreamHandler(),  # Also log to the console
+    ],
+)
+
+# Create a logger object
+logger = logging.getLogger(__name__)
+
+# inotify constants from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (
+    IN_MODIFY
+    | IN_ATTRIB
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+)
+
+# struct inotify_event: int wd, uint32 mask, uint32 cookie, uint32 len, char name[len]
+EVENT_HEADER = struct.Struct("iIII")
+READ_BUFFER_SIZE = 64 * 1024
+
+
+def is_ignored_name(name) -> bool:
+    """Check if a top level name is a hidden or temporary file that isn't a mod."""
+    return name.startswith(".") or name.endswith((".tmp", ".part", ".crdownload"))
+
+
+class InotifyWatcher:
+    """Watch a directory tree with inotify and report the top level names that change."""
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self.watch_paths = {}
+
+        libc_name = ctypes.util.find_library("c")
+        if not libc_name:
+            raise OSError("inotify is not available: C library not found")
+        self.libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self.libc, "inotify_init1"):
+            raise OSError("inotify is not available on this platform")
+
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f"inotify_init1 failed: {os.strerror(errno)}")
+
+        self.add_tree(self.root)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def add_watch(self, path) -> None:
+        """Watch a single directory."""
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            logger.warning(f"Unable to watch {path}: {os.strerror(errno)}")
+            return
+        self.watch_paths[wd] = path
+
+    def add_tree(self, path) -> None:
+        """Watch a directory and every directory below it."""
+        for current_dir, _, _ in os.walk(path):
+            self.add_watch(current_dir)
+
+    def top_level_name(self, path) -> str:
+        """Get the name directly below the root that a path is in."""
+        relative_path = os.path.relpath(path, self.root)
+        return relative_path.split(os.sep)[0]
+
+    def read_changes(self, timeout=None) -> set:
+        """Wait up to timeout seconds for events and return the top level names that changed.
+        Returns an empty set if nothing changed before the timeout."""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+
+        try:
+            buffer = os.read(self.fd, READ_BUFFER_SIZE)
+        except BlockingIOError:
+            return set()
+
+        changed_names = set()
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(buffer):
+            wd, mask, _, name_size = EVENT_HEADER.unpack_from(buffer, offset)
+            offset += EVENT_HEADER.size
+            name = buffer[offset : offset + name_size].rstrip(b"\0")
+            offset += name_size
+
+            if mask & IN_Q_OVERFLOW:
+                # Events were dropped - report everything below the root as changed
+                logger.warning("inotify event queue overflowed | Rescanning")
+                changed_names.update(os.listdir(self.root))
+                continue
+
+            if mask & IN_IGNORED:
+                self.watch_paths.pop(wd, None)
+                continue
+
+            watch_path = self.watch_paths.get(wd)
+            if watch_path is None or not name:
+                continue
+
+            path = os.path.join(watch_path, os.fsdecode(name))
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                self.add_tree(path)
+
+            changed_names.add(self.top_level_name(path))
+
+        return {name for name in changed_names if not is_ignored_name(name)}
+
+    def close(self) -> None:
+        """Stop watching and close the inotify file descriptor."""
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+def wait_for_changes(watcher, debounce_seconds) -> set:
+    """Block until something changes, then keep collecting changes until none arrive
+    for debounce_seconds, and return every top level name that changed."""
+    changed_names = set()
+    while not changed_names:
+        changed_names = watcher.read_changes()
+
+    while True:
+        new_changed_names = watcher.read_changes(debounce_seconds)
+        if not new_changed_names:
+            return changed_names
+        changed_names.update(new_changed_names)
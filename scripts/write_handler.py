@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+
+# Version 0.1.0
+
+"""This module contains the buffered writer used for the temporary merged mod file."""
+
+import logging
+import os
+import json
+
+from pipeline_handler import BackgroundWorker, get_queue_depth
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,  # Set the log level
+    format="%(asctime)s | %(levelname)s | %(message)s",  # Set the log format
+    handlers=[
+        # Log to a file - escape any bytes that aren't valid UTF-8
+        logging.FileHandler("merge_tool.log", errors="backslashreplace"),
+        logging.StreamHandler(),  # Also log to the console
+    ],
+)
+
+# Create a logger object
+logger = logging.getLogger(__name__)
+
+# Flush policies for the temporary merged mod file
+#   quit_save:   Only write to disk on quit-save, before prompting, and at commit time
+#   every_n_mb:  Also write to disk every time the buffer grows past flush_every_mb
+FLUSH_POLICIES = ("quit_save", "every_n_mb")
+
+
+def load_write_settings(config) -> dict:
+    """Load the write coalescing settings from the config with defaults."""
+    flush_policy = config.get("merge_write_flush_policy", "every_n_mb")
+    if flush_policy not in FLUSH_POLICIES:
+        logger.warning(
+            f"Unknown merge_write_flush_policy: {flush_policy} | Using every_n_mb"
+        )
+        flush_policy = "every_n_mb"
+
+    return {
+        "flush_policy": flush_policy,
+        "flush_every_mb": config.get("merge_write_flush_mb", 8),
+        "fsync_on_commit": config.get("merge_write_fsync", False),
+        "queue_depth": get_queue_depth(config),
+    }
+
+
+def fsync_directory(dir_path) -> None:
+    """Fsync a directory so a rename in it is durable. Windows can't open directories,
+    and NTFS journals renames itself, so it is skipped there."""
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    dir_fd = os.open(dir_path or ".", os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+def write_checkpoint(checkpoint_file, final_perf_chunk_sizes, fsync=False) -> None:
+    """Atomically write the perf chunk sizes that are safely on disk.
+    If fsync is set, the checkpoint and its rename are durable when this returns."""
+    temp_checkpoint_file = checkpoint_file + ".part"
+    with open(temp_checkpoint_file, "w", encoding="utf-8") as f:
+        f.write(json.dumps(final_perf_chunk_sizes))
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(temp_checkpoint_file, checkpoint_file)
+    if fsync:
+        fsync_directory(os.path.dirname(checkpoint_file))
+
+
+def truncate_to_checkpoint(temp_merged_mod_file, checkpoint_line_count) -> int:
+    """Drop any lines written after the last checkpoint and return the line count."""
+    if not os.path.exists(temp_merged_mod_file):
+        return 0
+
+    line_count = 0
+    byte_offset = 0
+    with open(temp_merged_mod_file, "rb") as tmp_merged_mod:
+        for line in tmp_merged_mod:
+            if line_count == checkpoint_line_count:
+                break
+            line_count += 1
+            byte_offset += len(line)
+
+    if os.path.getsize(temp_merged_mod_file) > byte_offset:
+        logger.info(
+            f"Truncating temp merged mod file to last checkpoint at line {line_count}: {temp_merged_mod_file}"
+        )
+        with open(temp_merged_mod_file, "r+b") as tmp_merged_mod:
+            tmp_merged_mod.truncate(byte_offset)
+
+    return line_count
+
+
+class MergeWriter:
+    """Coalesce chunk writes to the temporary merged mod file.
+
+    Chunks are buffered in memory and written out whole, so the file on disk
+    always ends on a chunk boundary. After every write to disk the chunk sizes
+    are saved to the checkpoint file so an interrupted merge can resume.
+    With a queue depth, buffers filled by the merge are written on a background
+    thread while the merge goes on - flush and commit wait for them."""
+
+    def __init__(
+        self,
+        temp_merged_mod_file,
+        checkpoint_file,
+        final_perf_chunk_sizes,
+        write_settings,
+    ):
+        self.temp_merged_mod_file = temp_merged_mod_file
+        self.checkpoint_file = checkpoint_file
+        self.final_perf_chunk_sizes = final_perf_chunk_sizes
+        self.flush_policy = write_settings["flush_policy"]
+        self.flush_every_bytes = int(write_settings["flush_every_mb"] * 1024 * 1024)
+        self.fsync_on_commit = write_settings["fsync_on_commit"]
+        self.queued_chunk_count = len(final_perf_chunk_sizes)
+        self.last_chunk_lines = None
+        self._buffer = []
+        self._buffer_size = 0
+        self._file = open(  # pylint: disable=consider-using-with
+            temp_merged_mod_file, "ab"
+        )
+        self._writer = BackgroundWorker(write_settings.get("queue_depth", 0))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write_chunk(self, lines) -> None:
+        """Buffer a processed performance chunk of byte lines."""
+        self.final_perf_chunk_sizes.append(len(lines))
+        self.last_chunk_lines = lines
+        self._buffer.extend(lines)
+        self._buffer_size += sum(len(line) for line in lines)
+
+        if (
+            self.flush_policy == "every_n_mb"
+            and self._buffer_size >= self.flush_every_bytes
+        ):
+            self._queue_buffer()
+
+    def _write_out(self, lines, final_perf_chunk_sizes) -> None:
+        """Write lines to the file and record the checkpoint they complete."""
+        self._file.writelines(lines)
+        self._file.flush()
+        write_checkpoint(self.checkpoint_file, final_perf_chunk_sizes)
+
+    def _queue_buffer(self) -> None:
+        """Hand the buffered chunks over to the writer with a copy of their chunk sizes."""
+        if not self._buffer and self.queued_chunk_count == len(
+            self.final_perf_chunk_sizes
+        ):
+            return
+
+        self._writer.submit(
+            self._write_out, self._buffer, list(self.final_perf_chunk_sizes)
+        )
+        self._buffer = []
+        self._buffer_size = 0
+        self.queued_chunk_count = len(self.final_perf_chunk_sizes)
+
+    def flush(self) -> None:
+        """Write the buffered chunks to the file and record a checkpoint."""
+        self._queue_buffer()
+        self._writer.wait()
+
+    def commit(self) -> None:
+        """Flush the buffer - with fsync on, the file and checkpoint are durable after.
+        Only commits are synced, the checkpoints of every_n_mb write-outs are not."""
+        self.flush()
+        if self.fsync_on_commit:
+            # The lines are durable before the checkpoint that points past them
+            os.fsync(self._file.fileno())
+            write_checkpoint(
+                self.checkpoint_file, list(self.final_perf_chunk_sizes), fsync=True
+            )
+
+    def close(self) -> None:
+        """Flush any buffered chunks and close the file."""
+        if self._file.closed:
+            return
+        try:
+            self.flush()
+        finally:
+            self._writer.close()
+            self._file.close()
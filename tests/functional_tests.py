@@ -25,6 +25,8 @@ sys.path.insert(0, abs_scripts_path)
 
 
 class TestChoiceHandler(unittest.TestCase):
+    """Functional tests for pak_merge_tool -> choice_handler.py"""
+
     @patch("builtins.input")
     def test_get_user_choice(self, mock_input):
         """Test get_user_choice(choices) -> str"""
@@ -55,6 +57,28 @@ class TestChoiceHandler(unittest.TestCase):
         view_text_with_pydoc(text)
         mock_pager.assert_called_once()
 
+        # Lines are paged a bounded number at a time until the user stops
+        mock_pager.reset_mock()
+        lines = (f"test{line}\n" for line in range(10))
+        with patch("builtins.input", side_effect=["", "q"]), patch(
+            "sys.stdin.isatty", return_value=True
+        ):
+            view_text_with_pydoc(lines, page_lines=3)
+        assert mock_pager.call_args_list == [
+            call("test0\ntest1\ntest2\n"),
+            call("test3\ntest4\ntest5\n"),
+        ]
+
+        # Without a terminal every page is written without asking
+        mock_pager.reset_mock()
+        lines = (f"test{line}\n" for line in range(7))
+        with patch("builtins.input") as mock_input, patch(
+            "sys.stdin.isatty", return_value=False
+        ):
+            view_text_with_pydoc(lines, page_lines=3)
+        mock_input.assert_not_called()
+        assert mock_pager.call_count == 3
+
     @patch("subprocess.Popen")
     @patch("subprocess.Popen.communicate")
     def test_view_text_with_less(self, mock_communicate, mock_popen):
@@ -65,6 +89,59 @@ class TestChoiceHandler(unittest.TestCase):
         view_text_with_less(text)
         mock_popen.assert_called_once()
 
+    @patch("subprocess.Popen")
+    def test_view_text_with_less_streams(self, mock_popen):
+        """Test view_text_with_less(text) -> None"""
+        from scripts.choice_handler import view_text_with_less
+
+        process = mock_popen.return_value.__enter__.return_value
+        process.stdin.write.side_effect = [None, BrokenPipeError]
+
+        # A generator is streamed and a pager closed early isn't an error
+        view_text_with_less(line for line in ["+test1\n", "test2\udcff\n", "test3\n"])
+        assert process.stdin.write.call_count == 2
+        assert process.stdin.write.call_args_list[1] == call(b"test2\xff\n")
+
+    @patch("builtins.input")
+    def test_bulk_review_choice_handler(self, mock_input):
+        """Test bulk_review_choice_handler(hunks, final_merged_mod_file, new_mods_file) -> dict"""
+        from scripts.choice_handler import (
+            bulk_review_choice_handler,
+            split_display_hunks,
+            summarize_hunk,
+        )
+
+        diff_lines = ["--- test1\n", "+++ test2\n"]
+        for line_number in range(1, 5):
+            diff_lines += [
+                f"@@ -{line_number * 10} +{line_number * 10} @@\n",
+                f"-value{line_number}\n",
+                f"+Cost{line_number}\n",
+            ]
+        hunks = [
+            summarize_hunk(hunk_lines, 100)
+            for hunk_lines in split_display_hunks(diff_lines)
+        ]
+        assert len(hunks) == 4
+        assert hunks[0]["line"] == 110
+        assert hunks[0]["changed_lines"] == ["value1", "Cost1"]
+
+        # Invalid commands are asked again, later decisions override earlier ones
+        mock_input.side_effect = [
+            "all keep",
+            "1-2,4 new",
+            "/Cost4/ merge",
+            "5 keep",
+            "1 test1",
+            "1 ask",
+            "apply",
+        ]
+        result = bulk_review_choice_handler(hunks, "test1", "test2")
+        assert result == {
+            "status": "continue",
+            "decisions": [None, "new", "keep", "merge"],
+        }
+
     @patch("subprocess.run")
     def test_open_files_in_vscode_compare(self, mock_subprocess_run):
         """Test open_files_in_vscode_compare(file1, file2) -> None"""
@@ -347,6 +424,24 @@ class TestChoiceHandler(unittest.TestCase):
     #     mock_quit_save.assert_called_once()
     #     mock_quit_out.assert_not_called()
 
+    def test_parse_hunk_range(self):
+        """Test parse_hunk_range(range_info) -> tuple"""
+        from scripts.choice_handler import parse_hunk_range, summarize_hunk
+
+        assert parse_hunk_range("-944,81") == (944, 81)
+        assert parse_hunk_range("+0,0") == (0, 0)
+        # The length is left out of a single line side
+        assert parse_hunk_range("-5") == (5, 1)
+        assert parse_hunk_range("+5") == (5, 1)
+
+        hunk_lines = ["@@ -5 +5 @@\n", "-test1\n", "+test2\n"]
+        assert summarize_hunk(hunk_lines, 10) == {
+            "line": 15,
+            "removed": 1,
+            "added": 1,
+            "changed_lines": ["test1", "test2"],
+        }
+
     @patch("scripts.choice_handler.get_user_choice")
     def test_non_text_file_choice_handler(self, mock_get_user_choice):
         """Test non_text_file_choice_handler(final_merged_mod_path, new_mods_path) -> dict"""
@@ -397,7 +492,91 @@ class TestChoiceHandler(unittest.TestCase):
 #         assert result is True
 
 
+class TestFormatDir(unittest.TestCase):
+    """Functional tests for pak_merge_tool -> format_dir.py"""
+
+    def test_parallel_format_dir(self):
+        """Test parallel_format_dir(path, max_perf_chunk_size, workers) -> dict"""
+        import tempfile
+        from scripts.format_dir import parallel_format_dir
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            os.makedirs(os.path.join(temp_dir, "test1"))
+            files = {
+                "test2.cfg": "test3 : struct.begin\ntest4 = 1\nstruct.end\n",
+                os.path.join("test1", "test5.cfg"): "test6 : struct.begin\ntest7 = 1\n",
+                "test8.txt": "test9\n",
+            }
+            for path, data in files.items():
+                with open(os.path.join(temp_dir, path), "w", encoding="utf-8") as f:
+                    f.write(data)
+
+            result = parallel_format_dir(temp_dir, 1024, workers=2)
+            assert result["formatted"] == [os.path.join(temp_dir, "test2.cfg")]
+            assert result["skipped"] == 1
+            assert result["bad_depth"] == [
+                {
+                    "file_path": os.path.join(temp_dir, "test1", "test5.cfg"),
+                    "tab_level": 1,
+                }
+            ]
+            assert result["error"] == []
+            assert not os.path.exists(
+                os.path.join(temp_dir, "test1", "test5.cfg_format.tmp")
+            )
+
+            with open(os.path.join(temp_dir, "test2.cfg"), encoding="utf-8") as f:
+                assert f.read() == "test3 : struct.begin\n    test4 = 1\nstruct.end\n"
+
+    @patch("scripts.format_dir.load_config")
+    def test_main_serial(self, mock_load_config):
+        """Test main() -> bool with one worker"""
+        import json
+        import tempfile
+        from scripts.format_dir import format_files, main
+
+        mock_load_config.return_value = {"max_perf_chunk_size": 1024}
+        with tempfile.TemporaryDirectory() as temp_dir:
+            format_dir = os.path.join(temp_dir, "test1")
+            os.makedirs(format_dir)
+            for name, data in (
+                ("test2.cfg", "test3 : struct.begin\ntest4 = 1\nstruct.end\n"),
+                ("test5.cfg", "test6 : struct.begin\n"),
+            ):
+                with open(os.path.join(format_dir, name), "w", encoding="utf-8") as f:
+                    f.write(data)
+
+            # The serial run writes the same report and exit status as the parallel one
+            report_path = os.path.join(temp_dir, "report.json")
+            argv = [
+                "format_dir.py",
+                f"--format_dir={format_dir}",
+                "--workers=1",
+                f"--report={report_path}",
+            ]
+            with patch("sys.argv", argv):
+                assert main() is False
+            with open(report_path, "r", encoding="utf-8") as f:
+                report = json.load(f)
+            assert report["formatted"] == [os.path.join(format_dir, "test2.cfg")]
+            assert report["bad_depth"] == [
+                {"file_path": os.path.join(format_dir, "test5.cfg"), "tab_level": 1}
+            ]
+
+            # A file that can't be read is reported instead of stopping the run
+            with patch(
+                "scripts.format_dir.format_file_status",
+                side_effect=PermissionError("test7"),
+            ):
+                report = format_files(
+                    [os.path.join(format_dir, "test2.cfg")], 1024, workers=1
+                )
+            assert report["error"] == [os.path.join(format_dir, "test2.cfg")]
+
+
 class TestFormatHandler(unittest.TestCase):
+    """Functional tests for pak_merge_tool -> format_handler.py"""
+
     def test_strip_whitespace(self):
         """Test strip_whitespace(line) -> str"""
         from scripts.format_handler import strip_whitespace
@@ -440,6 +619,46 @@ class TestFormatHandler(unittest.TestCase):
         )
         assert result == ["test2", "test3"]
 
+    def test_lines_equal(self):
+        """Test lines_equal(lines_a, lines_b, compare_settings) -> bool"""
+        from scripts.format_handler import lines_equal, load_compare_settings
+
+        lines_a = [b"test1 {\n", b"    test2 // test3\n", b"}\n"]
+        lines_b = [b"test1 {\r\n", b"\ttest2\r\n", b"\r\n", b"}"]
+        assert not lines_equal(lines_a, lines_b)
+        assert not lines_equal(lines_a, lines_b, load_compare_settings({}))
+
+        compare_settings = load_compare_settings({"ignore_comments": True})
+        assert lines_equal(lines_a, lines_b, compare_settings)
+
+    def test_unified_diff_lines(self):
+        """Test unified_diff_lines(lines_a, lines_b, ..., compare_settings) -> generator"""
+        from scripts.format_handler import load_compare_settings, unified_diff_lines
+
+        lines_a = ["test1 {\n", "    test2 = 1\n", "    test3 = 1\n", "}\n"]
+        lines_b = ["test1 {\n", "\ttest2 = 1  \n", "\ttest3 = 2\n", "}\n"]
+        assert len(list(unified_diff_lines(lines_a, lines_b))) == 9
+
+        # Only the changed value is a hunk line, the re-indented line is context
+        diff = list(
+            unified_diff_lines(
+                lines_a, lines_b, compare_settings=load_compare_settings({})
+            )
+        )
+        assert diff[2:] == [
+            "@@ -1,4 +1,4 @@\n",
+            " test1 {\n",
+            "     test2 = 1\n",
+            "-    test3 = 1\n",
+            "+\ttest3 = 2\n",
+            " }\n",
+        ]
+        assert not list(
+            unified_diff_lines(
+                lines_a, lines_a, compare_settings=load_compare_settings({})
+            )
+        )
+
     # def test_config_file_formatter(self):
     #     """Test config_file_formatter(unformatted_lines, tab_level) -> list"""
     #     from scripts.format_handler import config_file_formatter
@@ -458,6 +677,22 @@ class TestFormatHandler(unittest.TestCase):
     #     result = format_file(file_path, performance_chunk_size)
     #     assert result is True
 
+    def test_format_file_line_endings(self):
+        """Test format_file(file_path, performance_chunk_size) keeps the line endings"""
+        import tempfile
+        from scripts.format_handler import format_file
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_path = os.path.join(temp_dir, "test1.cfg")
+            with open(file_path, "wb") as f:
+                f.write(b"test2 : struct.begin  \r\ntest3 = 1\r\nstruct.end\r\n")
+
+            assert format_file(file_path, 100)
+            with open(file_path, "rb") as f:
+                assert f.read() == (
+                    b"test2 : struct.begin\r\n    test3 = 1\r\nstruct.end\r\n"
+                )
+
 
 class TestMergeTool(unittest.TestCase):
     """Functional tests for pak_merge_tool -> merge_tool.py"""
@@ -586,8 +821,247 @@ class TestMergeTool(unittest.TestCase):
     #     result = main()
     #     assert result is False
 
+    @patch("scripts.merge_tool.bad_format_choice_handler")
+    @patch("scripts.merge_tool.choice_handler")
+    def test_merge_files_whitespace_only(
+        self, mock_choice_handler, mock_bad_format_choice_handler
+    ):
+        """Test merge_files(new_mods_file, final_merged_mod_file, ...) -> str"""
+        import tempfile
+        from scripts.merge_tool import merge_files
+
+        diffs = []
+
+        def keep_final_chunk(*args, **kwargs):
+            diffs.append(list(args[2]))
+            return {
+                "status": "continue",
+                "processed_lines": args[3],
+                "last_display_diff": "",
+                "last_user_choice": "",
+            }
+
+        mock_choice_handler.side_effect = keep_final_chunk
+        mock_bad_format_choice_handler.return_value = {
+            "skip_file_bool": False,
+            "quit_out_bool": False,
+        }
+        # merge_tool imports the struct tree handler by its bare module name
+        with tempfile.TemporaryDirectory() as temp_dir, patch(
+            "struct_tree_handler.STRUCT_TREE_CACHE_DIR", os.path.join(temp_dir, "cache")
+        ):
+            new_mods_file = os.path.join(temp_dir, "test1.cfg")
+            final_merged_mod_file = os.path.join(temp_dir, "test2.cfg")
+            values = [f"test{value} = {value}\n" for value in range(10)]
+            with open(final_merged_mod_file, "w", encoding="utf-8") as f:
+                f.write("test : struct.begin\n")
+                f.writelines(f"    {value}" for value in values)
+                f.write("struct.end\n")
+            # Re-indent the whole struct and change one value in it
+            values[5] = "test5 = 50\n"
+            with open(new_mods_file, "w", encoding="utf-8") as f:
+                f.write("test : struct.begin\n")
+                f.writelines(f"\t\t{value.rstrip()}  \n" for value in values)
+                f.write("struct.end\n")
+
+            config = {"max_perf_chunk_size": 1024}
+            result = merge_files(
+                new_mods_file, final_merged_mod_file, {"code": False}, config
+            )
+            assert result == "continue"
+            changed_lines = [
+                line
+                for diff in diffs
+                for line in diff[2:]
+                if line.startswith(("-", "+"))
+            ]
+            assert changed_lines == ["-    test5 = 5\n", "+\t\ttest5 = 50  \n"]
+
+    @patch("scripts.merge_tool.non_text_file_choice_handler")
+    def test_merge_file_identical_non_text(self, mock_non_text_file_choice_handler):
+        """Test merge_file(new_mods_item, final_merged_mod_item, ...) -> str"""
+        import tempfile
+        from scripts.merge_tool import merge_file
+
+        mock_non_text_file_choice_handler.return_value = {"status": "overwrite"}
+        with tempfile.TemporaryDirectory() as temp_dir:
+            new_mods_item = os.path.join(temp_dir, "test1.uasset")
+            final_merged_mod_item = os.path.join(temp_dir, "test2.uasset")
+            for path in (new_mods_item, final_merged_mod_item):
+                with open(path, "wb") as f:
+                    f.write(b"test3" * 100)
+
+            config = {"valid_file_extensions": [".cfg"]}
+            result = merge_file(new_mods_item, final_merged_mod_item, {}, config, True)
+            assert result == "continue"
+            mock_non_text_file_choice_handler.assert_not_called()
+
+            with open(new_mods_item, "wb") as f:
+                f.write(b"test4" * 100)
+            result = merge_file(new_mods_item, final_merged_mod_item, {}, config, True)
+            assert result == "continue"
+            mock_non_text_file_choice_handler.assert_called_once()
+
+
+class TestPakHandler(unittest.TestCase):
+    """Functional tests for pak_merge_tool -> pak_handler.py"""
+
+    def test_pak_reader(self):
+        """Test PakReader(pak_path, aes_key).read_entry(path) -> bytes"""
+        import tempfile
+        from scripts.pak_handler import PakReader
+        from tests.pak_fixture_writer import write_pak
+
+        files = {
+            "Stalker2/Content/test1.cfg": b"struct.begin\n    test2\nstruct.end\n",
+            "Stalker2/test3.bin": bytes(range(256)) * 1024,
+            "test4.txt": b"",
+        }
+        with tempfile.TemporaryDirectory() as temp_dir:
+            pak_path = os.path.join(temp_dir, "test_P.pak")
+            for compress in (False, True):
+                write_pak(pak_path, files, compress, block_size=0x8000)
+                reader = PakReader(pak_path)
+                assert reader.version == 11
+                assert reader.mount_point == "../../../"
+                assert sorted(reader.entries) == sorted(files)
+                for path, data in files.items():
+                    assert reader.read_entry(path) == data
+
+    def test_pak_reader_versions(self):
+        """Test PakReader(pak_path, aes_key) on encrypted, Gzip, and pre-v10 paks"""
+        import tempfile
+        from scripts.pak_handler import PakFormatError, PakReader, extract_pak
+        from tests.pak_fixture_writer import write_pak
+
+        aes_key = "0x" + "33A604DF49A07FFD4A4C919962161F5C" * 2
+        files = {
+            "Stalker2/Content/test1.cfg": b"struct.begin\n    test2\nstruct.end\n",
+            "Stalker2/Content/Sub/test3.cfg": b"test4\n" * 5000,
+            "test5.txt": b"",
+        }
+        with tempfile.TemporaryDirectory() as temp_dir:
+            pak_path = os.path.join(temp_dir, "test_P.pak")
+            for version in (3, 4, 5, 7, 8, 9, 11):
+                for compress, compression in (
+                    (False, "Zlib"),
+                    (True, "Zlib"),
+                    (True, "Gzip"),
+                ):
+                    for encrypt_key in (None, aes_key):
+                        write_pak(
+                            pak_path,
+                            files,
+                            compress,
+                            block_size=0x1000,
+                            version=version,
+                            compression=compression,
+                            encrypt_key=encrypt_key,
+                        )
+                        reader = PakReader(pak_path, encrypt_key)
+                        assert reader.version == version
+                        assert reader.index_encrypted == bool(
+                            encrypt_key and version >= 4
+                        )
+                        assert sorted(reader.entries) == sorted(files)
+                        for path, data in files.items():
+                            assert reader.read_entry(path) == data
+                            if compress and data:
+                                assert reader.entries[path]["compression"] == (
+                                    compression
+                                )
+
+            # An encrypted pak is extracted with its key and can't be read without it
+            extract_path = os.path.join(temp_dir, "test_P")
+            result = extract_pak(pak_path, extract_path, aes_key, workers=2)
+            assert sorted(result) == sorted(files)
+            for path, data in files.items():
+                with open(os.path.join(extract_path, path), "rb") as f:
+                    assert f.read() == data
+            with self.assertRaises(PakFormatError):
+                PakReader(pak_path)
+
+    def test_extract_pak(self):
+        """Test extract_pak(pak_path, extract_path, aes_key, workers) -> list"""
+        import tempfile
+        from scripts.pak_handler import extract_pak
+        from tests.pak_fixture_writer import write_pak
+
+        files = {
+            "Stalker2/Content/test1.cfg": b"test2\n",
+            "Stalker2/Content/Sub/test3.cfg": b"test4\n" * 5000,
+        }
+        with tempfile.TemporaryDirectory() as temp_dir:
+            pak_path = os.path.join(temp_dir, "test_P.pak")
+            extract_path = os.path.join(temp_dir, "test_P")
+            write_pak(pak_path, files, compress=True)
+
+            result = extract_pak(pak_path, extract_path, workers=2)
+            assert sorted(result) == sorted(files)
+            for path, data in files.items():
+                with open(os.path.join(extract_path, path), "rb") as f:
+                    assert f.read() == data
+
+    def test_extract_pak_traversal(self):
+        """Test extract_pak(pak_path, extract_path) rejects entries outside the extract path"""
+        import tempfile
+        from scripts.pak_handler import PakFormatError, extract_pak
+        from tests.pak_fixture_writer import write_pak
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            pak_path = os.path.join(temp_dir, "test_P.pak")
+            extract_path = os.path.join(temp_dir, "test_P")
+            for files, mount in (
+                ({"Stalker2/../../../test1.cfg": b"test2\n"}, "../../../"),
+                ({"test1.cfg": b"test2\n"}, "../../../Stalker2/../../"),
+            ):
+                write_pak(pak_path, files, mount=mount)
+                with self.assertRaises(PakFormatError):
+                    extract_pak(pak_path, extract_path, workers=2)
+                assert not os.path.exists(os.path.join(temp_dir, "test1.cfg"))
+                assert not os.path.exists(
+                    os.path.join(os.path.dirname(temp_dir), "test1.cfg")
+                )
+
+    def test_pack_directory(self):
+        """Test pack_directory(source_dir, pak_path, compression, workers) -> int"""
+        import tempfile
+        from scripts.pak_handler import PakReader, pack_directory
+
+        files = {
+            "Stalker2/Content/test1.cfg": b"struct.begin\n    test2\nstruct.end\n"
+            * 5000,
+            "Stalker2/Content/Sub/test3.bin": bytes(range(256)),
+            "test4.txt": b"",
+        }
+        with tempfile.TemporaryDirectory() as temp_dir:
+            source_dir = os.path.join(temp_dir, "merged")
+            for path, data in files.items():
+                file_path = os.path.join(source_dir, *path.split("/"))
+                os.makedirs(os.path.dirname(file_path), exist_ok=True)
+                with open(file_path, "wb") as f:
+                    f.write(data)
+            with open(os.path.join(source_dir, "test5.cfg.tmp"), "wb") as f:
+                f.write(b"test6\n")
+
+            pak_path = os.path.join(temp_dir, "merged_P.pak")
+            result = pack_directory(source_dir, pak_path, workers=2, block_size=0x8000)
+            assert result == len(files)
+
+            reader = PakReader(pak_path)
+            assert sorted(reader.entries) == sorted(files)
+            assert reader.entries["Stalker2/Content/test1.cfg"]["compression"] == "Zlib"
+            assert (
+                reader.entries["Stalker2/Content/Sub/test3.bin"]["compression"]
+                == "None"
+            )
+            for path, data in files.items():
+                assert reader.read_entry(path) == data
+
 
 class TestRepakAndMerge(unittest.TestCase):
+    """Functional tests for pak_merge_tool -> repak_and_merge.py"""
+
     # def test_sanitize_mod_name(self):
     #     """Test sanitize_mod_name(pak_file_name) -> dict"""
     #     from scripts.repak_and_merge import sanitize_mod_name
@@ -607,6 +1081,164 @@ class TestRepakAndMerge(unittest.TestCase):
         result = update_mod_version(history, pak_file_clean_name, new_pak_file_version)
         assert result == {"version": ["1", "2"]}
 
+    @patch("subprocess.run")
+    def test_run_repak_unpack(self, mock_subprocess_run):
+        """Test run_repak_unpack(repak_path, aes_key, pak_file_path, extract_path) -> dict"""
+        import subprocess
+        from scripts.repak_and_merge import run_repak_unpack
+
+        mock_subprocess_run.return_value = subprocess.CompletedProcess(
+            args=["test1"], returncode=0
+        )
+        result = run_repak_unpack("repak.exe", "0x00", "test1.pak", "test2")
+        assert result == {"status": "unpacked", "pak_file_path": "test1.pak"}
+        # The argv list is passed straight to repak, not through a shell
+        assert not mock_subprocess_run.call_args.kwargs.get("shell")
+        assert mock_subprocess_run.call_args.args[0][-3:] == [
+            "test1.pak",
+            "--output",
+            "test2",
+        ]
+
+        mock_subprocess_run.side_effect = subprocess.CalledProcessError(1, "test1")
+        result = run_repak_unpack("repak.exe", "0x00", "test1.pak", "test2")
+        assert result == {"status": "error", "pak_file_path": "test1.pak"}
+
+    def test_is_unpacked(self):
+        """Test is_unpacked(pak_file_history, pak_hash, extract_path) -> bool"""
+        import tempfile
+        from scripts.repak_and_merge import is_unpacked
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            extract_path = os.path.join(temp_dir, "test1.pak")
+            os.makedirs(os.path.join(extract_path, "test2"))
+            with open(
+                os.path.join(extract_path, "test2", "test3.cfg"), "w", encoding="utf-8"
+            ) as f:
+                f.write("test4\n")
+
+            pak_file_history = {
+                "hash": "test5",
+                "extract_path": extract_path,
+                "extracted_files": ["test2/test3.cfg"],
+            }
+            assert is_unpacked(pak_file_history, "test5", extract_path) is True
+            assert is_unpacked(pak_file_history, "test6", extract_path) is False
+            assert is_unpacked({}, "test5", extract_path) is False
+
+            os.remove(os.path.join(extract_path, "test2", "test3.cfg"))
+            assert is_unpacked(pak_file_history, "test5", extract_path) is False
+
+    def test_get_mod_signature(self):
+        """Test get_mod_signature(mod_path) -> str"""
+        import tempfile
+        from scripts.repak_and_merge import get_mod_signature
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            mod_path = os.path.join(temp_dir, "test1")
+            os.makedirs(os.path.join(mod_path, "test2"))
+            file_path = os.path.join(mod_path, "test2", "test3.cfg")
+            with open(file_path, "w", encoding="utf-8") as f:
+                f.write("test4\n")
+            signature = get_mod_signature(mod_path)
+            assert get_mod_signature(mod_path) == signature
+
+            # A new version dropped in under the same name has another signature
+            with open(file_path, "w", encoding="utf-8") as f:
+                f.write("test5\n")
+            os.utime(file_path, ns=(0, 0))
+            assert get_mod_signature(mod_path) != signature
+
+    @patch("scripts.repak_and_merge.load_config")
+    @patch("scripts.repak_and_merge.load_history")
+    def test_unpack_files_resume(self, mock_load_history, mock_load_config):
+        """Test unpack_files(repak_path, pak_dir, extract_dir, resume) -> bool"""
+        import tempfile
+        from scripts.history_handler import HistoryStore
+        from scripts.pak_handler import extract_pak
+        from scripts.repak_and_merge import unpack_files
+        from tests.pak_fixture_writer import write_pak
+
+        mock_load_config.return_value = {"unpack_backend": "native"}
+        with tempfile.TemporaryDirectory() as temp_dir:
+            db_path = os.path.join(temp_dir, "history.db")
+            mock_load_history.side_effect = lambda: HistoryStore(db_path, None)
+            pak_dir = os.path.join(temp_dir, "paks")
+            extract_dir = os.path.join(temp_dir, "unpacked")
+            os.makedirs(pak_dir)
+            write_pak(
+                os.path.join(pak_dir, "test1_P.pak"),
+                {"Stalker2/Content/test2.cfg": b"test3\n"},
+            )
+
+            with patch(
+                "scripts.repak_and_merge.extract_pak", wraps=extract_pak
+            ) as mock_extract_pak:
+                # A plain unpack leaves a hash the next resume can skip the pak on
+                assert unpack_files(None, pak_dir, extract_dir, False, 2)
+                assert mock_extract_pak.call_count == 1
+                assert unpack_files(None, pak_dir, extract_dir, True, 2)
+                assert mock_extract_pak.call_count == 1
+
+    @patch("scripts.repak_and_merge.update_mod")
+    @patch("scripts.repak_and_merge.merge_directories")
+    def test_merge_mod_update(self, mock_merge_directories, mock_update_mod):
+        """Test merge_mod(history, new_mod_dir, ..., update) -> bool"""
+        import tempfile
+        from scripts.history_handler import HistoryStore
+        from scripts.repak_and_merge import merge_mod
+
+        mock_merge_directories.return_value = "continue"
+        mock_update_mod.return_value = "continue"
+        with tempfile.TemporaryDirectory() as temp_dir:
+            db_path = os.path.join(temp_dir, "history.db")
+            new_mods_dir = os.path.join(temp_dir, "mods")
+            final_merged_mod_dir = os.path.join(temp_dir, "merged")
+            os.makedirs(final_merged_mod_dir)
+            for new_mod_dir in ("test1_v1-0", "test1_v1-1"):
+                os.makedirs(os.path.join(new_mods_dir, new_mod_dir))
+                with open(
+                    os.path.join(new_mods_dir, new_mod_dir, "test2.cfg"),
+                    "w",
+                    encoding="utf-8",
+                ) as f:
+                    f.write(f"{new_mod_dir}\n")
+
+            def run_merge_mod(new_mod_dir):
+                # Reopen the store every run so the history makes a round trip
+                with HistoryStore(db_path, None) as history:
+                    return merge_mod(
+                        history,
+                        new_mod_dir,
+                        new_mods_dir,
+                        final_merged_mod_dir,
+                        {},
+                        {},
+                        None,
+                        False,
+                        False,
+                        False,
+                        False,
+                        update=True,
+                    )
+
+            assert run_merge_mod("test1_v1-0")
+            assert mock_merge_directories.call_count == 1
+
+            # The same version unchanged on disk is skipped
+            assert run_merge_mod("test1_v1-0")
+            assert mock_merge_directories.call_count == 1
+
+            # A new version only has its changes applied
+            assert run_merge_mod("test1_v1-1")
+            assert mock_merge_directories.call_count == 1
+            mock_update_mod.assert_called_once()
+            with HistoryStore(db_path, None) as history:
+                assert history.get("test1")["merged_path"] == os.path.join(
+                    new_mods_dir, "test1_v1-1"
+                )
+                assert history.get("test1")["merged_signature"]
+
     # @patch("subprocess.run")
     # @patch("os.path.exists")
     # @patch("os.path.join")
@@ -776,3 +1408,1088 @@ class TestRepakAndMerge(unittest.TestCase):
 #     #     mock_open_file.return_value.write.assert_called_once_with(
 #     #         json.dumps(config, indent=4)
 #     #     )
+
+
+class TestWriteHandler(unittest.TestCase):
+    """Functional tests for pak_merge_tool -> write_handler.py"""
+
+    def test_merge_writer(self):
+        """Test MergeWriter(temp_merged_mod_file, checkpoint_file, final_perf_chunk_sizes, write_settings)"""
+        import json
+        import tempfile
+        from scripts.write_handler import MergeWriter
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            temp_merged_mod_file = os.path.join(temp_dir, "test.cfg.tmp")
+            checkpoint_file = os.path.join(temp_dir, "test_perf_chunk_sizes.tmp")
+            write_settings = {
+                "flush_policy": "quit_save",
+                "flush_every_mb": 8,
+                "fsync_on_commit": True,
+            }
+            with MergeWriter(
+                temp_merged_mod_file, checkpoint_file, [], write_settings
+            ) as writer:
+                writer.write_chunk([b"test1\n", b"test2\n"])
+                writer.write_chunk([b"test3\xff\n"])
+                assert os.path.getsize(temp_merged_mod_file) == 0
+                assert writer.last_chunk_lines == [b"test3\xff\n"]
+                with patch("os.fsync", wraps=os.fsync) as mock_fsync:
+                    # Only a commit is synced, not a flush
+                    writer.flush()
+                    assert mock_fsync.call_count == 0
+                    writer.commit()
+                # The temp file is synced first, then the checkpoint and its directory
+                assert mock_fsync.call_count == (3 if hasattr(os, "O_DIRECTORY") else 2)
+                assert mock_fsync.call_args_list[0] == call(writer._file.fileno())
+
+            with open(temp_merged_mod_file, "rb") as f:
+                assert f.readlines() == [b"test1\n", b"test2\n", b"test3\xff\n"]
+            with open(checkpoint_file, "r", encoding="utf-8") as f:
+                assert json.loads(f.read()) == [2, 1]
+
+            # Buffers filled by the merge are written by the background writer
+            write_settings.update(
+                {"flush_policy": "every_n_mb", "flush_every_mb": 0, "queue_depth": 2}
+            )
+            with MergeWriter(
+                temp_merged_mod_file, checkpoint_file, [2, 1], write_settings
+            ) as writer:
+                for line in range(50):
+                    writer.write_chunk([f"test{line}\n".encode()])
+                writer.flush()
+                assert os.path.getsize(temp_merged_mod_file) == 19 + 10 * 6 + 40 * 7
+            with open(checkpoint_file, "r", encoding="utf-8") as f:
+                assert json.loads(f.read()) == [2, 1] + [1] * 50
+
+    def test_truncate_to_checkpoint(self):
+        """Test truncate_to_checkpoint(temp_merged_mod_file, checkpoint_line_count) -> int"""
+        import tempfile
+        from scripts.write_handler import truncate_to_checkpoint
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            temp_merged_mod_file = os.path.join(temp_dir, "test.cfg.tmp")
+            with open(temp_merged_mod_file, "w", encoding="utf-8") as f:
+                f.writelines(["test1\n", "test2\n", "test3\n"])
+
+            result = truncate_to_checkpoint(temp_merged_mod_file, 2)
+            assert result == 2
+            with open(temp_merged_mod_file, "r", encoding="utf-8") as f:
+                assert f.readlines() == ["test1\n", "test2\n"]
+
+
+class TestPipelineHandler(unittest.TestCase):
+    """Functional tests for pak_merge_tool -> pipeline_handler.py"""
+
+    def test_prefetcher(self):
+        """Test Prefetcher(items, queue_depth)"""
+        from scripts.pipeline_handler import Prefetcher
+
+        closed = []
+
+        def read_items(fail):
+            try:
+                for item in range(100):
+                    if fail and item == 3:
+                        raise OSError("test1")
+                    yield item
+            finally:
+                closed.append(fail)
+
+        for queue_depth in (0, 2):
+            with Prefetcher(read_items(False), queue_depth) as items:
+                assert list(items) == list(range(100))
+
+            # Leaving early stops and closes the generator
+            with Prefetcher(read_items(False), queue_depth) as items:
+                for item in items:
+                    if item == 5:
+                        break
+
+            # Errors are raised where the items are consumed
+            with self.assertRaises(OSError):
+                with Prefetcher(read_items(True), queue_depth) as items:
+                    assert list(items) == [0, 1, 2]
+        assert closed == [False, False, True] * 2
+
+    def test_background_worker(self):
+        """Test BackgroundWorker(queue_depth)"""
+        from scripts.pipeline_handler import BackgroundWorker
+
+        calls = []
+        with BackgroundWorker(2) as worker:
+            for item in range(10):
+                worker.submit(calls.append, item)
+            worker.wait()
+            assert calls == list(range(10))
+
+            worker.submit(int, "test1")
+            with self.assertRaises(ValueError):
+                worker.wait()
+
+
+class TestSpillHandler(unittest.TestCase):
+    """Functional tests for pak_merge_tool -> spill_handler.py"""
+
+    def test_spill_list(self):
+        """Test SpillList(spill_bytes, items, size_of)"""
+        from scripts.spill_handler import SpillList
+
+        lines = [f"test{line}\n" for line in range(100)]
+        with SpillList(10, lines, size_of=len) as spill_list:
+            spill_list.append("test100\n")
+            assert spill_list.spilled_count > 0
+            assert len(spill_list) == 101
+            assert list(spill_list) == lines + ["test100\n"]
+            assert spill_list[5:12] == lines[5:12]
+            assert spill_list[98:] == lines[98:] + ["test100\n"]
+            assert spill_list[-1] == "test100\n"
+
+        # Without spill_bytes it is a plain list
+        spill_list = SpillList(None, lines)
+        assert spill_list.spilled_count == 0
+        assert len(spill_list) == 100
+        assert list(spill_list) == lines
+        assert spill_list[:] == lines
+
+    def test_fit_chunk_size(self):
+        """Test fit_chunk_size(max_perf_chunk_size, file_paths, memory_budget) -> int"""
+        import tempfile
+        from scripts.spill_handler import fit_chunk_size
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_path = os.path.join(temp_dir, "test1.cfg")
+            with open(file_path, "w", encoding="utf-8") as f:
+                f.writelines(f"test{line} = {'x' * 60}\n" for line in range(1000))
+
+            assert fit_chunk_size(4096, [file_path], 0) == 4096
+            assert fit_chunk_size(4096, [file_path], 1024 * 1024) == 1024 * 1024 // (
+                (70 + sys.getsizeof(b"")) * 6
+            )
+            assert fit_chunk_size(4096, [file_path], 1024) == 64
+
+
+class TestJournalHandler(unittest.TestCase):
+    """Functional tests for pak_merge_tool -> journal_handler.py"""
+
+    def test_merge_journal(self):
+        """Test MergeJournal(journal_path) record, is_done, and clear"""
+        import tempfile
+        from scripts.journal_handler import MergeJournal, get_journal_path
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            new_file_path = os.path.join(temp_dir, "new.cfg")
+            final_file_path = os.path.join(temp_dir, "final.cfg")
+            for file_path in (new_file_path, final_file_path):
+                with open(file_path, "w", encoding="utf-8") as f:
+                    f.write("test1\n")
+            journal_path = get_journal_path(os.path.join(temp_dir, "final") + "/")
+            assert journal_path == os.path.join(temp_dir, "final.journal.jsonl")
+
+            with MergeJournal(journal_path) as journal:
+                assert not journal.is_done(new_file_path, final_file_path)
+                journal.record(new_file_path, final_file_path, "merged")
+
+            # A run killed while writing leaves a cut-off last line
+            with open(journal_path, "a", encoding="utf-8") as f:
+                f.write('{"new": "cut')
+
+            journal = MergeJournal(journal_path)
+            assert journal.entries[new_file_path]["outcome"] == "merged"
+            assert journal.is_done(new_file_path, final_file_path)
+
+            # A file changed since it was recorded is merged again
+            with open(new_file_path, "a", encoding="utf-8") as f:
+                f.write("test2\n")
+            assert not journal.is_done(new_file_path, final_file_path)
+
+            journal.clear()
+            assert not os.path.exists(journal_path)
+            assert journal.entries == {}
+
+
+class TestVfsHandler(unittest.TestCase):
+    """Functional tests for pak_merge_tool -> vfs_handler.py"""
+
+    def test_pak_file_system(self):
+        """Test PakFileSystem(pak_path, aes_key) listing and reading entries"""
+        import tempfile
+        from scripts.vfs_handler import PakFileSystem
+        from tests.pak_fixture_writer import write_pak
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            pak_path = os.path.join(temp_dir, "test_P.pak")
+            write_pak(pak_path, {"Stalker2/test1.cfg": b"test2\n"}, compress=True)
+            source_fs = PakFileSystem(pak_path)
+
+            assert source_fs.listdir(pak_path) == ["Stalker2"]
+            assert source_fs.isdir(os.path.join(pak_path, "Stalker2"))
+            test_file = os.path.join(pak_path, "Stalker2", "test1.cfg")
+            assert source_fs.exists(test_file)
+            assert not source_fs.isdir(test_file)
+            assert source_fs.getsize(test_file) == 6
+
+            materialized_file = source_fs.materialize(test_file)
+            with open(materialized_file, "rb") as f:
+                assert f.read() == b"test2\n"
+            source_fs.release(materialized_file)
+            assert not os.path.exists(materialized_file)
+            source_fs.close()
+
+    def test_pak_file_system_traversal(self):
+        """Test PakFileSystem(pak_path) rejects entries outside the pak's directory"""
+        import tempfile
+        from scripts.vfs_handler import PakFileSystem
+        from pak_handler import PakFormatError
+        from tests.pak_fixture_writer import write_pak
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            pak_path = os.path.join(temp_dir, "test_P.pak")
+            write_pak(pak_path, {"Stalker2/../../test1.cfg": b"test2\n"})
+            with self.assertRaises(PakFormatError):
+                PakFileSystem(pak_path)
+
+    def test_merge_directories_from_pak(self):
+        """Test merge_directories(new_mods_dir, final_merged_mod_dir, ..., source_fs) -> str"""
+        import tempfile
+        from scripts.merge_tool import merge_directories
+        from scripts.vfs_handler import PakFileSystem
+        from tests.pak_fixture_writer import write_pak
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            pak_path = os.path.join(temp_dir, "test_P.pak")
+            final_merged_mod_dir = os.path.join(temp_dir, "merged")
+            write_pak(pak_path, {"Stalker2/test1.cfg": b"test2\n", "test3.bin": b"4"})
+            source_fs = PakFileSystem(pak_path)
+
+            result = merge_directories(
+                pak_path,
+                final_merged_mod_dir,
+                {"code": False, "less": False},
+                {"max_perf_chunk_size": 1024, "valid_file_extensions": [".cfg"]},
+                source_fs=source_fs,
+            )
+            assert result == "continue"
+            with open(
+                os.path.join(final_merged_mod_dir, "Stalker2", "test1.cfg"), "rb"
+            ) as f:
+                assert f.read() == b"test2\n"
+            with open(os.path.join(final_merged_mod_dir, "test3.bin"), "rb") as f:
+                assert f.read() == b"4"
+
+
+class TestWalkHandler(unittest.TestCase):
+    """Functional tests for pak_merge_tool -> walk_handler.py"""
+
+    def test_walk_tree(self):
+        """Test walk_tree(new_dir, final_dir, source_fs, org_comp, sort_key)"""
+        import tempfile
+        from scripts.walk_handler import walk_files, walk_tree
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            new_dir = os.path.join(temp_dir, "new")
+            final_dir = os.path.join(temp_dir, "final")
+            for path in ("test1/test2.cfg", "test3/test4.cfg", "test5.cfg", "B.cfg"):
+                os.makedirs(os.path.dirname(os.path.join(new_dir, path)), exist_ok=True)
+                with open(os.path.join(new_dir, path), "w", encoding="utf-8") as f:
+                    f.write("test6\n")
+            os.makedirs(os.path.join(final_dir, "test1"))
+            with open(os.path.join(final_dir, "test5.cfg"), "w", encoding="utf-8") as f:
+                f.write("test7\n")
+
+            work_items = [
+                (
+                    item["kind"],
+                    os.path.relpath(item["new_path"], new_dir),
+                    item["final_exists"],
+                )
+                for item in walk_tree(new_dir, final_dir)
+            ]
+            assert work_items == [
+                ("file", "B.cfg", False),
+                ("file", os.path.join("test1", "test2.cfg"), False),
+                ("copy_dir", "test3", False),
+                ("file", "test5.cfg", True),
+            ]
+            assert [
+                item["kind"] for item in walk_tree(new_dir, final_dir, org_comp=True)
+            ] == ["file", "file", "missing_dir", "file"]
+
+            # Without a final directory every file is listed
+            assert walk_files(new_dir, sort_key=str.lower) == [
+                os.path.join(new_dir, path)
+                for path in ("B.cfg", "test1/test2.cfg", "test3/test4.cfg", "test5.cfg")
+            ]
+
+
+class TestHashHandler(unittest.TestCase):
+    """Functional tests for pak_merge_tool -> hash_handler.py"""
+
+    def test_hash_files_parallel(self):
+        """Test hash_files_parallel(file_paths, workers) -> dict"""
+        import hashlib
+        import tempfile
+        from scripts.hash_handler import hash_file, hash_files_parallel
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_paths = []
+            for name, data in (("test1.pak", b"test2" * 100000), ("test3.pak", b"")):
+                file_path = os.path.join(temp_dir, name)
+                with open(file_path, "wb") as f:
+                    f.write(data)
+                file_paths.append(file_path)
+                assert hash_file(file_path, 4096) == hashlib.sha256(data).hexdigest()
+
+            missing_path = os.path.join(temp_dir, "test4.pak")
+            result = hash_files_parallel(file_paths + [missing_path], workers=2)
+            assert sorted(result) == sorted(file_paths)
+            assert result[file_paths[0]] == hash_file(file_paths[0])
+
+    def test_files_identical(self):
+        """Test files_identical(file_path_a, file_path_b, block_size, mmap_threshold) -> bool"""
+        import tempfile
+        from scripts.hash_handler import blocks_identical, files_identical
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_paths = {}
+            for name, data in (
+                ("test1.uasset", b"test2" * 1000),
+                ("test3.uasset", b"test2" * 1000),
+                ("test4.uasset", b"test2" * 999 + b"test5"),
+            ):
+                file_paths[name] = os.path.join(temp_dir, name)
+                with open(file_paths[name], "wb") as f:
+                    f.write(data)
+
+            for mmap_threshold in (1, 1024 * 1024):
+                assert files_identical(
+                    file_paths["test1.uasset"],
+                    file_paths["test3.uasset"],
+                    256,
+                    mmap_threshold,
+                )
+                assert not files_identical(
+                    file_paths["test1.uasset"],
+                    file_paths["test4.uasset"],
+                    256,
+                    mmap_threshold,
+                )
+
+            blocks = [b"test2" * 500, b"test2" * 500]
+            assert blocks_identical(blocks, file_paths["test1.uasset"])
+            assert not blocks_identical(blocks[:1], file_paths["test1.uasset"])
+
+
+class TestHistoryHandler(unittest.TestCase):
+    """Functional tests for pak_merge_tool -> history_handler.py"""
+
+    def test_history_store(self):
+        """Test HistoryStore(db_path, legacy_json_path).get(clean_name) -> dict"""
+        import json
+        import sqlite3
+        import tempfile
+        from scripts.history_handler import HistoryStore
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            db_path = os.path.join(temp_dir, "history.db")
+            json_path = os.path.join(temp_dir, "history.json")
+            with open(json_path, "w", encoding="utf-8") as f:
+                json.dump({"test1": {"version": ["1"], "unpacked": "test2"}}, f)
+
+            with HistoryStore(db_path, json_path) as history:
+                assert history.get("test1") == {"version": ["1"], "unpacked": "test2"}
+                assert history.get("test3") is None
+
+                history.save_mod(
+                    "test3",
+                    {
+                        "version": ["v1.2", "v1.3"],
+                        "hash": "test4",
+                        "extracted_files": ["test5/test6.cfg"],
+                    },
+                )
+
+            # Reopening does not import the json again over the saved history
+            with open(json_path, "w", encoding="utf-8") as f:
+                json.dump({"test1": {"version": ["7"]}}, f)
+            with HistoryStore(db_path, json_path) as history:
+                assert history.get("test1")["version"] == ["1"]
+                history.save_mod("test1", {"merged_signature": "test7"})
+                assert history.get("test1")["merged_signature"] == "test7"
+                assert history.get("test3") == {
+                    "version": ["v1.2", "v1.3"],
+                    "hash": "test4",
+                    "extracted_files": ["test5/test6.cfg"],
+                }
+
+            # A database from before a column was added gets the column on open
+            old_db_path = os.path.join(temp_dir, "old_history.db")
+            connection = sqlite3.connect(old_db_path)
+            connection.execute(
+                "CREATE TABLE mods (id INTEGER PRIMARY KEY, clean_name TEXT UNIQUE)"
+            )
+            connection.close()
+            with HistoryStore(old_db_path, None) as history:
+                history.save_mod("test1", {"merged_signature": "test7"})
+                assert history.get("test1")["merged_signature"] == "test7"
+
+
+class TestManifestHandler(unittest.TestCase):
+    """Functional tests for pak_merge_tool -> manifest_handler.py"""
+
+    def test_update_manifest(self):
+        """Test update_manifest(output_dir, workers) -> dict"""
+        import hashlib
+        import tempfile
+        from scripts.manifest_handler import (
+            find_changed_files,
+            get_manifest_path,
+            load_manifest,
+            update_manifest,
+        )
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            output_dir = os.path.join(temp_dir, "merged")
+            os.makedirs(os.path.join(output_dir, "test1"))
+            for path, data in (("test1/test2.cfg", b"test3\n"), ("test4.cfg", b"")):
+                with open(os.path.join(output_dir, path), "wb") as f:
+                    f.write(data)
+            with open(os.path.join(output_dir, "test5.cfg.tmp"), "wb") as f:
+                f.write(b"test6\n")
+
+            manifest = update_manifest(output_dir, workers=2)
+            assert sorted(manifest) == ["test1/test2.cfg", "test4.cfg"]
+            assert manifest["test1/test2.cfg"]["size"] == 6
+            assert (
+                manifest["test1/test2.cfg"]["hash"]
+                == hashlib.sha256(b"test3\n").hexdigest()
+            )
+            assert load_manifest(get_manifest_path(output_dir)) == manifest
+
+            # Edit, add, and remove files by hand
+            with open(os.path.join(output_dir, "test1", "test2.cfg"), "wb") as f:
+                f.write(b"test7\n\n")
+            with open(os.path.join(output_dir, "test8.cfg"), "wb") as f:
+                f.write(b"test9\n")
+            os.remove(os.path.join(output_dir, "test4.cfg"))
+
+            result = find_changed_files(manifest, output_dir)
+            assert result == {
+                "added": ["test8.cfg"],
+                "changed": ["test1/test2.cfg"],
+                "removed": ["test4.cfg"],
+            }
+
+            manifest = update_manifest(output_dir, workers=2)
+            assert sorted(manifest) == ["test1/test2.cfg", "test8.cfg"]
+            assert find_changed_files(manifest, output_dir) == {
+                "added": [],
+                "changed": [],
+                "removed": [],
+            }
+
+    def test_warn_manual_edits_interrupted_run(self):
+        """Test warn_manual_edits(output_dir) skips the files an interrupted run wrote"""
+        import tempfile
+        from scripts.journal_handler import MergeJournal, get_journal_path
+        from scripts.manifest_handler import update_manifest, warn_manual_edits
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            output_dir = os.path.join(temp_dir, "merged")
+            os.makedirs(output_dir)
+            update_manifest(output_dir)
+
+            # A run writes two files and is killed before it saves the manifest
+            with MergeJournal(get_journal_path(output_dir)) as journal:
+                for name in ("test1.cfg", "test2.cfg"):
+                    with open(
+                        os.path.join(output_dir, name), "w", encoding="utf-8"
+                    ) as f:
+                        f.write("test3\n")
+                    journal.record(
+                        os.path.join(temp_dir, name),
+                        os.path.join(output_dir, name),
+                        "copied",
+                    )
+
+            # One of them is edited by hand afterwards
+            with open(
+                os.path.join(output_dir, "test2.cfg"), "a", encoding="utf-8"
+            ) as f:
+                f.write("test4\n")
+            assert warn_manual_edits(output_dir)["added"] == ["test2.cfg"]
+
+
+class TestUpdateHandler(unittest.TestCase):
+    """Functional tests for pak_merge_tool -> update_handler.py"""
+
+    def test_apply_version_delta(self):
+        """Test apply_version_delta(old_lines, new_lines, merged_lines) -> list"""
+        from scripts.update_handler import apply_version_delta
+
+        old_lines = ["test1\n", "test2\n", "test3\n", "test4\n"]
+        new_lines = ["test1\n", "test5\n", "test3\n", "test4\n", "test6\n"]
+        merged_lines = ["test1\n", "test2\n", "test3\n", "test7\n", "test4\n"]
+        result = apply_version_delta(old_lines, new_lines, merged_lines)
+        assert result == [
+            "test1\n",
+            "test5\n",
+            "test3\n",
+            "test7\n",
+            "test4\n",
+            "test6\n",
+        ]
+
+        # Another mod changed the same line - conflict
+        merged_lines = ["test1\n", "test8\n", "test3\n", "test4\n"]
+        assert apply_version_delta(old_lines, new_lines, merged_lines) is None
+
+        # The merged file was reindented and uses other line endings
+        compare_settings = {"ignore_whitespace": True, "comment_prefixes": ()}
+        old_lines = [
+            b"test1 : struct.begin\n",
+            b"test2 = 1\n",
+            b"test3 = 1\n",
+            b"struct.end\n",
+        ]
+        new_lines = [
+            b"test1 : struct.begin\n",
+            b"test2 = 3\n",
+            b"test3 = 1\n",
+            b"struct.end\n",
+        ]
+        merged_lines = [
+            b"test1 : struct.begin\r\n",
+            b"    test2 = 1\r\n",
+            b"    test3 = 1\r\n",
+            b"    test4 = 2\r\n",
+            b"struct.end\r\n",
+        ]
+        assert apply_version_delta(old_lines, new_lines, merged_lines) is None
+        assert apply_version_delta(
+            old_lines, new_lines, merged_lines, compare_settings
+        ) == [
+            b"test1 : struct.begin\r\n",
+            b"    test2 = 3\r\n",
+            b"    test3 = 1\r\n",
+            b"    test4 = 2\r\n",
+            b"struct.end\r\n",
+        ]
+
+    def test_update_mod(self):
+        """Test update_mod(old_fs, old_root, new_fs, new_root, final_merged_mod_dir, ...) -> str"""
+        import tempfile
+        from scripts.update_handler import update_mod
+        from scripts.vfs_handler import OsFileSystem
+
+        trees = {
+            "old": {"test1.cfg": "test2\ntest3\n", "test4.bin": "test5"},
+            "new": {
+                "test1.cfg": "test2\ntest6\n",
+                "test4.bin": "test7",
+                "test8.cfg": "test9\n",
+            },
+            "merged": {"test1.cfg": "test10\ntest2\ntest3\n", "test4.bin": "test5"},
+        }
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for tree, files in trees.items():
+                os.makedirs(os.path.join(temp_dir, tree))
+                for path, data in files.items():
+                    with open(
+                        os.path.join(temp_dir, tree, path), "w", encoding="utf-8"
+                    ) as f:
+                        f.write(data)
+
+            config = {"valid_file_extensions": [".cfg"]}
+            result = update_mod(
+                OsFileSystem(),
+                os.path.join(temp_dir, "old"),
+                OsFileSystem(),
+                os.path.join(temp_dir, "new"),
+                os.path.join(temp_dir, "merged"),
+                {},
+                config,
+            )
+            assert result == "continue"
+
+            expected = {
+                "test1.cfg": "test10\ntest2\ntest6\n",
+                "test4.bin": "test7",
+                "test8.cfg": "test9\n",
+            }
+            for path, data in expected.items():
+                with open(
+                    os.path.join(temp_dir, "merged", path), encoding="utf-8"
+                ) as f:
+                    assert f.read() == data
+
+
+class TestWatchHandler(unittest.TestCase):
+    """Functional tests for pak_merge_tool -> watch_handler.py"""
+
+    def test_wait_for_changes(self):
+        """Test wait_for_changes(watcher, debounce_seconds) -> set"""
+        import tempfile
+        from scripts.watch_handler import InotifyWatcher, wait_for_changes
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            os.makedirs(os.path.join(temp_dir, "test1"))
+            try:
+                watcher = InotifyWatcher(temp_dir)
+            except OSError:
+                self.skipTest("inotify is not available")
+
+            with watcher:
+                assert watcher.read_changes(timeout=0) == set()
+
+                with open(
+                    os.path.join(temp_dir, "test1", "test2.cfg"), "w", encoding="utf-8"
+                ) as f:
+                    f.write("test3\n")
+                os.makedirs(os.path.join(temp_dir, "test4", "test5"))
+                with open(os.path.join(temp_dir, "test6.pak"), "wb") as f:
+                    f.write(b"test7")
+                with open(os.path.join(temp_dir, "test8.pak.part"), "wb") as f:
+                    f.write(b"test9")
+
+                result = wait_for_changes(watcher, 0.2)
+                assert result == {"test1", "test4", "test6.pak"}
+
+                # Directories created after the watch started are watched too
+                with open(
+                    os.path.join(temp_dir, "test4", "test5", "test10.cfg"),
+                    "w",
+                    encoding="utf-8",
+                ) as f:
+                    f.write("test11\n")
+                assert wait_for_changes(watcher, 0.2) == {"test4"}
+
+
+class TestConflictHandler(unittest.TestCase):
+    """Functional tests for pak_merge_tool -> conflict_handler.py"""
+
+    def test_build_conflict_matrix(self):
+        """Test build_conflict_matrix(new_mods_dir, base_dir, valid_file_extensions, workers) -> dict"""
+        import tempfile
+        from scripts.conflict_handler import build_conflict_matrix
+        from scripts.hash_handler import hash_files_parallel
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            files = {
+                "base/test1.cfg": "test2\ntest3\n",
+                "base/test4.cfg": "test5\n",
+                "mods/test6/test1.cfg": "test7\ntest3\n",
+                "mods/test6/test4.cfg": "test5\n",
+                "mods/test6/test8.bin": "test9",
+                "mods/test10/test1.cfg": "test2\ntest11\n",
+                "mods/test10/test8.bin": "test12",
+                "mods/test10/test13.cfg": "test14\n",
+            }
+            for path, data in files.items():
+                os.makedirs(
+                    os.path.dirname(os.path.join(temp_dir, path)), exist_ok=True
+                )
+                with open(os.path.join(temp_dir, path), "w", encoding="utf-8") as f:
+                    f.write(data)
+
+            report = build_conflict_matrix(
+                os.path.join(temp_dir, "mods"),
+                os.path.join(temp_dir, "base"),
+                [".cfg"],
+                2,
+            )
+            assert report["mods"] == ["test10", "test6"]
+            # test4.cfg matches the base and test13.cfg is only in one mod
+            assert sorted(report["paths"]) == ["test1.cfg", "test8.bin"]
+
+            test1 = report["paths"]["test1.cfg"]
+            assert test1["distinct_contents"] == 2
+            assert test1["differs_from_base"] == {"test10": True, "test6": True}
+            assert test1["pair_hunks"] == [{"mods": ["test10", "test6"], "hunks": 1}]
+            assert test1["base_hunks"] == {"test10": 1, "test6": 1}
+
+            test8 = report["paths"]["test8.bin"]
+            assert test8["base"] is False
+            assert test8["pair_hunks"] == [{"mods": ["test10", "test6"], "hunks": None}]
+            assert report["summary"]["estimated_hunks"] == 3
+            assert report["summary"]["unreadable_files"] == 0
+
+            # A file that can't be read by the hunk workers is reported, not raised
+            unreadable_path = os.path.join(temp_dir, "mods", "test10", "test1.cfg")
+
+            def hash_then_remove(file_paths, workers):
+                file_hashes = hash_files_parallel(file_paths, workers)
+                os.remove(unreadable_path)
+                return file_hashes
+
+            report = build_conflict_matrix(
+                os.path.join(temp_dir, "mods"),
+                os.path.join(temp_dir, "base"),
+                [".cfg"],
+                2,
+                hash_then_remove,
+            )
+            test1 = report["paths"]["test1.cfg"]
+            assert test1["unreadable"] == ["test10"]
+            assert test1["pair_hunks"] == [{"mods": ["test10", "test6"], "hunks": None}]
+            assert test1["base_hunks"] == {"test10": None, "test6": 1}
+            assert report["summary"]["unreadable_files"] == 1
+
+            # A file that can't be hashed gets no hunk jobs at all
+            with open(unreadable_path, "w", encoding="utf-8") as f:
+                f.write("test2\ntest11\n")
+            report = build_conflict_matrix(
+                os.path.join(temp_dir, "mods"),
+                os.path.join(temp_dir, "base"),
+                [".cfg"],
+                2,
+                lambda file_paths, workers: {
+                    path: file_hash
+                    for path, file_hash in hash_files_parallel(
+                        file_paths, workers
+                    ).items()
+                    if path != unreadable_path
+                },
+            )
+            test1 = report["paths"]["test1.cfg"]
+            assert test1["unreadable"] == ["test10"]
+            assert test1["base_hunks"] == {"test6": 1}
+
+
+class TestResolutionHandler(unittest.TestCase):
+    """Functional tests for pak_merge_tool -> resolution_handler.py"""
+
+    def test_export_and_apply_resolutions(self):
+        """Test export_conflicts(...) -> dict and apply_resolutions(export_dir, final_merged_mod_dir) -> dict"""
+        import tempfile
+        from scripts.resolution_handler import apply_resolutions, export_conflicts
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            files = {
+                "base/test1.cfg": "test2\ntest3\ntest4\n",
+                "base/test11.cfg": "test12\n",
+                "mods/test5/test1.cfg": "test2\ntest6\ntest4\n",
+                "mods/test5/test7.cfg": "test8\n",
+                "mods/test5/test11.cfg": "test13\n",
+                "mods/test9/test1.cfg": "test2\ntest3\ntest10\n",
+                "mods/test9/test11.cfg": "test14\n",
+            }
+            for path, data in files.items():
+                os.makedirs(
+                    os.path.dirname(os.path.join(temp_dir, path)), exist_ok=True
+                )
+                with open(os.path.join(temp_dir, path), "w", encoding="utf-8") as f:
+                    f.write(data)
+
+            base_dir = os.path.join(temp_dir, "base")
+            export_dir = os.path.join(temp_dir, "export")
+            config = {
+                "valid_file_extensions": [".cfg"],
+                "normalize_whitespace": True,
+            }
+            result = export_conflicts(
+                os.path.join(temp_dir, "mods"), base_dir, export_dir, config
+            )
+            assert result == {
+                "status": "exported",
+                "files": 2,
+                "new_files": 1,
+                "hunks": 3,
+            }
+            # One file per output file with the hunks of every mod
+            with open(os.path.join(export_dir, "test1.cfg"), encoding="utf-8") as f:
+                assert f.read() == (
+                    "test2\n<<<<<<< merged\ntest3\n=======\ntest6\n>>>>>>> test5\n"
+                    "<<<<<<< merged\ntest4\n=======\ntest10\n>>>>>>> test9\n"
+                )
+            # Overlapping hunks share a region with a section per mod
+            with open(os.path.join(export_dir, "test11.cfg"), encoding="utf-8") as f:
+                assert f.read() == (
+                    "<<<<<<< merged\ntest12\n======= test5\ntest13\n"
+                    "======= test9\ntest14\n>>>>>>> test5, test9\n"
+                )
+
+            # test1.cfg is resolved, test11.cfg still has its markers
+            with open(
+                os.path.join(export_dir, "test1.cfg"), "w", encoding="utf-8"
+            ) as f:
+                f.write("test2\ntest6\ntest10\n")
+            report = apply_resolutions(export_dir, base_dir)
+            assert report["applied"] == ["test1.cfg"]
+            assert report["copied"] == ["test7.cfg"]
+            assert report["unresolved"] == ["test11.cfg"]
+            assert report["merged_mods"] == []
+            assert report["status"] == "applied_with_errors"
+            with open(os.path.join(base_dir, "test1.cfg"), encoding="utf-8") as f:
+                assert f.read() == "test2\ntest6\ntest10\n"
+            with open(os.path.join(base_dir, "test7.cfg"), encoding="utf-8") as f:
+                assert f.read() == "test8\n"
+
+            # Both mods are merged once every file they change is applied
+            with open(
+                os.path.join(export_dir, "test11.cfg"), "w", encoding="utf-8"
+            ) as f:
+                f.write("test13\ntest14\n")
+            report = apply_resolutions(export_dir, base_dir)
+            assert report["applied"] == ["test1.cfg", "test11.cfg"]
+            assert report["merged_mods"] == ["test5", "test9"]
+            assert report["status"] == "applied"
+
+            # A merged file changed since the export is stale
+            with open(os.path.join(base_dir, "test11.cfg"), "w", encoding="utf-8") as f:
+                f.write("test15\n")
+            report = apply_resolutions(export_dir, base_dir)
+            assert report["stale"] == ["test11.cfg"]
+            with open(os.path.join(base_dir, "test11.cfg"), encoding="utf-8") as f:
+                assert f.read() == "test15\n"
+
+
+class TestMergeDaemon(unittest.TestCase):
+    """Functional tests for pak_merge_tool -> merge_daemon.py"""
+
+    @patch("scripts.merge_daemon.validate_requirements")
+    def test_merge_daemon(self, mock_validate_requirements):
+        """Test MergeDaemon.serve(socket_path) -> None"""
+        import tempfile
+        import threading
+        from scripts.daemon_handler import send_request
+        from scripts.merge_daemon import MergeDaemon
+
+        mock_validate_requirements.return_value = {"less": False, "code": False}
+        with tempfile.TemporaryDirectory() as temp_dir:
+            socket_path = os.path.join(temp_dir, "test1.sock")
+            format_dir = os.path.join(temp_dir, "test2")
+            os.makedirs(format_dir)
+            with open(
+                os.path.join(format_dir, "test3.cfg"), "w", encoding="utf-8"
+            ) as f:
+                f.write("test4 {\ntest5\n}\n")
+
+            daemon = MergeDaemon()
+            server = threading.Thread(target=daemon.serve, args=(socket_path,))
+            server.start()
+            try:
+                for _ in range(100):
+                    if os.path.exists(socket_path):
+                        break
+                    threading.Event().wait(0.05)
+
+                request = {"command": "format", "format_dir": format_dir, "workers": 1}
+                result = send_request(socket_path, request)
+                assert result["status"] == "formatted"
+                assert len(result["formatted"]) == 1
+
+                # The file is unchanged since it was formatted, so it isn't read again
+                result = send_request(socket_path, request)
+                assert result["formatted"] == []
+                assert result["skipped"] == 1
+
+                result = send_request(
+                    socket_path, {"command": "query", "query": "stats"}
+                )
+                assert result["formatted"] == 1
+
+                result = send_request(socket_path, {"command": "test6"})
+                assert result["status"] == "error"
+
+                # A request that isn't an object doesn't stop the daemon
+                result = send_request(socket_path, ["test7"])
+                assert result["status"] == "error"
+
+                # A second daemon can't take over the socket
+                with self.assertRaises(OSError):
+                    MergeDaemon().serve(socket_path)
+                assert (
+                    send_request(socket_path, {"command": "query", "query": "stats"})[
+                        "status"
+                    ]
+                    == "ok"
+                )
+            finally:
+                send_request(socket_path, {"command": "shutdown"})
+                server.join(5)
+            assert not os.path.exists(socket_path)
+
+    @patch("scripts.merge_daemon.validate_requirements")
+    def test_merge_daemon_merge(self, mock_validate_requirements):
+        """Test MergeDaemon.merge(request) -> dict"""
+        import tempfile
+        from scripts.manifest_handler import get_manifest_path, load_manifest
+        from scripts.merge_daemon import MergeDaemon
+
+        mock_validate_requirements.return_value = {"less": False, "code": False}
+        with tempfile.TemporaryDirectory() as temp_dir:
+            new_mods_dir = os.path.join(temp_dir, "test1")
+            final_merged_mod_dir = os.path.join(temp_dir, "test2")
+            os.makedirs(new_mods_dir)
+            with open(
+                os.path.join(new_mods_dir, "test3.cfg"), "w", encoding="utf-8"
+            ) as f:
+                f.write("test4\n")
+
+            daemon = MergeDaemon()
+            daemon.manifests[final_merged_mod_dir] = {"test5.cfg": {}}
+            request = {
+                "command": "merge",
+                "new_mods_dir": new_mods_dir,
+                "final_merged_mod_dir": final_merged_mod_dir,
+            }
+            result = daemon.handle_request(request)
+            assert result == {"status": "merged", "files": 1}
+
+            # The manifest in memory is the one written by the merge
+            manifest = load_manifest(get_manifest_path(final_merged_mod_dir))
+            assert daemon.manifests[final_merged_mod_dir] == manifest
+            result = daemon.handle_request(
+                {
+                    "command": "query",
+                    "query": "changed",
+                    "final_merged_mod_dir": final_merged_mod_dir,
+                }
+            )
+            assert result["changed"] == {"added": [], "changed": [], "removed": []}
+
+            # A failed merge doesn't leave a stale manifest in memory either
+            daemon.manifests[final_merged_mod_dir] = {"test5.cfg": {}}
+            with patch(
+                "scripts.merge_daemon.merge_directories", side_effect=OSError("test6")
+            ):
+                result = daemon.handle_request(request)
+            assert result["status"] == "error"
+            assert daemon.manifests[final_merged_mod_dir] == manifest
+
+
+class TestStructTreeHandler(unittest.TestCase):
+    """Functional tests for pak_merge_tool -> struct_tree_handler.py"""
+
+    def test_diff_struct_trees(self):
+        """Test diff_struct_trees(old_tree, new_tree) -> list"""
+        import tempfile
+        from scripts import struct_tree_handler
+        from scripts.struct_tree_handler import (
+            build_struct_tree,
+            diff_struct_trees,
+            iter_segment_chunks,
+        )
+
+        with tempfile.TemporaryDirectory() as temp_dir, patch.object(
+            struct_tree_handler, "STRUCT_TREE_CACHE_DIR", temp_dir
+        ):
+            old_lines = [
+                b"test1\n",
+                b"struct.begin test2\n",
+                b"    test3\n",
+                b"    struct.begin test4\n",
+                b"        test5\n",
+                b"    struct.end\n",
+                b"struct.end\n",
+                b"struct.begin test6\n",
+                b"    test7\n",
+                b"struct.end\n",
+            ]
+            new_lines = list(old_lines)
+            new_lines[4] = b"        test8\n"
+            new_lines.insert(7, b"test9\n")
+
+            old_tree = build_struct_tree(old_lines)
+            assert [(node["start"], node["end"]) for node in old_tree] == [
+                (0, 1),
+                (1, 7),
+                (7, 10),
+            ]
+
+            # Only the changed line inside test4 and the inserted line differ
+            segments = diff_struct_trees(old_tree, build_struct_tree(new_lines))
+            assert segments == [
+                ("equal", 0, 4, 0, 4),
+                ("changed", 4, 5, 4, 5),
+                ("equal", 5, 7, 5, 7),
+                ("changed", 7, 7, 7, 8),
+                ("equal", 7, 10, 8, 11),
+            ]
+
+            chunks = list(
+                iter_segment_chunks(iter(old_lines), iter(new_lines), segments, 1024)
+            )
+            assert chunks[1] == ([b"        test5\n"], [b"        test8\n"], "changed")
+            assert chunks[3] == ([], [b"test9\n"], "changed")
+            assert b"".join(b"".join(new) for _, new, _ in chunks) == b"".join(
+                new_lines
+            )
+
+    def test_diff_struct_trees_moved(self):
+        """Test diff_struct_trees(old_tree, new_tree) -> list"""
+        import tempfile
+        from scripts import struct_tree_handler
+        from scripts.struct_tree_handler import build_struct_tree, diff_struct_trees
+
+        with tempfile.TemporaryDirectory() as temp_dir, patch.object(
+            struct_tree_handler, "STRUCT_TREE_CACHE_DIR", temp_dir
+        ):
+            old_lines = [
+                b"struct.begin test1\n",
+                b"    test2\n",
+                b"struct.end\n",
+                b"struct.begin test3\n",
+                b"    test4\n",
+                b"struct.end\n",
+                b"struct.begin test5\n",
+                b"    test6\n",
+                b"struct.end\n",
+            ]
+            # test1 moves to the end unchanged
+            new_lines = old_lines[3:] + old_lines[:3]
+
+            segments = diff_struct_trees(
+                build_struct_tree(old_lines), build_struct_tree(new_lines)
+            )
+            assert segments == [
+                ("moved", 0, 3, 0, 0),
+                ("equal", 3, 9, 0, 6),
+                ("moved", 9, 9, 6, 9),
+            ]
+
+            # A block removed twice and added once elsewhere is a change, not a move
+            duplicate_lines = old_lines[:3] + old_lines[3:6] + old_lines[:3]
+            segments = diff_struct_trees(
+                build_struct_tree(duplicate_lines), build_struct_tree(new_lines)
+            )
+            assert "moved" not in [segment[0] for segment in segments]
+
+            # A blank run moved between the structs is a delete and an insert, not a move
+            blank_lines = old_lines[:3] + [b"\n"] + old_lines[3:]
+            new_blank_lines = old_lines + [b"\n"]
+            segments = diff_struct_trees(
+                build_struct_tree(blank_lines), build_struct_tree(new_blank_lines)
+            )
+            assert "moved" not in [segment[0] for segment in segments]
+
+    def test_load_struct_tree_cache(self):
+        """Test load_struct_tree(file_path, compare_settings) caches trees by content"""
+        import tempfile
+        from scripts import struct_tree_handler
+        from scripts.struct_tree_handler import (
+            load_struct_tree,
+            prune_struct_tree_cache,
+        )
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cache_dir = os.path.join(temp_dir, "cache")
+            with patch.object(struct_tree_handler, "STRUCT_TREE_CACHE_DIR", cache_dir):
+                # Copies of a file in other directories share one entry
+                for name in ("test1", "test2"):
+                    os.makedirs(os.path.join(temp_dir, name))
+                    file_path = os.path.join(temp_dir, name, "test3.cfg")
+                    with open(file_path, "wb") as f:
+                        f.write(b"struct.begin test4\n    test5\nstruct.end\n")
+                    tree = load_struct_tree(file_path)
+                    assert len(tree) == 1
+                assert len(os.listdir(cache_dir)) == 1
+
+                with open(file_path, "ab") as f:
+                    f.write(b"test6\n")
+                load_struct_tree(file_path)
+                assert len(os.listdir(cache_dir)) == 2
+
+                assert prune_struct_tree_cache(max_entries=1) == 2
+                assert os.listdir(cache_dir) == []
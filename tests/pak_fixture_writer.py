@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+
+# Version 0.1.0
+
+"""Tool to write small .pak files for testing."""
+
+# Usage: python pak_fixture_writer.py --path="<pak_path>" --source_dir="<dir>" [--compress] [--compression=Gzip] [--version=<3-11>] [--encrypt_key="<0x key>"]
+# Example: clear;python tests\pak_fixture_writer.py --path="tests\test_P.pak" --source_dir="tests\new_test_dir\m_dir" --compress
+
+import logging
+import os
+import struct
+import zlib
+
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+# Set up logging
+logging.basicConfig(
+    level=logging.DEBUG,  # Set the log level
+    format="%(asctime)s | %(levelname)s | %(message)s",  # Set the log format
+    handlers=[
+        # Log to a file - escape any bytes that aren't valid UTF-8
+        logging.FileHandler("merge_tool.log", errors="backslashreplace"),
+        logging.StreamHandler(),  # Also log to the console
+    ],
+)
+
+# Create a logger object
+logger = logging.getLogger(__name__)
+
+PAK_MAGIC = 0x5A6F12E1
+PAK_VERSION = 11
+AES_BLOCK_SIZE = 16
+# Compression indexes are 1-based into these names, which also match the flags
+#   used before version 8 - 0x01 Zlib and 0x02 Gzip
+COMPRESSION_METHODS = ["Zlib", "Gzip", "", "", ""]
+
+
+def fstring(value):
+    """Serialize an Unreal FString."""
+    encoded = value.encode("ascii") + b"\0"
+    return struct.pack("<i", len(encoded)) + encoded
+
+
+def parse_key(encrypt_key):
+    """Convert a 0x prefixed hex AES key into bytes, passing bytes through."""
+    if isinstance(encrypt_key, str):
+        return bytes.fromhex(encrypt_key[2:])
+    return encrypt_key
+
+
+def encrypt(data, key):
+    """Pad data with zeros to the AES block size and encrypt it with AES-256 ECB."""
+    padding = -len(data) % AES_BLOCK_SIZE
+    encryptor = Cipher(algorithms.AES(key), modes.ECB()).encryptor()
+    return encryptor.update(data + b"\0" * padding) + encryptor.finalize()
+
+
+def compress_block(data, compression):
+    """Compress a block with Zlib or Gzip."""
+    if compression == "Gzip":
+        compressor = zlib.compressobj(wbits=31)
+        return compressor.compress(data) + compressor.flush()
+    return zlib.compress(data)
+
+
+def entry_record(
+    version,
+    offset,
+    compressed_size,
+    uncompressed_size,
+    compression,
+    blocks,
+    encrypted=False,
+    block_size=0x10000,
+):
+    """Serialize a full entry record of a pak version."""
+    record = struct.pack("<QQQ", offset, compressed_size, uncompressed_size)
+    # Version 8 lists 4 compression methods and stores the index as a byte
+    record += struct.pack("<B" if version == 8 else "<I", compression)
+    if version < 2:
+        record += b"\0" * 8  # Timestamp
+    record += b"\0" * 20  # SHA1 hash
+    if version >= 3:
+        if compression:
+            record += struct.pack("<I", len(blocks))
+            for block_start, block_end in blocks:
+                record += struct.pack("<QQ", block_start, block_end)
+        record += struct.pack("<BI", encrypted, block_size if compression else 0)
+    return record
+
+
+def encoded_entry(
+    offset, compressed_size, uncompressed_size, compression, blocks, encrypted=False
+):
+    """Serialize a bit-packed entry for the encoded entries of the index."""
+    bits = (1 << 31) | (1 << 30) | (1 << 29)  # All sizes fit in 32 bits
+    bits |= compression << 23
+    bits |= encrypted << 22
+    bits |= len(blocks) << 6
+    bits |= 0x3F  # Explicit compression block size
+    encoded = struct.pack("<II", bits, 0x10000 if compression else 0)
+    encoded += struct.pack("<II", offset, uncompressed_size)
+    if compression:
+        encoded += struct.pack("<I", compressed_size)
+    # A single block is only left out when its position follows from the header
+    if len(blocks) > 1 or (blocks and encrypted):
+        for block_start, block_end in blocks:
+            encoded += struct.pack("<I", block_end - block_start)
+    return encoded
+
+
+def write_pak(
+    pak_path,
+    files,
+    compress=False,
+    block_size=0x10000,
+    mount="../../../",
+    version=PAK_VERSION,
+    compression="Zlib",
+    encrypt_key=None,
+):
+    """
+    Write a pak file.
+
+    :param pak_path: Path to the pak file to write.
+    :param files: Dict of entry paths to file contents as bytes.
+    :param compress: Compress the entries in blocks of block_size.
+    :param version: Pak version from 3 to 11 - versions before 10 use a plain index.
+    :param compression: Zlib or Gzip.
+    :param encrypt_key: AES-256 key as 0x prefixed hex or bytes to encrypt the entries
+        with, and from version 4 the index.
+    """
+    compression_index = COMPRESSION_METHODS.index(compression) + 1 if compress else 0
+    key = parse_key(encrypt_key)
+    encrypted = key is not None
+    encrypt_index = encrypted and version >= 4
+    encoded_entries = b""
+    index_records = b""
+    directories = {}
+
+    def stored(data, encrypt_data):
+        return encrypt(data, key) if encrypt_data else data
+
+    with open(pak_path, "wb") as pak:
+        for path in sorted(files):
+            data = files[path]
+            offset = pak.tell()
+
+            blocks = []
+            compressed_size = len(data)
+            payload = stored(data, encrypted)
+            if compression_index:
+                compressed_blocks = [
+                    compress_block(data[i : i + block_size], compression)
+                    for i in range(0, max(len(data), 1), block_size)
+                ]
+                header_size = len(
+                    entry_record(version, 0, 0, 0, 1, [(0, 0)] * len(compressed_blocks))
+                )
+                # Encrypted blocks are padded to the AES block size on disk
+                block_start = header_size
+                for compressed_block in compressed_blocks:
+                    blocks.append((block_start, block_start + len(compressed_block)))
+                    block_start += len(stored(compressed_block, encrypted))
+                compressed_size = sum(map(len, compressed_blocks))
+                payload = b"".join(
+                    stored(compressed_block, encrypted)
+                    for compressed_block in compressed_blocks
+                )
+
+            pak.write(
+                entry_record(
+                    version,
+                    0,
+                    compressed_size,
+                    len(data),
+                    compression_index,
+                    blocks,
+                    encrypted,
+                    block_size,
+                )
+            )
+            pak.write(payload)
+
+            if version < 10:
+                # Block offsets are absolute before version 5
+                if version < 5:
+                    blocks = [(start + offset, end + offset) for start, end in blocks]
+                index_records += fstring(path) + entry_record(
+                    version,
+                    offset,
+                    compressed_size,
+                    len(data),
+                    compression_index,
+                    blocks,
+                    encrypted,
+                    block_size,
+                )
+                continue
+
+            directory, file_name = os.path.split("/" + path)
+            directory_files = directories.setdefault(directory.lstrip("/") + "/", [])
+            directory_files.append((file_name, len(encoded_entries)))
+            encoded_entries += encoded_entry(
+                offset,
+                compressed_size,
+                len(data),
+                compression_index,
+                blocks,
+                encrypted,
+            )
+
+        index_offset = pak.tell()
+        if version < 10:
+            index = fstring(mount) + struct.pack("<I", len(files)) + index_records
+            index = stored(index, encrypt_index)
+            pak.write(index)
+        else:
+            directory_index = struct.pack("<I", len(directories))
+            for directory, directory_files in directories.items():
+                directory_index += fstring(directory)
+                directory_index += struct.pack("<I", len(directory_files))
+                for file_name, encoded_offset in directory_files:
+                    directory_index += fstring(file_name)
+                    directory_index += struct.pack("<i", encoded_offset)
+            directory_index = stored(directory_index, encrypt_index)
+
+            def build_index(directory_index_offset):
+                index = fstring(mount)
+                index += struct.pack("<IQ", len(files), 0)
+                index += struct.pack("<I", 0)  # No path hash index
+                index += struct.pack(
+                    "<IQQ", 1, directory_index_offset, len(directory_index)
+                )
+                index += b"\0" * 20
+                index += struct.pack("<I", len(encoded_entries)) + encoded_entries
+                index += struct.pack("<I", 0)  # No unencoded entries
+                return stored(index, encrypt_index)
+
+            # The directory index follows the index, padded if it is encrypted
+            index = build_index(index_offset + len(build_index(0)))
+            pak.write(index)
+            pak.write(directory_index)
+
+        if version >= 7:
+            pak.write(b"\0" * 16)  # Encryption key guid
+        if version >= 4:
+            pak.write(struct.pack("<B", encrypt_index))
+        pak.write(struct.pack("<II", PAK_MAGIC, version))
+        pak.write(struct.pack("<QQ", index_offset, len(index)))
+        pak.write(b"\0" * 20)  # Index hash
+        if version == 9:
+            pak.write(b"\0")  # Frozen index flag
+        if version >= 8:
+            for name in COMPRESSION_METHODS[: 4 if version == 8 else 5]:
+                pak.write(name.encode("ascii").ljust(32, b"\0"))
+
+
+def main():
+    """Main function for the script."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Write a .pak file for testing.")
+    parser.add_argument("--path", type=str, help="Path to the pak file to write.")
+    parser.add_argument(
+        "--source_dir", type=str, help="Directory with the files to pack."
+    )
+    parser.add_argument("--compress", action="store_true", help="Compress the entries.")
+    parser.add_argument(
+        "--compression",
+        choices=["Zlib", "Gzip"],
+        default="Zlib",
+        help="Compression method of the entries.",
+    )
+    parser.add_argument(
+        "--version", type=int, default=PAK_VERSION, help="Pak version from 3 to 11."
+    )
+    parser.add_argument(
+        "--encrypt_key", type=str, help="0x prefixed hex AES-256 key to encrypt with."
+    )
+
+    args = parser.parse_args()
+
+    files = {}
+    for root, _, file_names in os.walk(args.source_dir):
+        for file_name in file_names:
+            file_path = os.path.join(root, file_name)
+            relative_path = os.path.relpath(file_path, args.source_dir)
+            with open(file_path, "rb") as f:
+                files[relative_path.replace(os.sep, "/")] = f.read()
+
+    write_pak(
+        args.path,
+        files,
+        args.compress,
+        version=args.version,
+        compression=args.compression,
+        encrypt_key=args.encrypt_key,
+    )
+    logger.info(f"Wrote {len(files)} entries to {args.path}")
+
+
+if __name__ == "__main__":
+    main()